@@ -4,18 +4,20 @@ from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+from app.db_routing import RoutingSession
 import logging
 import time
 
-db = SQLAlchemy()
+# RoutingSession направляет чтение публичных страниц на реплику (SQLALCHEMY_BINDS['replica'])
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 bcrypt = Bcrypt()
 
 
 @login_manager.user_loader
 def load_users(user_id):
-    from app.models import User
-    return User.query.get(int(user_id))
+    from app.cache import user_cache
+    return user_cache.get(int(user_id))
 
 
 def get_client_ip():
@@ -58,16 +60,56 @@ def create_app():
     )
 
     # Инициализация расширений
+    # Профиль SQLite: пул соединений до создания движка, PRAGMA при подключении
+    from app import sqlite_profile
+    sqlite_profile.configure_engine_options(app)
     db.init_app(app)
+    sqlite_profile.register_pragmas(app)
+
+    # Закрепление за основной базой после записи (при настроенной реплике)
+    from app import db_routing
+    db_routing.init_app(app)
     login_manager.init_app(app)
     bcrypt.init_app(app)
 
+    # Ограничение одновременных операций bcrypt на сервере
+    from app.passwords import password_executor
+    password_executor.init_app(app)
+
+    # Канал инвалидации кэшей между воркерами Gunicorn
+    from app.cache import cache_bus, user_cache
+    cache_bus.init_app(app)
+    user_cache.init_app(app)
+
+    # Кэш отрендеренных публичных страниц
+    from app.http_cache import page_cache
+    page_cache.init_app(app)
+
+    # Серверное хранение корзин
+    from app.cart import cart_store
+    cart_store.init_app(app)
+
+    # Хранилище загруженных файлов (локальная папка или S3)
+    from app.storage import media_storage
+    media_storage.init_app(app)
+
+    # Запись загрузок во временную папку хранилища, долгое кэширование файлов по хешу
+    from app import uploads
+    uploads.init_app(app)
+
+    # Буферизованный счётчик просмотров
+    from app.view_counter import view_counter
+    view_counter.init_app(app)
+
+    # Счётчики дашборда обновляются при каждом flush сессии
+    from app import dashboard_stats  # noqa: F401
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Пожалуйста, войдите в систему для доступа к этой странице'
     login_manager.login_message_category = 'info'
 
     # Настройка логирования
-    from app.logging_config import setup_logging
+    from app.logging_config import setup_logging, bind_request_log_context
     setup_logging(app)
 
     # Регистрацию Blueprint'ов
@@ -84,8 +126,11 @@ def create_app():
     # Middleware для логирования всех запросов
     @app.before_request
     def log_request_start():
-        """Начало запроса - записываем время начала"""
+        """Начало запроса - записываем время начала и контекст для логов"""
         g.start_time = time.time()
+        # Статические файлы не логируются, контекст для них не нужен
+        if not request.path.startswith('/static/'):
+            bind_request_log_context()
     
     @app.after_request
     def log_request_info(response):
@@ -178,17 +223,13 @@ def create_app():
     @app.context_processor
     def inject_global_data():
         """Добавляет глобальные данные во все шаблоны"""
-        from app.models import Content
-
-        # Социальные сети
-        social_instagram = Content.query.filter_by(key='social_instagram').first()
-        social_facebook = Content.query.filter_by(key='social_facebook').first()
-        social_telegram = Content.query.filter_by(key='social_telegram').first()
+        from app.cache import content_cache
 
+        # Социальные сети (из кэша контента, без обращения к БД)
         return {
-            'social_instagram_url': social_instagram.content if social_instagram and social_instagram.content else None,
-            'social_facebook_url': social_facebook.content if social_facebook and social_facebook.content else None,
-            'social_telegram_url': social_telegram.content if social_telegram and social_telegram.content else None,
+            'social_instagram_url': content_cache.get_value('social_instagram'),
+            'social_facebook_url': content_cache.get_value('social_facebook'),
+            'social_telegram_url': content_cache.get_value('social_telegram'),
             'get_client_ip': get_client_ip,  # Функция для получения IP
         }
 
@@ -2,5 +2,5 @@ from flask import Blueprint
 
 admin = Blueprint('admin', __name__)
 
-from app.admin import routes, messages_routes, about_routes, contact_routes
+from app.admin import routes, messages_routes, about_routes, contact_routes, jobs_routes
 
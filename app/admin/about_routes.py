@@ -4,10 +4,11 @@ from flask_login import login_required, current_user
 from app.admin import admin
 from app import db
 from app.models import Content
-from app.utils import admin_required, save_uploaded_file
+from app.cache import cache_bus
+from app.utils import admin_required
+from app.uploads import save_uploaded_file, release_upload
+from app.jobs import enqueue_image_processing
 from datetime import datetime
-import os
-from flask import current_app
 
 @admin.route('/about', methods=['GET', 'POST'])
 @admin_required
@@ -102,16 +103,16 @@ def about_edit():
             if file_key in request.files:
                 file = request.files[file_key]
                 if file and file.filename:
-                    # Удаляем старое изображение, если есть (только если это файл, а не URL)
+                    # Снимаем ссылку на старое изображение (URL пропускается), файл
+                    # удаляется, если на него больше никто не ссылается
                     if img_content and img_content.content:
-                        if isinstance(img_content.content, str) and not img_content.content.startswith('http'):
-                            old_path = os.path.join(current_app.root_path, 'static', 'uploads', img_content.content)
-                            if os.path.exists(old_path):
-                                os.remove(old_path)
+                        release_upload(img_content.content)
 
                     # Сохраняем новое изображение
                     filename = save_uploaded_file(file)
                     if filename:
+                        # Удаление метаданных выполняется воркером (flask run_worker)
+                        enqueue_image_processing(image_file=filename)
                         if img_content:
                             img_content.content = filename
                             img_content.updated_by_id = current_user.id
@@ -155,6 +156,7 @@ def about_edit():
 
         try:
             db.session.commit()
+            cache_bus.publish('content')
             flash('Страница About успешно обновлена', 'success')
             return redirect(url_for('admin.about_edit'))
         except Exception as e:
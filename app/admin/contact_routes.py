@@ -4,6 +4,7 @@ from flask_login import login_required, current_user
 from app.admin import admin
 from app import db
 from app.models import Content
+from app.cache import cache_bus
 from app.utils import admin_required
 from datetime import datetime
 
@@ -89,6 +90,7 @@ def contact_edit():
 
         try:
             db.session.commit()
+            cache_bus.publish('content')
             flash('Страница Contact успешно обновлена', 'success')
             return redirect(url_for('admin.contact_edit'))
         except Exception as e:
@@ -0,0 +1,49 @@
+"""Маршруты для просмотра очереди фоновых задач"""
+from flask import render_template, request, flash, redirect, url_for
+from sqlalchemy import func
+from app.admin import admin
+from app import db
+from app.models import Job, JobStatusEnum, utcnow
+from app.utils import admin_required, manager_required
+from app.pagination import keyset_paginate
+from app.logging_config import get_async_log_stats
+
+
+@admin.route('/jobs')
+@manager_required
+def jobs():
+    """Очередь фоновых задач"""
+    per_page = 50
+    status = request.args.get('status', '')
+
+    query = Job.query
+    if status:
+        try:
+            query = query.filter_by(status=JobStatusEnum(status))
+        except ValueError:
+            status = ''
+
+    pagination = keyset_paginate(query, [Job.id], per_page, descending=True)
+    counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+    return render_template('admin/jobs.html', jobs=pagination.items, pagination=pagination,
+                           counts={item: counts.get(item, 0) for item in JobStatusEnum}, current_status=status,
+                           log_queue=get_async_log_stats())
+
+
+@admin.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@admin_required
+def job_retry(job_id):
+    """Повторный запуск задачи, завершившейся ошибкой"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != JobStatusEnum.FAILED:
+        flash('Повторить можно только задачу с ошибкой', 'error')
+        return redirect(url_for('admin.jobs'))
+
+    job.status = JobStatusEnum.PENDING
+    job.attempts = 0
+    job.run_after = utcnow()
+    job.finished_at = None
+    db.session.commit()
+    flash(f'Задача #{job.id} поставлена в очередь повторно', 'success')
+    return redirect(url_for('admin.jobs', status='failed'))
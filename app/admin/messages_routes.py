@@ -1,10 +1,13 @@
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from app.admin import admin
 from app import db
 from app.models import ContactMessage, HeroSlide
 from app.utils import admin_required, manager_required
-import os
+from app.cache import cache_bus
+from app.pagination import keyset_paginate
+from app.jobs import enqueue_image_processing
+from app.uploads import release_upload
 
 
 # Управление обращениями
@@ -12,7 +15,6 @@ import os
 @manager_required
 def messages():
     """Список обращений"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     filter_unread = request.args.get('unread', 'false') == 'true'
 
@@ -20,8 +22,7 @@ def messages():
     if filter_unread:
         query = query.filter_by(is_read=False)
 
-    pagination = query.order_by(ContactMessage.created_at.desc()).paginate(page=page, per_page=per_page,
-                                                                           error_out=False)
+    pagination = keyset_paginate(query, [ContactMessage.created_at, ContactMessage.id], per_page, descending=True)
     messages_list = pagination.items
 
     return render_template('admin/messages.html', messages=messages_list, pagination=pagination,
@@ -86,7 +87,7 @@ def hero_slide_new():
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
+                from app.uploads import save_uploaded_file
                 image_file = save_uploaded_file(file)
 
         slide = HeroSlide(
@@ -102,7 +103,12 @@ def hero_slide_new():
 
         try:
             db.session.add(slide)
+            if slide.image_file:
+                # Обработка изображения выполняется воркером (flask run_worker)
+                db.session.flush()
+                enqueue_image_processing(slide)
             db.session.commit()
+            cache_bus.publish('hero_slide')
             flash('Слайд успешно создан', 'success')
             return redirect(url_for('admin.hero_slides'))
         except Exception as e:
@@ -127,17 +133,15 @@ def hero_slide_edit(slide_id):
         slide.link_text = request.form.get('link_text', '').strip()
 
         # Обработка загрузки нового файла
+        image_replaced = False
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
-                # Удаляем старый файл, если есть
-                if slide.image_file:
-                    old_path = os.path.join(current_app.root_path, 'static', 'uploads', slide.image_file)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                slide.image_file = save_uploaded_file(file)
-                slide.image_url = None  # Очищаем URL, если загружен файл
+                from app.images import replace_image
+                # Старый файл и его варианты удаляются
+                image_replaced = replace_image(slide, file)
+                if image_replaced:
+                    slide.image_url = None  # Очищаем URL, если загружен файл
 
         # Если указан URL и нет файла, используем URL
         image_url = request.form.get('image_url', '').strip()
@@ -145,7 +149,10 @@ def hero_slide_edit(slide_id):
             slide.image_url = image_url
 
         try:
+            if image_replaced:
+                enqueue_image_processing(slide)
             db.session.commit()
+            cache_bus.publish('hero_slide')
             flash('Слайд успешно обновлен', 'success')
             return redirect(url_for('admin.hero_slides'))
         except Exception as e:
@@ -162,14 +169,11 @@ def hero_slide_delete(slide_id):
     slide = HeroSlide.query.get_or_404(slide_id)
 
     try:
-        # Удаляем файл, если есть
-        if slide.image_file:
-            file_path = os.path.join(current_app.root_path, 'static', 'uploads', slide.image_file)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
+        # Файл и его варианты удаляются, если на них больше никто не ссылается
+        release_upload(slide.image_file)
         db.session.delete(slide)
         db.session.commit()
+        cache_bus.publish('hero_slide')
         flash('Слайд успешно удален', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1,15 +1,21 @@
-import os
 import re
 import logging
 from datetime import datetime
 
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for
 from flask_login import current_user
+from sqlalchemy.orm import joinedload, selectinload
 
 from app import db, get_client_ip
 from app.admin import admin
-from app.models import User, Product, Category, Order, BlogPost, Content, ContactMessage, RoleEnum, OrderStatusEnum
+from app.models import User, Product, Category, Order, OrderItem, BlogPost, Content, RoleEnum, OrderStatusEnum
 from app.utils import admin_required, manager_required
+from app.cache import cache_bus
+from app import search, related
+from app.dashboard_stats import get_dashboard_stats
+from app.pagination import keyset_paginate
+from app.jobs import enqueue_image_processing
+from app.uploads import release_upload
 
 
 def slugify(text):
@@ -24,17 +30,23 @@ def slugify(text):
 @manager_required
 def dashboard():
     """Главная страница админ-панели"""
+    # Счётчики читаются одной строкой из таблицы dashboard_stats
+    counters = get_dashboard_stats()
     stats = {
-        'users_count': User.query.count() if current_user.role == RoleEnum.ADMIN else None,
-        'products_count': Product.query.count(),
-        'orders_count': Order.query.count(),
-        'orders_pending': Order.query.filter_by(status=OrderStatusEnum.PENDING).count(),
-        'blog_posts_count': BlogPost.query.count(),
-        'content_items': Content.query.count() if current_user.role == RoleEnum.ADMIN else None,
-        'messages_unread': ContactMessage.query.filter_by(is_read=False).count()
+        'users_count': counters.users_count if current_user.role == RoleEnum.ADMIN else None,
+        'products_count': counters.products_count,
+        'orders_count': counters.orders_count,
+        'orders_pending': counters.orders_pending,
+        'blog_posts_count': counters.blog_posts_count,
+        'content_items': counters.content_items if current_user.role == RoleEnum.ADMIN else None,
+        'messages_unread': counters.messages_unread
     }
 
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+    recent_orders = (Order.query
+                     .options(joinedload(Order.user))
+                     .order_by(Order.created_at.desc())
+                     .limit(10)
+                     .all())
 
     return render_template('admin/dashboard.html', stats=stats, recent_orders=recent_orders)
 
@@ -44,10 +56,9 @@ def dashboard():
 @admin_required
 def users():
     """Список пользователей"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
 
-    pagination = User.query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(User.query, [User.id], per_page)
     users_list = pagination.items
 
     return render_template('admin/users.html', users=users_list, pagination=pagination)
@@ -74,6 +85,7 @@ def edit_user(user_id):
 
         try:
             db.session.commit()
+            cache_bus.publish('user')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"User updated: {user.username}",
@@ -131,6 +143,7 @@ def delete_user(user_id):
         deleted_user_id = user.id
         db.session.delete(user)
         db.session.commit()
+        cache_bus.publish('user')
         actions_logger = logging.getLogger('app.actions')
         actions_logger.info(
             f"User deleted: {deleted_username}",
@@ -215,6 +228,7 @@ def content_new():
         try:
             db.session.add(content)
             db.session.commit()
+            cache_bus.publish('content')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Content created: {key}",
@@ -269,6 +283,7 @@ def content_edit(content_id):
 
         try:
             db.session.commit()
+            cache_bus.publish('content')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Content updated: {content.key}",
@@ -318,6 +333,7 @@ def content_delete(content_id):
         content_key = content.key
         db.session.delete(content)
         db.session.commit()
+        cache_bus.publish('content')
         actions_logger = logging.getLogger('app.actions')
         actions_logger.info(
             f"Content deleted: {content_key}",
@@ -383,6 +399,7 @@ def category_new():
         try:
             db.session.add(category)
             db.session.commit()
+            cache_bus.publish('category')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Category created: {name}",
@@ -434,6 +451,7 @@ def category_edit(category_id):
 
         try:
             db.session.commit()
+            cache_bus.publish('category')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Category updated: {category.name}",
@@ -478,10 +496,9 @@ def category_edit(category_id):
 @manager_required
 def products():
     """Список товаров"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
 
-    pagination = Product.query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(Product.query, [Product.id], per_page)
     products_list = pagination.items
 
     return render_template('admin/products.html', products=products_list, pagination=pagination)
@@ -509,7 +526,7 @@ def product_new():
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
+                from app.uploads import save_uploaded_file
                 image_file = save_uploaded_file(file)
                 image_url = None  # Очищаем URL, если загружен файл
 
@@ -534,7 +551,14 @@ def product_new():
 
         try:
             db.session.add(product)
+            if product.image_file:
+                # Обработка изображения выполняется воркером (flask run_worker)
+                db.session.flush()
+                enqueue_image_processing(product)
+            search.index_product(product)
+            related.refresh_categories(product.category_id)
             db.session.commit()
+            cache_bus.publish('product')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Product created: {name}",
@@ -583,6 +607,7 @@ def product_edit(product_id):
     categories = Category.query.all()
 
     if request.method == 'POST':
+        old_category_id = product.category_id
         product.name = request.form.get('name')
         product.slug = request.form.get('slug') or slugify(product.name)
         product.description = request.form.get('description')
@@ -593,17 +618,15 @@ def product_edit(product_id):
         product.is_active = request.form.get('is_active') == 'on'
 
         # Обработка загрузки изображения
+        image_replaced = False
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
-                # Удаляем старый файл, если есть
-                if hasattr(product, 'image_file') and product.image_file:
-                    old_path = os.path.join(current_app.root_path, 'static', 'uploads', product.image_file)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                product.image_file = save_uploaded_file(file)
-                product.image_url = None  # Очищаем URL, если загружен файл
+                from app.images import replace_image
+                # Старый файл и его варианты удаляются
+                image_replaced = replace_image(product, file)
+                if image_replaced:
+                    product.image_url = None  # Очищаем URL, если загружен файл
 
         # Если указан URL и нет файла, используем URL
         image_url = request.form.get('image_url', '').strip()
@@ -611,7 +634,12 @@ def product_edit(product_id):
             product.image_url = image_url
 
         try:
+            if image_replaced:
+                enqueue_image_processing(product)
+            search.index_product(product)
+            related.refresh_categories(old_category_id, product.category_id)
             db.session.commit()
+            cache_bus.publish('product')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Product updated: {product.name}",
@@ -662,8 +690,14 @@ def product_delete(product_id):
     try:
         product_name = product.name
         product_id_val = product.id
+        category_id = product.category_id
+        search.remove_product(product.id)
+        related.remove_product(product.id)
+        release_upload(product.image_file)
         db.session.delete(product)
+        related.refresh_categories(category_id)
         db.session.commit()
+        cache_bus.publish('product')
         actions_logger = logging.getLogger('app.actions')
         actions_logger.info(
             f"Product deleted: {product_name}",
@@ -707,15 +741,14 @@ def product_delete(product_id):
 @manager_required
 def orders():
     """Список заказов"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     status_filter = request.args.get('status')
 
-    query = Order.query
+    query = Order.query.options(joinedload(Order.user))
     if status_filter:
         query = query.filter_by(status=OrderStatusEnum(status_filter))
 
-    pagination = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(query, [Order.created_at, Order.id], per_page, descending=True)
     orders_list = pagination.items
 
     return render_template('admin/orders.html', orders=orders_list, pagination=pagination, status_filter=status_filter)
@@ -725,7 +758,11 @@ def orders():
 @manager_required
 def order_detail(order_id):
     """Детали заказа"""
-    order = Order.query.get_or_404(order_id)
+    order = (Order.query
+             .options(joinedload(Order.user),
+                      selectinload(Order.items).joinedload(OrderItem.product))
+             .filter_by(id=order_id)
+             .first_or_404())
     return render_template('admin/order_detail.html', order=order)
 
 
@@ -786,11 +823,10 @@ def order_update_status(order_id):
 @manager_required
 def blog_posts():
     """Список статей блога"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
 
-    pagination = BlogPost.query.order_by(BlogPost.created_at.desc()).paginate(page=page, per_page=per_page,
-                                                                              error_out=False)
+    pagination = keyset_paginate(BlogPost.query.options(joinedload(BlogPost.author)),
+                                 [BlogPost.created_at, BlogPost.id], per_page, descending=True)
     posts = pagination.items
 
     return render_template('admin/blog_posts.html', posts=posts, pagination=pagination)
@@ -813,7 +849,7 @@ def blog_post_new():
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
+                from app.uploads import save_uploaded_file
                 image_file = save_uploaded_file(file)
                 image_url = None  # Очищаем URL, если загружен файл
 
@@ -839,7 +875,13 @@ def blog_post_new():
 
         try:
             db.session.add(post)
+            db.session.flush()
+            if post.image_file:
+                # Обработка изображения выполняется воркером (flask run_worker)
+                enqueue_image_processing(post)
+            related.refresh_posts([post.id])
             db.session.commit()
+            cache_bus.publish('blog_post')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Blog post created: {title}",
@@ -894,17 +936,15 @@ def blog_post_edit(post_id):
         post.is_published = request.form.get('is_published') == 'on'
 
         # Обработка загрузки изображения
+        image_replaced = False
         if 'image_file' in request.files:
             file = request.files['image_file']
             if file and file.filename:
-                from app.utils import save_uploaded_file
-                # Удаляем старый файл, если есть
-                if post.image_file:
-                    old_path = os.path.join(current_app.root_path, 'static', 'uploads', post.image_file)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                post.image_file = save_uploaded_file(file)
-                post.image_url = None  # Очищаем URL, если загружен файл
+                from app.images import replace_image
+                # Старый файл и его варианты удаляются
+                image_replaced = replace_image(post, file)
+                if image_replaced:
+                    post.image_url = None  # Очищаем URL, если загружен файл
 
         # Если указан URL и нет файла, используем URL
         image_url = request.form.get('image_url', '').strip()
@@ -915,7 +955,11 @@ def blog_post_edit(post_id):
             post.published_at = datetime.utcnow()
 
         try:
+            if image_replaced:
+                enqueue_image_processing(post)
+            related.refresh_posts([post.id])
             db.session.commit()
+            cache_bus.publish('blog_post')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"Blog post updated: {post.title}",
@@ -967,8 +1011,11 @@ def blog_post_delete(post_id):
     try:
         post_title = post.title
         post_id_val = post.id
+        release_upload(post.image_file)
         db.session.delete(post)
+        related.refresh_posts([post_id_val])
         db.session.commit()
+        cache_bus.publish('blog_post')
         actions_logger = logging.getLogger('app.actions')
         actions_logger.info(
             f"Blog post deleted: {post_title}",
@@ -3,11 +3,53 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import db, bcrypt, get_client_ip
 from app.models import User, RoleEnum
 from app.utils import admin_required
+from app.passwords import PasswordHasherBusy, needs_rehash
 import logging
 
 auth = Blueprint('auth', __name__)
 
 
+def _log_password_hasher_busy(auth_logger, action, username):
+    auth_logger.warning(
+        f"Password hashing slots are busy: {username}",
+        extra={
+            'action': action,
+            'status': 'rejected',
+            'reason': 'password_hasher_busy',
+            'username': username,
+            'ip_address': get_client_ip()
+        }
+    )
+
+
+def _rehash_password(user, password, auth_logger):
+    """Пересчитывает хеш пароля с текущей стоимостью BCRYPT_LOG_ROUNDS"""
+    try:
+        user.set_password(password)
+        db.session.commit()
+        auth_logger.info(
+            f"Password rehashed: {user.username}",
+            extra={
+                'action': 'password_rehash',
+                'status': 'success',
+                'user_id': user.id,
+                'username': user.username
+            }
+        )
+    except Exception as e:
+        # Вход не должен срываться из-за пересчёта хеша
+        db.session.rollback()
+        auth_logger.warning(
+            f"Password rehash failed: {str(e)}",
+            extra={
+                'action': 'password_rehash',
+                'status': 'error',
+                'user_id': user.id,
+                'username': user.username
+            }
+        )
+
+
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -24,7 +66,14 @@ def login():
         user = User.query.filter_by(username=username).first()
         auth_logger = logging.getLogger('app.auth')
 
-        if user and user.check_password(password):
+        try:
+            password_valid = user is not None and user.check_password(password)
+        except PasswordHasherBusy:
+            _log_password_hasher_busy(auth_logger, 'login_attempt', username)
+            flash('Сервер перегружен, попробуйте войти через несколько секунд', 'error')
+            return render_template('auth/login.html'), 503
+
+        if password_valid:
             if not user.is_active:
                 # Логируем попытку входа в деактивированный аккаунт
                 auth_logger.warning(
@@ -42,6 +91,10 @@ def login():
                 flash('Ваш аккаунт деактивирован', 'error')
                 return render_template('auth/login.html')
 
+            # Хеш со старой стоимостью пересчитывается прозрачно для пользователя
+            if needs_rehash(user.password_hash):
+                _rehash_password(user, password, auth_logger)
+
             login_user(user, remember=request.form.get('remember'))
             next_page = request.args.get('next')
 
@@ -151,7 +204,12 @@ def register():
             phone=phone,
             role=RoleEnum.USER
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            _log_password_hasher_busy(logging.getLogger('app.auth'), 'user_register', username)
+            flash('Сервер перегружен, попробуйте зарегистрироваться через несколько секунд', 'error')
+            return render_template('auth/register.html'), 503
 
         try:
             db.session.add(user)
@@ -0,0 +1,327 @@
+"""
+Кэши данных в памяти процесса (воркера).
+Каждый воркер Gunicorn держит собственную копию данных, поэтому изменения
+из админки рассылаются всем воркерам через общий файл с поколениями (cache_bus).
+"""
+import os
+import mmap
+import struct
+import time
+import threading
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+from flask import g
+
+from app import db
+
+
+# Неизменяемый снимок записи Content (атрибуты совпадают с моделью,
+# поэтому шаблоны могут использовать его вместо ORM объекта)
+ContentEntry = namedtuple('ContentEntry', ['key', 'title', 'content', 'content_type', 'section', 'updated_at'])
+
+
+class ContentCache:
+    """
+    Кэш пар ключ/значение модели Content.
+    Все ключи загружаются одним запросом при первом обращении
+    и отдаются из памяти до вызова invalidate().
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Загружает все записи Content одним запросом"""
+        from app.models import Content
+        from app.db_routing import primary_only
+
+        # Кэш живёт до следующей инвалидации: данные с отстающей реплики остались бы в нём надолго
+        with primary_only():
+            rows = db.session.query(
+                Content.key,
+                Content.title,
+                Content.content,
+                Content.content_type,
+                Content.section,
+                Content.updated_at
+            ).all()
+        return {row.key: ContentEntry(*row) for row in rows}
+
+    def _get_entries(self):
+        entries = self._entries
+        if entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+                entries = self._entries
+        return entries
+
+    def get(self, key):
+        """Возвращает снимок записи по ключу или None"""
+        return self._get_entries().get(key)
+
+    def get_value(self, key, default=None):
+        """Возвращает поле content записи, если оно не пустое"""
+        entry = self.get(key)
+        if entry and entry.content:
+            return entry.content
+        return default
+
+    def get_many(self, *keys):
+        """Возвращает словарь {ключ: снимок или None} для перечисленных ключей"""
+        entries = self._get_entries()
+        return {key: entries.get(key) for key in keys}
+
+    def version(self):
+        """Количество записей и максимальное updated_at (для ETag страниц)"""
+        entries = self._get_entries()
+        timestamps = [entry.updated_at for entry in entries.values() if entry.updated_at]
+        return len(entries), max(timestamps, default=None)
+
+    def invalidate(self):
+        """Сбрасывает кэш; следующее обращение перечитает данные из БД"""
+        with self._lock:
+            self._entries = None
+
+
+class UserSnapshot(namedtuple('UserSnapshot', ['id', 'username', 'role', 'is_active'])):
+    """
+    Неизменяемый снимок пользователя для current_user.
+    Поля снимка и проверки ролей не требуют запроса к БД; остальные атрибуты
+    (email, phone, set_password, ...) берутся из ORM объекта, который
+    загружается один раз за запрос при первом обращении к ним.
+    """
+
+    __slots__ = ()
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def get_id(self):
+        return str(self.id)
+
+    def is_admin(self):
+        from app.models import RoleEnum
+        return self.role == RoleEnum.ADMIN
+
+    def is_manager(self):
+        from app.models import RoleEnum
+        return self.role == RoleEnum.MANAGER
+
+    def can_manage_content(self):
+        from app.models import RoleEnum
+        return self.role in [RoleEnum.ADMIN, RoleEnum.MANAGER]
+
+    def get_user(self):
+        """ORM объект пользователя (для изменения профиля и редких полей)"""
+        user = g.get('current_user_model')
+        if user is None or user.id != self.id:
+            from app.models import User
+            user = db.session.get(User, self.id)
+            g.current_user_model = user
+        return user
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        user = self.get_user()
+        if user is None:
+            raise AttributeError(name)
+        return getattr(user, name)
+
+
+class UserCache:
+    """
+    Кэш снимков пользователей для user_loader Flask-Login.
+    Запись живёт USER_CACHE_TTL секунд; изменения пользователей
+    сбрасывают кэш во всех воркерах через cache_bus ('user').
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.ttl = 60
+        self.max_size = 10000
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('USER_CACHE_MAX_SIZE', self.max_size)
+
+    def _load(self, user_id):
+        from app.models import User
+
+        from app.db_routing import primary_only
+
+        # Роль и блокировка пользователя читаются без отставания реплики
+        with primary_only():
+            row = db.session.query(User.id, User.username, User.role, User.is_active).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        return UserSnapshot(row.id, row.username, row.role, bool(row.is_active))
+
+    def _store(self, user_id, snapshot, now):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Сначала удаляем устаревшие записи, затем самые старые
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+                while len(self._entries) >= self.max_size:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[user_id] = (snapshot, now + self.ttl)
+
+    def get(self, user_id):
+        """Возвращает снимок пользователя или None, если пользователь не найден"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        snapshot = self._load(user_id)
+        if snapshot is None or self.ttl <= 0:
+            return snapshot
+        self._store(user_id, snapshot, now)
+        return snapshot
+
+    def invalidate(self):
+        """Сбрасывает кэш; следующее обращение перечитает пользователей из БД"""
+        with self._lock:
+            self._entries = {}
+
+
+class InvalidationBus:
+    """
+    Канал инвалидации кэшей между воркерами.
+
+    В общем файле, отображённом в память (mmap), хранится счётчик поколения
+    для каждого пространства имён. Админка увеличивает счётчик после commit,
+    а каждый воркер в before_request сравнивает счётчики со своими
+    и вызывает подписчиков для изменившихся пространств имён.
+    Последний слот файла - случайная эпоха, записанная при создании файла:
+    пересозданный файл начинает счёт поколений заново (generation).
+    """
+
+    NAMESPACES = ('content', 'category', 'hero_slide', 'product', 'user', 'blog_post')
+    _SLOT = struct.Struct('<Q')
+
+    def __init__(self):
+        self._path = None
+        self._pid = None
+        self._fd = None
+        self._mmap = None
+        self._seen = {}
+        self._epoch = None
+        self._subscribers = {name: [] for name in self.NAMESPACES}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Определяет путь к файлу канала и регистрирует проверку поколений"""
+        path = app.config.get('CACHE_BUS_FILE')
+        if not path:
+            path = os.path.join(app.instance_path, 'cache_bus.bin')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._path = path
+        self._pid = None
+        app.before_request(self.poll)
+
+    def subscribe(self, namespace, callback):
+        """Регистрирует функцию сброса кэша для пространства имён"""
+        self._subscribers[namespace].append(callback)
+
+    def _open(self):
+        """
+        Открывает файл в текущем процессе.
+        Дескриптор не наследуется от мастера Gunicorn: блокировка flock
+        действует на открытый файл, и общий дескриптор не защищал бы воркеры друг от друга.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+        size = self._SLOT.size * (len(self.NAMESPACES) + 1)
+        epoch_offset = self._SLOT.size * len(self.NAMESPACES)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock_file(fd)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+            self._epoch = self._SLOT.unpack_from(self._mmap, epoch_offset)[0]
+            if not self._epoch:
+                self._epoch = int.from_bytes(os.urandom(self._SLOT.size), 'little') or 1
+                self._SLOT.pack_into(self._mmap, epoch_offset, self._epoch)
+        finally:
+            self._unlock_file(fd)
+        self._fd = fd
+        self._pid = os.getpid()
+        self._seen = self._read_all()
+
+    def _ensure_open(self):
+        if self._pid != os.getpid():
+            self._open()
+
+    @staticmethod
+    def _lock_file(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock_file(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _read_all(self):
+        return {
+            name: self._SLOT.unpack_from(self._mmap, index * self._SLOT.size)[0]
+            for index, name in enumerate(self.NAMESPACES)
+        }
+
+    def _notify(self, namespace):
+        for callback in self._subscribers[namespace]:
+            callback()
+
+    def publish(self, *namespaces):
+        """Увеличивает поколения и сразу сбрасывает кэши текущего воркера"""
+        with self._lock:
+            self._ensure_open()
+            self._lock_file(self._fd)
+            try:
+                for namespace in namespaces:
+                    offset = self.NAMESPACES.index(namespace) * self._SLOT.size
+                    generation = self._SLOT.unpack_from(self._mmap, offset)[0] + 1
+                    self._SLOT.pack_into(self._mmap, offset, generation)
+                    self._seen[namespace] = generation
+            finally:
+                self._unlock_file(self._fd)
+        for namespace in namespaces:
+            self._notify(namespace)
+
+    def generation(self, namespace):
+        """
+        Эпоха файла и текущее поколение пространства имён - версия данных
+        без запроса к БД (ETag публичных страниц, app/http_cache.py)
+        """
+        with self._lock:
+            self._ensure_open()
+            offset = self.NAMESPACES.index(namespace) * self._SLOT.size
+            return self._epoch, self._SLOT.unpack_from(self._mmap, offset)[0]
+
+    def poll(self):
+        """Сбрасывает кэши, поколения которых изменились в других воркерах"""
+        with self._lock:
+            self._ensure_open()
+            current = self._read_all()
+            changed = [name for name, generation in current.items() if self._seen.get(name) != generation]
+            self._seen = current
+        for namespace in changed:
+            self._notify(namespace)
+
+
+content_cache = ContentCache()
+user_cache = UserCache()
+cache_bus = InvalidationBus()
+cache_bus.subscribe('content', content_cache.invalidate)
+cache_bus.subscribe('user', user_cache.invalidate)
@@ -0,0 +1,149 @@
+"""
+Хранилище корзин на сервере.
+
+Корзина привязана к пользователю (все маршруты корзины требуют входа),
+поэтому cookie сессии содержит только идентификатор пользователя Flask-Login.
+Корзина - упорядоченный словарь {product_id: количество}.
+
+Backend выбирается настройкой CART_BACKEND:
+- database - таблица cart_items, уникальный ключ (user_id, product_id);
+- memory - словарь в памяти процесса (для разработки и проверок: данные
+  не общие для воркеров Gunicorn и теряются при перезапуске).
+"""
+import threading
+
+from flask import session
+from flask_login import current_user
+from sqlalchemy import delete, update
+
+from app import db
+from app.models import CartItem
+from app.utils import insert_or_increment
+
+
+class MemoryCartBackend:
+    """Корзины в памяти процесса"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return dict(self._carts.get(user_id, {}))
+
+    def add(self, user_id, product_id, quantity):
+        with self._lock:
+            cart = self._carts.setdefault(user_id, {})
+            cart[product_id] = cart.get(product_id, 0) + quantity
+
+    def set(self, user_id, product_id, quantity):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is not None and product_id in cart:
+                cart[product_id] = quantity
+
+    def remove(self, user_id, product_id):
+        with self._lock:
+            self._carts.get(user_id, {}).pop(product_id, None)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+
+class DatabaseCartBackend:
+    """Корзины в таблице cart_items; каждая операция - отдельная транзакция"""
+
+    name = 'database'
+    table = CartItem.__table__
+
+    def get(self, user_id):
+        table = self.table
+        rows = db.session.execute(
+            table.select()
+            .with_only_columns(table.c.product_id, table.c.quantity)
+            .where(table.c.user_id == user_id)
+            .order_by(table.c.id)
+        )
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def add(self, user_id, product_id, quantity):
+        # Одним запросом: повторная отправка формы или вторая вкладка не нарушают уникальный ключ
+        insert_or_increment(self.table, {'user_id': user_id, 'product_id': product_id}, 'quantity', quantity)
+        db.session.commit()
+
+    def set(self, user_id, product_id, quantity):
+        table = self.table
+        db.session.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.product_id == product_id)
+            .values(quantity=quantity)
+        )
+        db.session.commit()
+
+    def remove(self, user_id, product_id):
+        table = self.table
+        db.session.execute(delete(table).where(table.c.user_id == user_id, table.c.product_id == product_id))
+        db.session.commit()
+
+    def clear(self, user_id):
+        table = self.table
+        db.session.execute(delete(table).where(table.c.user_id == user_id))
+        db.session.commit()
+
+
+CART_BACKENDS = {
+    DatabaseCartBackend.name: DatabaseCartBackend,
+    MemoryCartBackend.name: MemoryCartBackend,
+}
+
+
+class CartStore:
+    """Корзина текущего пользователя поверх выбранного backend"""
+
+    def __init__(self):
+        self.backend = DatabaseCartBackend()
+
+    def init_app(self, app):
+        name = app.config.get('CART_BACKEND', DatabaseCartBackend.name)
+        if name not in CART_BACKENDS:
+            raise ValueError(f'Unknown CART_BACKEND: {name}')
+        self.backend = CART_BACKENDS[name]()
+        app.before_request(self._import_session_cart)
+
+    def _import_session_cart(self):
+        """Переносит корзину из cookie сессии (до перехода на серверное хранение)"""
+        if 'cart' not in session:
+            return
+        items = session.pop('cart') or []
+        if not current_user.is_authenticated:
+            return
+        for item in items:
+            try:
+                self.backend.add(current_user.id, int(item['product_id']), int(item['quantity']))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    def get(self):
+        """Корзина пользователя: {product_id: количество} в порядке добавления"""
+        return self.backend.get(current_user.id)
+
+    def add(self, product_id, quantity):
+        """Добавляет количество к позиции (создаёт позицию при необходимости)"""
+        self.backend.add(current_user.id, product_id, quantity)
+
+    def set(self, product_id, quantity):
+        """Устанавливает количество существующей позиции"""
+        self.backend.set(current_user.id, product_id, quantity)
+
+    def remove(self, product_id):
+        self.backend.remove(current_user.id, product_id)
+
+    def clear(self):
+        self.backend.clear(current_user.id)
+
+
+cart_store = CartStore()
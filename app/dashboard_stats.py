@@ -0,0 +1,134 @@
+"""
+Материализованные счётчики дашборда админки.
+
+Счётчики в таблице dashboard_stats обновляются в той же транзакции,
+что и изменения данных: обработчик before_flush сессии считает
+добавленные, удалённые и изменившие статус объекты и выполняет
+UPDATE dashboard_stats SET <счётчик> = <счётчик> + delta.
+Команда reconcile_dashboard_stats пересчитывает счётчики по данным.
+"""
+from collections import Counter
+
+from sqlalchemy import event, inspect, update, func
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (User, Product, Order, BlogPost, Content, ContactMessage,
+                        DashboardStats, OrderStatusEnum)
+
+STATS_ID = 1
+
+# Модели, для которых считается общее количество строк
+TOTAL_COUNTERS = {
+    User: 'users_count',
+    Product: 'products_count',
+    Order: 'orders_count',
+    BlogPost: 'blog_posts_count',
+    Content: 'content_items',
+}
+
+
+def _is_pending(status):
+    # Статус по умолчанию (PENDING) подставляется только при INSERT
+    return status is None or status == OrderStatusEnum.PENDING
+
+
+def _is_unread(is_read):
+    return not is_read
+
+
+# Счётчики по условию: модель -> (атрибут, счётчик, условие)
+CONDITIONAL_COUNTERS = {
+    Order: ('status', 'orders_pending', _is_pending),
+    ContactMessage: ('is_read', 'messages_unread', _is_unread),
+}
+
+
+def _old_value(obj, attribute):
+    """Значение атрибута до изменений в текущей сессии"""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attribute)
+
+
+def _collect_deltas(session):
+    deltas = Counter()
+
+    for obj in session.new:
+        model = type(obj)
+        if model in TOTAL_COUNTERS:
+            deltas[TOTAL_COUNTERS[model]] += 1
+        if model in CONDITIONAL_COUNTERS:
+            attribute, counter, condition = CONDITIONAL_COUNTERS[model]
+            if condition(getattr(obj, attribute)):
+                deltas[counter] += 1
+
+    for obj in session.deleted:
+        model = type(obj)
+        if model in TOTAL_COUNTERS:
+            deltas[TOTAL_COUNTERS[model]] -= 1
+        if model in CONDITIONAL_COUNTERS:
+            attribute, counter, condition = CONDITIONAL_COUNTERS[model]
+            if condition(_old_value(obj, attribute)):
+                deltas[counter] -= 1
+
+    for obj in session.dirty:
+        model = type(obj)
+        if model not in CONDITIONAL_COUNTERS:
+            continue
+        attribute, counter, condition = CONDITIONAL_COUNTERS[model]
+        history = inspect(obj).attrs[attribute].history
+        if not history.has_changes():
+            continue
+        was_counted = condition(_old_value(obj, attribute))
+        is_counted = condition(getattr(obj, attribute))
+        if was_counted != is_counted:
+            deltas[counter] += 1 if is_counted else -1
+
+    return {counter: delta for counter, delta in deltas.items() if delta}
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_dashboard_stats(session, flush_context, instances):
+    deltas = _collect_deltas(session)
+    if not deltas:
+        return
+    table = DashboardStats.__table__
+    # Выполняем через соединение сессии: та же транзакция, без повторного flush
+    session.connection().execute(
+        update(table)
+        .where(table.c.id == STATS_ID)
+        .values({counter: table.c[counter] + delta for counter, delta in deltas.items()})
+    )
+
+
+def reconcile_dashboard_stats():
+    """Пересчитывает счётчики по фактическим данным и исправляет расхождения"""
+    stats = db.session.get(DashboardStats, STATS_ID)
+    if stats is None:
+        stats = DashboardStats(id=STATS_ID)
+        db.session.add(stats)
+
+    stats.users_count = db.session.query(func.count(User.id)).scalar()
+    stats.products_count = db.session.query(func.count(Product.id)).scalar()
+    stats.orders_count = db.session.query(func.count(Order.id)).scalar()
+    stats.orders_pending = db.session.query(func.count(Order.id)).filter(
+        Order.status == OrderStatusEnum.PENDING).scalar()
+    stats.blog_posts_count = db.session.query(func.count(BlogPost.id)).scalar()
+    stats.content_items = db.session.query(func.count(Content.id)).scalar()
+    stats.messages_unread = db.session.query(func.count(ContactMessage.id)).filter(
+        ContactMessage.is_read == False).scalar()
+
+    db.session.commit()
+    return stats
+
+
+def get_dashboard_stats():
+    """Счётчики дашборда одной строкой; при отсутствии строки она создаётся"""
+    stats = db.session.get(DashboardStats, STATS_ID)
+    if stats is None:
+        stats = reconcile_dashboard_stats()
+    return stats
@@ -0,0 +1,114 @@
+"""
+Маршрутизация запросов между основной базой и репликой для чтения.
+
+Реплика подключается через SQLALCHEMY_BINDS с ключом 'replica'
+(переменная окружения DATABASE_REPLICA_URL). Без неё все запросы идут
+в основную базу, и декоратор read_replica ничего не меняет.
+
+- Публичные страницы только для чтения помечаются декоратором @read_replica:
+  их SELECT выполняются на реплике.
+- Запись (flush, INSERT/UPDATE/DELETE) всегда идёт в основную базу.
+- После запроса с изменением данных (не GET/HEAD) посетитель на
+  REPLICA_STICKY_SECONDS секунд закрепляется за основной базой, чтобы
+  сразу увидеть свои изменения, несмотря на отставание реплики.
+- Участки, которым нужны свежие данные (кэши пользователей и контента:
+  они заполняются до следующей инвалидации), оборачиваются в primary_only().
+
+Для локальной проверки реплика SQLite обновляется из основной базы
+командой flask replicate_db (копирование через sqlite3 backup API).
+"""
+import time
+import sqlite3
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request, session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+# Ключ сессии: время (unix), до которого посетитель читает из основной базы
+STICKY_SESSION_KEY = '_db_primary_until'
+
+
+def _replica_requested():
+    return has_request_context() and g.get('_db_use_replica', False)
+
+
+class RoutingSession(Session):
+    """Сессия, направляющая чтение в помеченных представлениях на реплику"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and _replica_requested()):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view):
+    """Декоратор публичной страницы только для чтения: SELECT выполняются на реплике"""
+
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return view(*args, **kwargs)
+        g._db_use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g._db_use_replica = False
+
+    return decorated_function
+
+
+@contextmanager
+def primary_only():
+    """Запросы внутри блока выполняются на основной базе"""
+    previous = g.get('_db_use_replica', False) if has_request_context() else False
+    if previous:
+        g._db_use_replica = False
+    try:
+        yield
+    finally:
+        if previous:
+            g._db_use_replica = True
+
+
+def init_app(app):
+    """Закрепление за основной базой после изменяющих запросов"""
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and not request.path.startswith('/static/'):
+            session[STICKY_SESSION_KEY] = int(time.time()) + sticky_seconds
+        return response
+
+
+def replicate(db):
+    """
+    Копирует основную базу SQLite в реплику (замена репликации СУБД
+    для локальной проверки). Возвращает время копирования в секундах.
+    """
+    primary = db.engines[None]
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        raise RuntimeError('Реплика не настроена: задайте DATABASE_REPLICA_URL')
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise RuntimeError('replicate_db поддерживает только SQLite; для других СУБД используйте их репликацию')
+
+    started = time.perf_counter()
+    source = sqlite3.connect(primary.url.database)
+    target = sqlite3.connect(replica.url.database, timeout=30)
+    try:
+        # backup копирует согласованный снимок, читатели реплики ждут по busy_timeout
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return time.perf_counter() - started
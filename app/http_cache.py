@@ -0,0 +1,275 @@
+"""
+HTTP кэширование публичных страниц (условные GET запросы).
+
+Версия страницы (PageVersion) собирается до рендеринга шаблона из поколений
+cache_bus (каждое изменение данных в админке и при оформлении заказа
+публикуется в канал) без запросов к БД, и только для публичных запросов.
+По версии строятся ETag и, если известно время изменения всех данных,
+Last-Modified; если клиент прислал совпадающий If-None-Match (или
+If-Modified-Since без If-None-Match), возвращается 304 без рендеринга.
+
+Анонимные ответы без flash сообщений получают Cache-Control: public,
+поэтому их может кэшировать Nginx или CDN. Ответы авторизованным
+пользователям помечаются private: шаблон показывает имя и меню пользователя.
+
+page_cache хранит готовые публичные ответы самых посещаемых страниц
+в памяти воркера (LRU с ограничением по количеству и размеру)
+и сбрасывается по каналу cache_bus после изменений в админке.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import timezone
+from functools import wraps, partial
+
+from flask import request, session, g, current_app, make_response
+from flask_login import current_user
+
+from app.cache import content_cache, cache_bus
+
+_template_version = None
+
+
+def _get_template_version():
+    """Время изменения шаблонов: новая выкладка шаблонов меняет все ETag"""
+    global _template_version
+    if _template_version is None:
+        latest = 0
+        for root, _, files in os.walk(os.path.join(current_app.root_path, current_app.template_folder)):
+            for name in files:
+                latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+        _template_version = str(latest)
+    return _template_version
+
+
+def _as_utc(value):
+    # SQLite возвращает naive datetime, значения хранятся в UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class PageVersion:
+    """
+    Версия страницы: набор значений, от которых зависит HTML,
+    и максимальное время изменения данных.
+    Всегда включает шаблоны и контент (ссылки на соцсети в base.html).
+    """
+
+    def __init__(self):
+        self.parts = [_get_template_version()]
+        self._last_modified = None
+        self._untimed = False
+        count, modified = content_cache.version()
+        self.add(('content', count, str(modified)), modified)
+
+    def add(self, value, modified=None):
+        """Добавляет значение и (необязательно) время изменения"""
+        self.parts.append(value)
+        modified = _as_utc(modified)
+        if modified is not None and (self._last_modified is None or modified > self._last_modified):
+            self._last_modified = modified
+        return self
+
+    def add_namespaces(self, *namespaces):
+        """
+        Поколения пространств имён cache_bus (без запросов к БД). Времени
+        изменения у поколения нет: страница отдаётся без Last-Modified.
+        """
+        for namespace in namespaces:
+            self.add((namespace,) + cache_bus.generation(namespace))
+        self._untimed = True
+        return self
+
+    @property
+    def last_modified(self):
+        """Время изменения данных страницы или None, если оно неизвестно"""
+        return None if self._untimed else self._last_modified
+
+    @property
+    def etag(self):
+        return hashlib.sha1(repr(self.parts).encode('utf-8')).hexdigest()
+
+
+def _is_public_request():
+    """Ответ одинаков для всех анонимных посетителей"""
+    return (request.method in ('GET', 'HEAD')
+            and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+
+def not_modified(build_version):
+    """
+    Запоминает версию страницы и возвращает ответ 304, если версия
+    у клиента совпадает; иначе None (страницу нужно отрендерить).
+    build_version - функция, возвращающая PageVersion: вызывается только
+    для публичного запроса (ответ пользователю не кэшируется).
+    """
+    if not _is_public_request():
+        return None
+    version = build_version()
+    g.page_version = version
+
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(version.etag)
+    elif request.if_modified_since and version.last_modified:
+        matched = version.last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matched = False
+
+    if matched:
+        return current_app.response_class(status=304)
+    return None
+
+
+def conditional_page(view):
+    """
+    Декоратор публичной страницы: добавляет к ответу ETag, Last-Modified
+    и Cache-Control по версии, переданной в not_modified().
+    """
+
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        g.page_version = None
+        response = make_response(view(*args, **kwargs))
+        version = g.page_version
+
+        response.vary.add('Cookie')
+        if version is None or response.status_code not in (200, 304):
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        response.set_etag(version.etag, weak=True)
+        if version.last_modified:
+            response.last_modified = version.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 60)
+        return response
+
+    return decorated_function
+
+
+# Готовый ответ: тело, сохраняемые заголовки, пространства имён cache_bus, срок жизни
+CachedPage = namedtuple('CachedPage', ['body', 'headers', 'namespaces', 'expires_at'])
+
+# Заголовки, которые сохраняются вместе с телом (Set-Cookie не сохраняется никогда)
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+class PageCache:
+    """
+    LRU кэш отрендеренных публичных страниц в памяти воркера.
+    Ключ - путь и нормализованные параметры запроса; записи сбрасываются
+    по пространствам имён cache_bus и по истечении PAGE_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.ttl = 60
+        self.max_entries = 500
+        self.max_bytes = 32 * 1024 * 1024
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PAGE_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.get('PAGE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.max_bytes = app.config.get('PAGE_CACHE_MAX_BYTES', self.max_bytes)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+    def get(self, key):
+        """Возвращает запись и помечает её как недавно использованную"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, headers, namespaces):
+        """Сохраняет ответ, вытесняя давно не использованные записи"""
+        if len(body) > self.max_bytes:
+            return
+        entry = CachedPage(body, headers, frozenset(namespaces), time.monotonic() + self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, namespace):
+        """Удаляет страницы, зависящие от пространства имён"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if namespace in entry.namespaces]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @staticmethod
+    def _make_key(query_args):
+        values = []
+        for name, value_type in query_args.items():
+            value = request.args.get(name, type=value_type)
+            if value not in (None, ''):
+                values.append((name, value))
+        return request.path, tuple(values)
+
+    def cached(self, *namespaces, query_args=None):
+        """
+        Декоратор публичной страницы (ставится над conditional_page).
+        namespaces - пространства имён cache_bus, от которых зависит страница
+        ('content' добавляется всегда: base.html); query_args - {параметр: тип},
+        влияющие на содержимое, остальные параметры запроса игнорируются.
+        """
+        namespaces = frozenset(namespaces) | {'content'}
+        query_args = query_args or {}
+
+        def decorator(view):
+            @wraps(view)
+            def decorated_function(*args, **kwargs):
+                if not self.enabled or not _is_public_request():
+                    return view(*args, **kwargs)
+
+                key = self._make_key(query_args)
+                entry = self.get(key)
+                if entry is not None:
+                    response = current_app.response_class(entry.body, headers=list(entry.headers))
+                    response.headers['X-Page-Cache'] = 'HIT'
+                    # 304, если у клиента та же версия
+                    return response.make_conditional(request)
+
+                response = make_response(view(*args, **kwargs))
+                if (request.method == 'GET' and response.status_code == 200
+                        and response.cache_control.public and not session.modified
+                        and 'Set-Cookie' not in response.headers):
+                    headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+                    self.set(key, response.get_data(), headers, namespaces)
+                response.headers['X-Page-Cache'] = 'MISS'
+                return response
+
+            return decorated_function
+
+        return decorator
+
+
+page_cache = PageCache()
+for _namespace in ('content', 'category', 'hero_slide', 'product', 'blog_post'):
+    cache_bus.subscribe(_namespace, partial(page_cache.invalidate, _namespace))
@@ -0,0 +1,218 @@
+"""
+Обработка загруженных изображений: уменьшенные варианты в WebP и JPEG.
+
+Загрузка сохраняется как есть по хешу содержимого (app/uploads.py),
+обработка выполняется фоновой задачей process_image (app/jobs.py).
+Загрузка с метаданными (EXIF, XMP; has_metadata читает только заголовки)
+хранится под временным именем <sha256>.pending.<ext>; воркер очищает её
+(strip_metadata) и сохраняет под именем по хешу очищенного файла, так что
+содержимое файла по имени не меняется. Рядом в хранилище (app/storage.py)
+создаются варианты из IMAGE_VARIANTS (вписываются в рамку без увеличения,
+EXIF поворот применяется):
+    <sha256>_thumb.webp, <sha256>_thumb.jpg, <sha256>_card.webp, ...
+Описание вариантов хранится в столбце image_variants модели:
+    {"thumb": {"w": 320, "h": 240, "webp": "...", "jpeg": "..."}, ...}
+Шаблоны выводят их через макрос picture (templates/_image.html)
+с srcset, браузер сам выбирает нужный размер и формат; пока задача
+не выполнена, выводится оригинал.
+"""
+import os
+import logging
+import tempfile
+
+from flask import current_app
+from PIL import Image, ImageOps, ExifTags
+
+from app.storage import media_storage
+from app.uploads import save_uploaded_file, release_upload
+
+# Варианты: имя -> максимальные ширина и высота
+IMAGE_VARIANTS = {
+    'thumb': (320, 320),
+    'card': (800, 800),
+    'hero': (1920, 1080),
+}
+
+
+def _variant_names(filename, variant):
+    name = os.path.splitext(filename)[0]
+    return f'{name}_{variant}.webp', f'{name}_{variant}.jpg'
+
+
+def _save(image, name, image_format, **params):
+    """Запись через временный файл: файлы отдаются с долгим кэшем, недописанный не должен попасть в ответ"""
+    fd, temporary_path = tempfile.mkstemp(dir=media_storage.temp_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        image.save(temporary_path, image_format, **params)
+        media_storage.save(name, temporary_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def create_variants(filename):
+    """
+    Создаёт варианты изображения из загруженного файла.
+    Возвращает описание вариантов или None (файл не читается
+    как изображение, анимированный GIF). Варианты файла, на который
+    ссылаются несколько записей, уже есть в хранилище и не пересоздаются.
+    """
+    if not filename:
+        return None
+    webp_quality = current_app.config.get('IMAGE_WEBP_QUALITY', 80)
+    jpeg_quality = current_app.config.get('IMAGE_JPEG_QUALITY', 82)
+
+    try:
+        with media_storage.local_path(filename) as path, Image.open(path) as source:
+            if getattr(source, 'is_animated', False):
+                return None
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+            variants = {}
+            previous_size = None
+            # От меньшего варианта к большему: варианты одного размера не дублируются
+            for variant, box in sorted(IMAGE_VARIANTS.items(), key=lambda item: item[1]):
+                resized = image.copy()
+                resized.thumbnail(box, Image.Resampling.LANCZOS)
+                if resized.size == previous_size:
+                    continue
+                previous_size = resized.size
+
+                webp_name, jpeg_name = _variant_names(filename, variant)
+                variants[variant] = {'w': resized.width, 'h': resized.height, 'webp': webp_name, 'jpeg': jpeg_name}
+                if media_storage.exists(webp_name) and media_storage.exists(jpeg_name):
+                    continue
+                _save(resized, webp_name, 'WEBP', quality=webp_quality, method=4)
+                # В JPEG нет прозрачности: прозрачные области заливаются белым
+                if resized.mode == 'RGBA':
+                    background = Image.new('RGB', resized.size, (255, 255, 255))
+                    background.paste(resized, mask=resized.getchannel('A'))
+                    resized = background
+                _save(resized, jpeg_name, 'JPEG', quality=jpeg_quality, optimize=True, progressive=True)
+            return variants
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logging.getLogger('app.errors').warning(
+            f"Image variants not created: {filename}",
+            exc_info=True,
+            extra={'action': 'image_variants', 'status': 'error'}
+        )
+        return None
+
+
+def _has_metadata(source):
+    if source.format not in ('JPEG', 'PNG') or getattr(source, 'is_animated', False):
+        return False
+    return bool(source.getexif()) or any(key in source.info for key in ('xmp', 'XML:com.adobe.xmp'))
+
+
+def has_metadata(path):
+    """
+    Есть ли в JPEG/PNG метаданные EXIF или XMP. Читаются только заголовки
+    (Image.open не декодирует изображение), поэтому проверка выполняется
+    в запросе загрузки. Файл, заголовки которого не читаются, считается
+    файлом с метаданными.
+    """
+    try:
+        with Image.open(path) as source:
+            return _has_metadata(source)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return True
+
+
+def strip_metadata(path):
+    """
+    Удаляет из локального файла JPEG/PNG метаданные EXIF (в том числе
+    координаты GPS) и XMP, поворачивая изображение по EXIF; цветовой
+    профиль сохраняется. Очищенное изображение пишется в новый временный
+    файл; возвращает его путь или None (метаданных нет, файл не читается
+    как изображение) - исходный файл не меняется.
+    """
+    try:
+        with Image.open(path) as source:
+            if not _has_metadata(source):
+                return None
+            exif = source.getexif()
+            source.load()
+            params = {'icc_profile': source.info.get('icc_profile')}
+            if source.format == 'JPEG':
+                if exif.get(ExifTags.Base.Orientation, 1) == 1:
+                    # Без поворота: те же таблицы квантования, качество не теряется заметно
+                    image = source
+                    params.update(quality='keep', subsampling='keep')
+                else:
+                    image = ImageOps.exif_transpose(source)
+                    params.update(quality=95)
+            else:
+                image = ImageOps.exif_transpose(source)
+                params.update(optimize=True)
+            fd, stripped_path = tempfile.mkstemp(dir=media_storage.temp_dir, suffix='.part')
+            os.close(fd)
+            try:
+                image.save(stripped_path, source.format,
+                           **{key: value for key, value in params.items() if value is not None})
+            except Exception:
+                os.remove(stripped_path)
+                raise
+            return stripped_path
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logging.getLogger('app.errors').warning(
+            f"Image metadata not stripped: {path}",
+            exc_info=True,
+            extra={'action': 'strip_metadata', 'status': 'error'}
+        )
+        return None
+
+
+def delete_image_files(filename):
+    """Удаляет оригинал и все его варианты (вызывается для файлов без ссылок, app/uploads.py)"""
+    names = [filename]
+    for variant in IMAGE_VARIANTS:
+        names.extend(_variant_names(filename, variant))
+    for name in names:
+        media_storage.delete(name)
+
+
+def replace_image(item, file):
+    """
+    Заменяет загруженное изображение модели новым файлом; ссылка на старый
+    файл снимается (файл удаляется, если на него больше никто не ссылается).
+    Обработку ставит в очередь вызывающий код (enqueue_image_processing)
+    после flush. Возвращает True, если изображение изменилось.
+    """
+    filename = save_uploaded_file(file)
+    if filename is None:
+        return False
+    release_upload(item.image_file)
+    if filename == item.image_file:
+        # Загружен тот же файл: варианты остаются прежними
+        return False
+    item.image_file = filename
+    item.image_variants = None
+    return True
+
+
+def generate_missing_variants():
+    """
+    Создаёт варианты для ранее загруженных изображений без них.
+    Возвращает количество обработанных записей.
+    """
+    from app import db
+    from app.models import Product, BlogPost, HeroSlide
+    from app.cache import cache_bus
+
+    count = 0
+    for model, namespace in ((Product, 'product'), (BlogPost, 'blog_post'), (HeroSlide, 'hero_slide')):
+        updated = 0
+        for item in model.query.filter(model.image_file.isnot(None), model.image_variants.is_(None)):
+            variants = create_variants(item.image_file)
+            if variants:
+                item.image_variants = variants
+                updated += 1
+        db.session.commit()
+        if updated:
+            cache_bus.publish(namespace)
+        count += updated
+    return count
@@ -0,0 +1,74 @@
+"""
+Резервирование товара на складе при оформлении заказа.
+
+Остаток уменьшается условным UPDATE, который СУБД выполняет атомарно:
+    UPDATE products SET stock_quantity = stock_quantity - :q
+    WHERE id = :id AND is_active AND stock_quantity >= :q
+Строка не обновится, если товара не хватает, поэтому параллельные заказы
+не могут уйти в минус (нет чтения остатка в Python между проверкой и записью).
+Все позиции резервируются в транзакции заказа; если хотя бы одна позиция
+не прошла, вызывающий код откатывает транзакцию целиком.
+"""
+from collections import namedtuple
+
+from sqlalchemy import update, select
+
+from app import db
+from app.models import Product
+
+# Позиция, которую не удалось зарезервировать: запрошено и доступно сейчас
+StockShortage = namedtuple('StockShortage', ['product_id', 'name', 'requested', 'available'])
+
+
+class StockReservationError(Exception):
+    """Не хватает товара по одной или нескольким позициям"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(f'{item.product_id}: {item.requested}/{item.available}' for item in shortages))
+
+    def messages(self):
+        """Сообщения для пользователя, по одному на позицию"""
+        result = []
+        for item in self.shortages:
+            if item.available <= 0:
+                result.append(f'Товар "{item.name}" закончился на складе')
+            else:
+                result.append(f'Недостаточно товара "{item.name}" на складе (доступно: {item.available} шт.)')
+        return result
+
+
+def reserve_stock(quantities):
+    """
+    Уменьшает остатки {product_id: количество} в текущей транзакции (без commit).
+    Проверяет все позиции и при нехватке поднимает StockReservationError
+    со списком всех недоступных позиций; транзакцию откатывает вызывающий код.
+    """
+    table = Product.__table__
+    failed = []
+    # Единый порядок блокировок строк, чтобы встречные заказы не взаимоблокировались
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == product_id,
+                   table.c.is_active == True,
+                   table.c.stock_quantity >= quantity)
+            .values(stock_quantity=table.c.stock_quantity - quantity)
+        )
+        if result.rowcount != 1:
+            failed.append(product_id)
+
+    if not failed:
+        return
+
+    rows = {row.id: row for row in db.session.execute(
+        select(table.c.id, table.c.name, table.c.stock_quantity, table.c.is_active).where(table.c.id.in_(failed))
+    )}
+    shortages = []
+    for product_id in failed:
+        row = rows.get(product_id)
+        available = row.stock_quantity if row is not None and row.is_active else 0
+        shortages.append(StockShortage(product_id, row.name if row is not None else '', quantities[product_id],
+                                       max(available or 0, 0)))
+    raise StockReservationError(shortages)
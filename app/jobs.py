@@ -0,0 +1,231 @@
+"""
+Очередь фоновых задач в таблице jobs.
+
+Обработчик запроса ставит задачу (enqueue) в той же транзакции, что и
+изменение данных, и сразу отвечает; тяжёлая работа (обработка загруженных
+изображений) выполняется отдельным процессом:
+    flask run_worker
+Воркер забирает задачу условным UPDATE (PENDING -> RUNNING), поэтому
+несколько воркеров не выполнят одну задачу дважды. При ошибке задача
+повторяется через JOB_RETRY_DELAY * номер попытки, после JOB_MAX_ATTEMPTS
+попыток помечается FAILED. Задача, которая дольше JOB_TIMEOUT остаётся
+в RUNNING (воркер завершился аварийно), возвращается в очередь.
+Состояние очереди - в админке, /admin/jobs.
+"""
+import time
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.cache import cache_bus
+from app.models import Job, JobStatusEnum, Product, BlogPost, HeroSlide, utcnow
+
+# Обработчики: тип задачи -> функция(**payload)
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Регистрирует обработчик задач типа kind"""
+
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Добавляет задачу в текущую транзакцию (commit выполняет вызывающий код)"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, payload=payload)
+    db.session.add(job)
+    return job
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи зависших воркеров; возвращает их количество"""
+    table = Job.__table__
+    deadline = utcnow() - timedelta(seconds=current_app.config.get('JOB_TIMEOUT', 300))
+    max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', 3)
+    stale = (table.c.status == JobStatusEnum.RUNNING) & (table.c.started_at < deadline)
+
+    failed = db.session.execute(
+        update(table).where(stale, table.c.attempts >= max_attempts)
+        .values(status=JobStatusEnum.FAILED, finished_at=utcnow(), last_error='Превышено время выполнения')
+    ).rowcount
+    requeued = db.session.execute(
+        update(table).where(stale).values(status=JobStatusEnum.PENDING, last_error='Превышено время выполнения')
+    ).rowcount
+    db.session.commit()
+    return failed + requeued
+
+
+def claim_next_job():
+    """Забирает следующую готовую задачу или возвращает None"""
+    table = Job.__table__
+    while True:
+        now = utcnow()
+        job_id = db.session.execute(
+            select(table.c.id)
+            .where(table.c.status == JobStatusEnum.PENDING, table.c.run_after <= now)
+            .order_by(table.c.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+
+        # Условие по статусу: задачу мог забрать другой воркер
+        claimed = db.session.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == JobStatusEnum.PENDING)
+            .values(status=JobStatusEnum.RUNNING, started_at=now, attempts=table.c.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed == 1:
+            return db.session.get(Job, job_id)
+
+
+def run_job(job):
+    """Выполняет задачу и записывает результат; возвращает True при успехе"""
+    job_id, kind, payload = job.id, job.kind, dict(job.payload)
+    started = time.perf_counter()
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f'Unknown job kind: {kind}')
+        handler(**payload)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.attempts >= current_app.config.get('JOB_MAX_ATTEMPTS', 3):
+            job.status = JobStatusEnum.FAILED
+            job.finished_at = utcnow()
+        else:
+            job.status = JobStatusEnum.PENDING
+            job.run_after = utcnow() + timedelta(seconds=current_app.config.get('JOB_RETRY_DELAY', 30) * job.attempts)
+        db.session.commit()
+        logging.getLogger('app.errors').error(
+            f"Job failed: {kind} #{job_id}: {str(e)}",
+            exc_info=True,
+            extra={
+                'action': 'job_run',
+                'status': 'error',
+                'entity_type': 'job',
+                'entity_id': job_id,
+                'extra_data': {'kind': kind, 'attempts': job.attempts, 'final': job.status == JobStatusEnum.FAILED}
+            }
+        )
+        return False
+
+    job = db.session.get(Job, job_id)
+    job.status = JobStatusEnum.DONE
+    job.finished_at = utcnow()
+    job.last_error = None
+    db.session.commit()
+    logging.getLogger('app.actions').info(
+        f"Job done: {kind} #{job_id}",
+        extra={
+            'action': 'job_run',
+            'status': 'success',
+            'entity_type': 'job',
+            'entity_id': job_id,
+            'extra_data': {'kind': kind, 'duration_ms': int((time.perf_counter() - started) * 1000)}
+        }
+    )
+    return True
+
+
+def run_worker(app, poll_interval=None, once=False, stop_event=None):
+    """
+    Цикл воркера: выполняет задачи по одной, при пустой очереди ждёт
+    poll_interval секунд. once=True - выполнить готовые задачи и выйти.
+    Возвращает количество выполненных задач.
+    """
+    stop_event = stop_event or threading.Event()
+    poll_interval = poll_interval if poll_interval is not None else app.config.get('JOB_POLL_INTERVAL', 1)
+    processed = 0
+    next_stale_check = 0
+
+    while not stop_event.is_set():
+        with app.app_context():
+            if time.monotonic() >= next_stale_check:
+                requeue_stale_jobs()
+                next_stale_check = time.monotonic() + 60
+            job = claim_next_job()
+            if job is not None:
+                run_job(job)
+                processed += 1
+                continue
+        if once:
+            break
+        stop_event.wait(poll_interval)
+    return processed
+
+
+# Модели с загружаемыми изображениями: имя таблицы -> (модель, пространство имён cache_bus)
+IMAGE_MODELS = {
+    Product.__tablename__: (Product, 'product'),
+    BlogPost.__tablename__: (BlogPost, 'blog_post'),
+    HeroSlide.__tablename__: (HeroSlide, 'hero_slide'),
+}
+
+
+def enqueue_image_processing(item=None, image_file=None):
+    """
+    Ставит в очередь обработку загруженного изображения: модели
+    (после flush - нужен id) или отдельного файла (изображения страницы About).
+    """
+    if item is not None:
+        return enqueue('process_image', image_file=item.image_file, model=item.__tablename__, item_id=item.id)
+    return enqueue('process_image', image_file=image_file)
+
+
+@job_handler('process_image')
+def process_image(image_file, model=None, item_id=None):
+    """
+    Очищает загрузку с метаданными (имя <sha256>.pending.<ext>) и переводит
+    ссылку на очищенный файл, для модели создаёт уменьшенные варианты
+    """
+    from app.images import create_variants
+    from app.uploads import is_pending_upload, publish_upload, content_image_references
+
+    if model is None:
+        # Изображение страницы About: вариантов нет, только очистка
+        references = content_image_references(image_file) if is_pending_upload(image_file) else []
+        if references and publish_upload(image_file, references):
+            db.session.commit()
+            cache_bus.publish('content')
+        return
+
+    model_class, namespace = IMAGE_MODELS[model]
+    item = db.session.get(model_class, item_id)
+    # Изображение могли заменить или удалить, пока задача ждала в очереди
+    if item is None or item.image_file != image_file:
+        return
+    if is_pending_upload(image_file):
+        new_filename = publish_upload(image_file, [(item, 'image_file')])
+        if new_filename:
+            # Блокировка записи не удерживается, пока создаются варианты
+            db.session.commit()
+            image_file = new_filename
+        elif item.image_file != image_file:
+            return
+    item.image_variants = create_variants(image_file)
+    db.session.commit()
+    cache_bus.publish(namespace)
+
+
+@job_handler('delete_upload')
+def delete_upload(filename):
+    """Удаляет загруженный файл и его варианты, если на него не осталось ссылок"""
+    from app.uploads import delete_unreferenced
+
+    delete_unreferenced(filename)
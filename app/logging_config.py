@@ -1,62 +1,146 @@
 """
 Конфигурация логирования для production-ready системы логирования.
-Поддерживает JSON и текстовый форматы, ротацию файлов.
+Поддерживает JSON и текстовый форматы, ротацию файлов
+и асинхронную запись через очередь (LOG_ASYNC).
 """
 import os
+import copy
 import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from collections import Counter
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime, timezone
-from flask import request, has_request_context
+from flask import request, has_request_context, g
 from app import get_client_ip
 
+try:
+    import orjson
+except ImportError:  # Необязательная зависимость: быстрый JSON сериализатор
+    orjson = None
+
+
+# Стандартные атрибуты LogRecord, которые не выводятся как дополнительные поля
+STANDARD_RECORD_ATTRS = frozenset({
+    'name', 'msg', 'args', 'created', 'filename', 'funcName',
+    'levelname', 'levelno', 'lineno', 'module', 'msecs',
+    'message', 'pathname', 'process', 'processName', 'relativeCreated',
+    'thread', 'threadName', 'exc_info', 'exc_text', 'stack_info',
+    'getMessage', 'taskName', 'request_context'
+})
+
+
+def _stdlib_json_dumps(data):
+    # default=str: Decimal, datetime и т.п. из extra не ломают запись лога
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, default=str).decode('utf-8')
+
+
+def get_json_serializer(name='auto'):
+    """
+    Возвращает функцию сериализации записей лога:
+    'json' - стандартный json, 'orjson' - orjson, 'auto' - orjson, если установлен.
+    """
+    if name == 'orjson' or (name == 'auto' and orjson is not None):
+        if orjson is None:
+            raise RuntimeError("LOG_JSON_SERIALIZER='orjson', но пакет orjson не установлен")
+        return _orjson_dumps
+    return _stdlib_json_dumps
+
+
+def build_request_log_context():
+    """
+    Вычисляет контекст текущего запроса для записей лога.
+    Вне запроса возвращает None.
+    """
+    if not has_request_context():
+        return None
+
+    context = {
+        'ip_address': get_client_ip() or 'N/A',
+        'method': request.method,
+        'path': request.path,
+        'user_agent': request.headers.get('User-Agent', 'N/A'),
+    }
+
+    # Добавляем информацию о пользователе, если есть
+    try:
+        from flask_login import current_user
+        if current_user.is_authenticated:
+            context['user_id'] = current_user.id
+            context['username'] = current_user.username
+    except:
+        pass
+
+    return context
+
+
+def bind_request_log_context():
+    """Вычисляет контекст один раз на запрос (вызывается в before_request)"""
+    g.log_context = build_request_log_context()
+
+
+def get_request_log_context():
+    """
+    Контекст текущего запроса для записи лога: сохранённый в g
+    или вычисленный и сохранённый при первом обращении.
+    Вне запроса возвращает None.
+    """
+    if not has_request_context():
+        return None
+    if 'log_context' not in g:
+        g.log_context = build_request_log_context()
+    return g.log_context
+
+
+def _record_request_context(record):
+    """
+    Контекст запроса для записи: сохранённый при постановке в очередь
+    (асинхронный режим) или контекст текущего запроса.
+    """
+    request_context = getattr(record, 'request_context', None)
+    if request_context is not None:
+        return request_context
+    return get_request_log_context()
+
 
 class JSONFormatter(logging.Formatter):
     """JSON форматтер для продакшена"""
-    
+
+    def __init__(self, *args, serializer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.serializer = serializer or _stdlib_json_dumps
+
     def format(self, record):
         log_data = {
-            'timestamp': datetime.now(timezone.utc).isoformat(),
+            # Время создания записи, а не записи в файл (важно для асинхронного режима)
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             'level': record.levelname,
             'logger': record.name,
             'message': record.getMessage(),
         }
-        
+
         # Добавляем контекст запроса, если доступен
-        if has_request_context():
-            log_data['ip_address'] = get_client_ip() or 'N/A'
-            log_data['method'] = request.method
-            log_data['path'] = request.path
-            log_data['user_agent'] = request.headers.get('User-Agent', 'N/A')
-            
-            # Добавляем информацию о пользователе, если есть
-            try:
-                from flask_login import current_user
-                if current_user.is_authenticated:
-                    log_data['user_id'] = current_user.id
-                    log_data['username'] = current_user.username
-            except:
-                pass
-        
+        request_context = _record_request_context(record)
+        if request_context:
+            log_data.update(request_context)
+
         # Добавляем дополнительные поля из record
         # Когда используется logger.info(msg, extra={...}), данные попадают в record.__dict__
-        # Стандартные атрибуты LogRecord, которые нужно пропустить
-        standard_attrs = {'name', 'msg', 'args', 'created', 'filename', 'funcName', 
-                         'levelname', 'levelno', 'lineno', 'module', 'msecs', 
-                         'message', 'pathname', 'process', 'processName', 'relativeCreated',
-                         'thread', 'threadName', 'exc_info', 'exc_text', 'stack_info',
-                         'getMessage', 'exc_text'}
-        
-        # Добавляем все нестандартные атрибуты из record
         for key, value in record.__dict__.items():
-            if key not in standard_attrs and key not in log_data:
+            if key not in STANDARD_RECORD_ATTRS and key not in log_data:
                 log_data[key] = value
-        
+
         # Добавляем информацию об исключении, если есть
         if record.exc_info:
             log_data['exception'] = self.formatException(record.exc_info)
-        
-        return json.dumps(log_data, ensure_ascii=False)
+
+        return self.serializer(log_data)
 
 
 class TextFormatter(logging.Formatter):
@@ -70,9 +154,8 @@ class TextFormatter(logging.Formatter):
         message = record.getMessage()
         
         # Добавляем IP адрес
-        ip = 'N/A'
-        if has_request_context():
-            ip = get_client_ip() or 'N/A'
+        request_context = _record_request_context(record)
+        ip = request_context['ip_address'] if request_context else 'N/A'
         
         # Формируем строку
         log_line = f"{timestamp} - {logger} - {level} - [IP: {ip}]"
@@ -132,6 +215,162 @@ def mask_sensitive_data(data):
     return masked_data
 
 
+class AsyncQueueHandler(QueueHandler):
+    """
+    QueueHandler с ограниченной очередью.
+    При переполнении запись отбрасывается ('drop') или поток ждёт
+    освобождения места не дольше block_timeout ('block'), затем запись отбрасывается.
+    """
+
+    def __init__(self, dispatcher):
+        super().__init__(dispatcher.queue)
+        self.dispatcher = dispatcher
+
+    def prepare(self, record):
+        # Контекст запроса сохраняется сейчас: в потоке записи запроса уже нет.
+        # exc_info не удаляется (в отличие от QueueHandler.prepare),
+        # чтобы форматтеры выводили исключение как обычно.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_context = get_request_log_context()
+        return record
+
+    def enqueue(self, record):
+        # Очередь берётся у диспетчера: после fork она пересоздаётся
+        self.dispatcher.put(record)
+
+
+class AsyncLogDispatcher:
+    """
+    Асинхронная запись логов: все логгеры приложения кладут записи в одну
+    ограниченную очередь, а поток QueueListener передаёт их исходным хендлерам.
+    После fork (воркеры Gunicorn при preload_app) очередь и поток создаются заново.
+    Переполнения считаются по логгерам (отброшенные записи и ожидания места
+    в режиме 'block'); при остановке итог пишется в лог приложения.
+    """
+
+    def __init__(self, max_size=10000, overflow='drop', block_timeout=0.05):
+        self.max_size = max_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.routes = {}
+        self.dropped = Counter()
+        self.blocked = Counter()
+        self._counters_lock = threading.Lock()
+        self._stopped = False
+        self._start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+        atexit.register(self.stop)
+
+    def _start(self):
+        self.queue = queue.Queue(self.max_size)
+        self.listener = _RoutingQueueListener(self.queue, self)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        if self._stopped:
+            return
+        self.dropped = Counter()
+        self.blocked = Counter()
+        self._counters_lock = threading.Lock()
+        self._start()
+
+    def attach(self, logger):
+        """Переносит хендлеры логгера в поток записи и ставит вместо них очередь"""
+        self.routes[logger.name] = list(logger.handlers)
+        logger.handlers.clear()
+        logger.addHandler(AsyncQueueHandler(self))
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == 'block':
+            with self._counters_lock:
+                self.blocked[record.name] += 1
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+        with self._counters_lock:
+            self.dropped[record.name] += 1
+
+    def dispatch(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stats(self):
+        """Размер очереди, количество отброшенных записей и ожиданий места по логгерам"""
+        with self._counters_lock:
+            dropped, blocked = dict(self.dropped), dict(self.blocked)
+        return {
+            'queued': self.queue.qsize(),
+            'max_size': self.max_size,
+            'overflow': self.overflow,
+            'dropped': sum(dropped.values()),
+            'dropped_by_logger': dropped,
+            'blocked': sum(blocked.values()),
+            'blocked_by_logger': blocked,
+        }
+
+    def stop(self):
+        """Дописывает оставшиеся записи, останавливает поток и пишет итог переполнений"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        self._report_overflow()
+
+    def _report_overflow(self):
+        # Поток записи уже остановлен: запись передаётся хендлерам логгера приложения напрямую
+        stats = self.stats()
+        if not (stats['dropped'] or stats['blocked']) or not self.routes:
+            return
+        name = next(iter(self.routes))
+        record = logging.getLogger(name).makeRecord(
+            name, logging.WARNING, __file__, 0,
+            f"Async log queue overflow: dropped={stats['dropped']}, blocked={stats['blocked']}", None, None,
+            extra={
+                'action': 'log_queue',
+                'status': 'error',
+                'extra_data': {key: stats[key] for key in ('max_size', 'overflow', 'dropped_by_logger', 'blocked_by_logger')}
+            }
+        )
+        self.dispatch(record)
+
+
+class _RoutingQueueListener(QueueListener):
+    """QueueListener, который передаёт запись хендлерам её логгера"""
+
+    def __init__(self, log_queue, dispatcher):
+        super().__init__(log_queue)
+        self.dispatcher = dispatcher
+
+    def handle(self, record):
+        self.dispatcher.dispatch(record)
+
+    def enqueue_sentinel(self):
+        # Ждём места в очереди: остановка не должна падать при переполнении
+        self.queue.put(self._sentinel)
+
+
+# Диспетчер асинхронного логирования текущего процесса (если включён LOG_ASYNC)
+_async_dispatcher = None
+
+
+def get_async_log_stats():
+    """Статистика очереди асинхронного логирования или None, если режим выключен"""
+    if _async_dispatcher is None:
+        return None
+    return _async_dispatcher.stats()
+
+
 def setup_logging(app):
     """
     Настраивает систему логирования для приложения.
@@ -167,7 +406,7 @@ def setup_logging(app):
     
     # Выбираем форматтер
     if use_json:
-        formatter = JSONFormatter()
+        formatter = JSONFormatter(serializer=get_json_serializer(app.config.get('LOG_JSON_SERIALIZER', 'auto')))
     else:
         formatter = TextFormatter(
             '%(asctime)s - %(name)s - %(levelname)s - [IP: %(client_ip)s] - %(message)s'
@@ -304,6 +543,21 @@ def setup_logging(app):
     gunicorn_logger = logging.getLogger('gunicorn')
     gunicorn_logger.propagate = False  # Отключаем распространение, чтобы не дублировать логи
     
+    # Асинхронный режим: запись в файлы и консоль выполняется в отдельном потоке
+    global _async_dispatcher
+    if _async_dispatcher is not None:
+        _async_dispatcher.stop()
+        _async_dispatcher = None
+    if app.config.get('LOG_ASYNC', False):
+        _async_dispatcher = AsyncLogDispatcher(
+            max_size=app.config.get('LOG_ASYNC_QUEUE_SIZE', 10000),
+            overflow=app.config.get('LOG_ASYNC_OVERFLOW', 'drop'),
+            block_timeout=app.config.get('LOG_ASYNC_BLOCK_TIMEOUT', 0.05)
+        )
+        for logger in (app.logger, requests_logger, actions_logger, auth_logger, errors_logger):
+            _async_dispatcher.attach(logger)
+
     # Логируем информацию о настройке
     # Используем файловый хендлер, так как консольный может не работать в Gunicorn
-    app.logger.info(f"Logging configured: format={'JSON' if use_json else 'Text'}, level={log_level}, dir={log_dir}")
+    app.logger.info(f"Logging configured: format={'JSON' if use_json else 'Text'}, level={log_level}, dir={log_dir}, "
+                    f"async={_async_dispatcher is not None}")
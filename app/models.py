@@ -1,9 +1,16 @@
-from app import db, bcrypt
+from app import db
+from app.storage import media_storage
+from app.passwords import hash_password, verify_password
 from flask_login import UserMixin
 from datetime import datetime, timezone
 import enum
 
 
+def utcnow():
+    """Текущее время UTC (вызывается при каждой вставке/обновлении строки)"""
+    return datetime.now(timezone.utc)
+
+
 class RoleEnum(enum.Enum):
     ADMIN = 'admin'
     MANAGER = 'manager'
@@ -18,6 +25,13 @@ class OrderStatusEnum(enum.Enum):
     CANCELLED = 'cancelled'
 
 
+class JobStatusEnum(enum.Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
 
@@ -30,17 +44,17 @@ class User(UserMixin, db.Model):
     address = db.Column(db.Text)
     role = db.Column(db.Enum(RoleEnum), default=RoleEnum.USER, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
     # Связи
     orders = db.relationship('Order', backref='user', lazy='dynamic', cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def is_admin(self):
         return self.role == RoleEnum.ADMIN
@@ -62,7 +76,7 @@ class Category(db.Model):
     name = db.Column(db.String(100), nullable=False, unique=True)
     slug = db.Column(db.String(100), unique=True, nullable=False, index=True)
     description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
 
     products = db.relationship('Product', backref='category', lazy='dynamic')
 
@@ -82,14 +96,22 @@ class Product(db.Model):
     stock_quantity = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(500))  # Ссылка на изображение
     image_file = db.Column(db.String(500))  # Путь к загруженному файлу
+    image_variants = db.Column(db.JSON(none_as_null=True))  # Уменьшенные копии загруженного файла (app/images.py)
     is_active = db.Column(db.Boolean, default=True)
     views_count = db.Column(db.Integer, default=0)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
     order_items = db.relationship('OrderItem', backref='product', lazy='dynamic')
 
+    __table_args__ = (
+        # Каталог: активные товары категории
+        db.Index('ix_products_active_category', 'is_active', 'category_id'),
+        # Главная: популярные товары
+        db.Index('ix_products_active_views', 'is_active', 'views_count'),
+    )
+
     def __repr__(self):
         return f'<Product {self.name}>'
 
@@ -104,10 +126,18 @@ class Order(db.Model):
     shipping_address = db.Column(db.Text, nullable=False)
     phone = db.Column(db.String(20))
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
-    items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
+    # lazy='select' (а не 'dynamic'), чтобы позиции можно было загружать через selectinload
+    items = db.relationship('OrderItem', backref='order', lazy='select', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Заказы пользователя, заказы по статусу и последние заказы в админке
+        db.Index('ix_orders_user_created', 'user_id', 'created_at'),
+        db.Index('ix_orders_status_created', 'status', 'created_at'),
+        db.Index('ix_orders_created_at', 'created_at'),
+    )
 
     def __repr__(self):
         return f'<Order {self.id}>'
@@ -117,8 +147,8 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
 
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
 
@@ -126,6 +156,25 @@ class OrderItem(db.Model):
         return f'<OrderItem {self.id}>'
 
 
+class CartItem(db.Model):
+    """Позиция корзины пользователя (серверное хранение вместо cookie сессии)"""
+    __tablename__ = 'cart_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+    __table_args__ = (
+        # Одна строка на товар: поиск позиции по (user_id, product_id)
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_items_user_product'),
+    )
+
+    def __repr__(self):
+        return f'<CartItem user={self.user_id} product={self.product_id} x{self.quantity}>'
+
+
 class BlogPost(db.Model):
     __tablename__ = 'blog_posts'
 
@@ -136,15 +185,23 @@ class BlogPost(db.Model):
     excerpt = db.Column(db.String(500))
     image_url = db.Column(db.String(500))  # Ссылка на изображение
     image_file = db.Column(db.String(500))  # Путь к загруженному файлу
+    image_variants = db.Column(db.JSON(none_as_null=True))  # Уменьшенные копии загруженного файла (app/images.py)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     is_published = db.Column(db.Boolean, default=False)
     views_count = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     published_at = db.Column(db.DateTime)
 
     author = db.relationship('User', backref='blog_posts')
 
+    __table_args__ = (
+        # Блог: опубликованные статьи по дате
+        db.Index('ix_blog_posts_published_created', 'is_published', 'created_at'),
+        # Админка: все статьи по дате
+        db.Index('ix_blog_posts_created_at', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<BlogPost {self.title}>'
 
@@ -159,8 +216,8 @@ class Content(db.Model):
     content = db.Column(db.Text)
     content_type = db.Column(db.String(50))
     section = db.Column(db.String(50))
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     updated_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     updated_by = db.relationship('User', backref='content_updates')
@@ -178,7 +235,12 @@ class ContactMessage(db.Model):
     phone = db.Column(db.String(20))
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), index=True)
+    created_at = db.Column(db.DateTime, default=utcnow, index=True)
+
+    __table_args__ = (
+        # Непрочитанные обращения по дате
+        db.Index('ix_contact_messages_read_created', 'is_read', 'created_at'),
+    )
 
     def __repr__(self):
         return f'<ContactMessage {self.id} from {self.email}>'
@@ -193,20 +255,101 @@ class HeroSlide(db.Model):
     subtitle = db.Column(db.Text)
     image_url = db.Column(db.String(500))  # Ссылка на изображение
     image_file = db.Column(db.String(500))  # Путь к загруженному файлу
+    image_variants = db.Column(db.JSON(none_as_null=True))  # Уменьшенные копии загруженного файла (app/images.py)
     order = db.Column(db.Integer, default=0)  # Порядок отображения
     is_active = db.Column(db.Boolean, default=True)
     link_url = db.Column(db.String(500))  # Ссылка при клике на слайд
     link_text = db.Column(db.String(100))  # Текст кнопки
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Главная: активные слайды по порядку
+        db.Index('ix_hero_slides_active_order', 'is_active', 'order'),
+    )
 
     def get_image(self):
         """Возвращает URL изображения (приоритет у загруженного файла)"""
         if self.image_file:
-            # Возвращаем путь, который будет использован с url_for в шаблоне
-            return f'/static/uploads/{self.image_file}'
+            return media_storage.url(self.image_file)
         return self.image_url or ''
 
     def __repr__(self):
         return f'<HeroSlide {self.id}: {self.title}>'
 
+
+class RelatedItem(db.Model):
+    """Предрассчитанные связи 'похожие товары' / 'похожие статьи'"""
+    __tablename__ = 'related_items'
+
+    KIND_PRODUCT = 'product'
+    KIND_BLOG_POST = 'blog_post'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # product / blog_post
+    source_id = db.Column(db.Integer, nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, default=0)
+
+    __table_args__ = (
+        db.Index('ix_related_items_kind_source', 'kind', 'source_id'),
+    )
+
+    def __repr__(self):
+        return f'<RelatedItem {self.kind} {self.source_id} -> {self.target_id}>'
+
+
+class DashboardStats(db.Model):
+    """Счётчики для дашборда админки (одна строка с id=1)"""
+    __tablename__ = 'dashboard_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    users_count = db.Column(db.Integer, default=0, nullable=False)
+    products_count = db.Column(db.Integer, default=0, nullable=False)
+    orders_count = db.Column(db.Integer, default=0, nullable=False)
+    orders_pending = db.Column(db.Integer, default=0, nullable=False)
+    blog_posts_count = db.Column(db.Integer, default=0, nullable=False)
+    content_items = db.Column(db.Integer, default=0, nullable=False)
+    messages_unread = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DashboardStats orders={self.orders_count}>'
+
+
+class Job(db.Model):
+    """Фоновая задача (очередь в БД, выполняет flask run_worker, app/jobs.py)"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.Enum(JobStatusEnum), default=JobStatusEnum.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, default=utcnow, nullable=False)  # Не раньше (повтор с задержкой)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Выбор следующей задачи: WHERE status = 'PENDING' ORDER BY id
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status.value}>'
+
+
+class Upload(db.Model):
+    """Загруженный файл в хранилище по хешу содержимого (app/uploads.py)"""
+    __tablename__ = 'uploads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(100), unique=True, nullable=False)  # <sha256>.<расширение>
+    size = db.Column(db.Integer, nullable=False)
+    # Количество записей (товары, статьи, слайды, контент), ссылающихся на файл
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+    def __repr__(self):
+        return f'<Upload {self.filename} refs={self.ref_count}>'
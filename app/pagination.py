@@ -0,0 +1,173 @@
+"""
+Постраничный вывод без OFFSET и COUNT (keyset/seek пагинация).
+
+Следующая страница выбирается условием по ключу сортировки последней
+строки текущей страницы:
+    WHERE (created_at, id) < (:created_at, :id)
+    ORDER BY created_at DESC, id DESC LIMIT per_page + 1
+При наличии индекса по ключу стоимость не зависит от глубины страницы.
+Позиция передаётся в URL непрозрачным курсором (?cursor=...).
+Лишняя (per_page + 1) строка показывает, есть ли следующая страница,
+поэтому COUNT(*) не нужен; общее количество (total) считается только
+по запросу и кэшируется на PAGINATION_COUNT_TTL секунд.
+"""
+import json
+import time
+import base64
+import binascii
+import threading
+from datetime import datetime
+
+from flask import request, current_app
+from sqlalchemy import tuple_
+
+# Направление курсора: после ключа (вперёд) или до ключа (назад)
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+class CountCache:
+    """Кэш COUNT(*) для списков: ключ - SQL запроса и его параметры"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        count_query = query.order_by(None)
+        compiled = count_query.statement.compile()
+        key = (str(compiled), repr(sorted(compiled.params.items())))
+        ttl = current_app.config.get('PAGINATION_COUNT_TTL', 60)
+        now = time.monotonic()
+
+        entry = self._counts.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        count = count_query.count()
+        with self._lock:
+            if len(self._counts) > 1000:
+                self._counts.clear()
+            self._counts[key] = (count, now + ttl)
+        return count
+
+
+count_cache = CountCache()
+
+
+def encode_cursor(values, direction):
+    """Курсор для URL: base64(JSON) со значениями ключа и направлением"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps({'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Разбирает курсор; возвращает (значения ключа, направление)
+    или (None, FORWARD) для пустого или повреждённого курсора.
+    """
+    if not cursor:
+        return None, FORWARD
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = payload['k'], payload['d']
+        if direction not in (FORWARD, BACKWARD) or len(values) != len(columns):
+            return None, FORWARD
+        key = []
+        for column, value in zip(columns, values):
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, column.type.python_type):
+                value = column.type.python_type(value)
+            key.append(value)
+        return key, direction
+    except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError, NotImplementedError):
+        return None, FORWARD
+
+
+class KeysetPage:
+    """
+    Страница списка. Для шаблонов: items, has_prev, has_next,
+    prev_args/next_args - параметры url_for для соседних страниц.
+    """
+
+    def __init__(self, query, items, has_prev, has_next, columns, per_page):
+        self._query = query
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.per_page = per_page
+        self._columns = columns
+
+    def _key(self, item):
+        return [getattr(item, column.key) for column in self._columns]
+
+    @property
+    def prev_args(self):
+        if not self.has_prev or not self.items:
+            return {}
+        return {'cursor': encode_cursor(self._key(self.items[0]), BACKWARD)}
+
+    @property
+    def next_args(self):
+        if not self.has_next or not self.items:
+            return {}
+        return {'cursor': encode_cursor(self._key(self.items[-1]), FORWARD)}
+
+    @property
+    def total(self):
+        """Общее количество строк (COUNT с кэшированием, только по запросу)"""
+        return count_cache.get(self._query)
+
+
+def keyset_paginate(query, columns, per_page, descending=False, cursor=None):
+    """
+    Страница запроса query, отсортированного по columns (уникальный ключ,
+    последним обычно идёт id). Курсор берётся из ?cursor=, если не передан.
+    """
+    columns = list(columns)
+    if cursor is None:
+        cursor = request.args.get('cursor')
+    key, direction = decode_cursor(cursor, columns)
+
+    # Назад - та же выборка в обратном порядке, затем разворот результата
+    reverse = direction == BACKWARD
+    order_descending = descending != reverse
+    seek_query = query
+    if key is not None:
+        row = tuple_(*columns) if len(columns) > 1 else columns[0]
+        value = tuple_(*key) if len(columns) > 1 else key[0]
+        seek_query = seek_query.filter(row < value if order_descending else row > value)
+    seek_query = seek_query.order_by(*[column.desc() if order_descending else column.asc() for column in columns])
+
+    rows = seek_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if reverse:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = key is not None, has_more
+
+    return KeysetPage(query, items, has_prev, has_next, columns, per_page)
+
+
+class OffsetPage(KeysetPage):
+    """
+    Страница с номером (?page=) для списков без уникального ключа сортировки
+    (результаты поиска по релевантности). COUNT(*) не выполняется.
+    """
+
+    def __init__(self, query, page, per_page):
+        self.page = max(page, 1)
+        rows = query.offset((self.page - 1) * per_page).limit(per_page + 1).all()
+        super().__init__(query, rows[:per_page], self.page > 1, len(rows) > per_page, [], per_page)
+
+    @property
+    def prev_args(self):
+        return {'page': self.page - 1} if self.has_prev else {}
+
+    @property
+    def next_args(self):
+        return {'page': self.page + 1} if self.has_next else {}
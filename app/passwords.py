@@ -0,0 +1,135 @@
+"""
+Хеширование паролей bcrypt с ограничением параллелизма.
+
+bcrypt нагружает CPU (~250 мс при стоимости 12), поэтому одновременно
+выполняется не больше PASSWORD_HASH_CONCURRENCY операций на весь сервер.
+Слоты - файлы с блокировкой flock, общие для всех воркеров Gunicorn:
+синхронный воркер всё равно ждёт результат, поэтому ограничивать нужно
+количество воркеров, занятых bcrypt, а не потоков внутри одного воркера.
+Если слот не освободился за PASSWORD_HASH_WAIT_TIMEOUT, операция отклоняется.
+"""
+import os
+import time
+import threading
+
+from flask import current_app
+
+from app import bcrypt
+
+try:
+    import fcntl
+except ImportError:  # Windows: ограничение только внутри процесса
+    fcntl = None
+
+
+class PasswordHasherBusy(Exception):
+    """Все слоты хеширования заняты дольше допустимого времени ожидания"""
+
+
+class PasswordHashExecutor:
+    """Выполняет операции bcrypt с ограничением одновременных операций"""
+
+    def __init__(self):
+        self._slot_dir = None
+        self._pid = None
+        self._slot_fds = []
+        self._local_slots = None
+        self._lock = threading.Lock()
+        self.concurrency = 2
+        self.wait_timeout = 5.0
+
+    def init_app(self, app):
+        self.concurrency = max(1, app.config.get('PASSWORD_HASH_CONCURRENCY', self.concurrency))
+        self.wait_timeout = app.config.get('PASSWORD_HASH_WAIT_TIMEOUT', self.wait_timeout)
+        slot_dir = app.config.get('PASSWORD_HASH_LOCK_DIR')
+        if not slot_dir:
+            slot_dir = os.path.join(app.instance_path, 'password_hash_slots')
+        os.makedirs(slot_dir, exist_ok=True)
+        self._slot_dir = slot_dir
+        self._pid = None
+
+    def _open_slots(self):
+        """
+        Открывает файлы слотов в текущем процессе: блокировка flock
+        не должна наследоваться от мастера, как и состояние семафора процесса.
+        """
+        for fd in self._slot_fds:
+            os.close(fd)
+        self._local_slots = threading.BoundedSemaphore(self.concurrency)
+        if fcntl is not None:
+            self._slot_fds = [
+                os.open(os.path.join(self._slot_dir, f'slot_{index}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+                for index in range(self.concurrency)
+            ]
+        self._pid = os.getpid()
+
+    def _try_acquire_slot(self):
+        for fd in self._slot_fds:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                continue
+        return None
+
+    def _acquire(self):
+        """Занимает слот процесса и слот сервера; возвращает дескриптор слота сервера"""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open_slots()
+        if not self._local_slots.acquire(timeout=self.wait_timeout):
+            raise PasswordHasherBusy()
+        if fcntl is None:
+            return None
+
+        while True:
+            fd = self._try_acquire_slot()
+            if fd is not None:
+                return fd
+            if time.monotonic() >= deadline:
+                self._local_slots.release()
+                raise PasswordHasherBusy()
+            time.sleep(0.01)
+
+    def _release(self, fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._local_slots.release()
+
+    def run(self, func, *args):
+        """Выполняет func(*args), заняв слот хеширования"""
+        if self._slot_dir is None:
+            # Расширение не инициализировано (например, вне приложения)
+            return func(*args)
+        fd = self._acquire()
+        try:
+            return func(*args)
+        finally:
+            self._release(fd)
+
+
+password_executor = PasswordHashExecutor()
+
+
+def hash_password(password):
+    """Возвращает bcrypt хеш пароля с текущей стоимостью BCRYPT_LOG_ROUNDS"""
+    return password_executor.run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def verify_password(password_hash, password):
+    """Проверяет пароль по bcrypt хешу"""
+    return password_executor.run(bcrypt.check_password_hash, password_hash, password)
+
+
+def hash_cost(password_hash):
+    """Стоимость (log rounds) из bcrypt хеша вида $2b$12$..., либо None"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    """Хеш создан с другой стоимостью, чем BCRYPT_LOG_ROUNDS"""
+    return hash_cost(password_hash) != current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
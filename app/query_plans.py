@@ -0,0 +1,212 @@
+"""
+Проверка планов запросов горячих страниц (только SQLite).
+
+Страницы запрашиваются через тестовый клиент, все выполненные SELECT
+перехватываются и прогоняются через EXPLAIN QUERY PLAN. Полный просмотр
+таблицы (SCAN <таблица> без индекса) считается ошибкой, кроме таблиц
+из ALLOWED_SCANS, которые читаются целиком намеренно, и просмотра
+в порядке целочисленного первичного ключа (SCAN <таблица> для запроса
+без WHERE с ORDER BY <таблица>.id и LIMIT - первая страница списка:
+чтение останавливается после LIMIT строк, временное B-дерево
+не строится). С условием WHERE такой просмотр читает все строки,
+не прошедшие фильтр, и считается ошибкой.
+Ответ страницы не 200 (например, перенаправление на вход) - тоже ошибка:
+запросы такой страницы не проверены.
+Команда: flask check_query_plans (код возврата 1 при ошибках).
+"""
+import re
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import has_app_context
+from sqlalchemy import event
+
+from app import db
+from app.pagination import encode_cursor, FORWARD
+
+# Таблицы, которые читаются целиком намеренно
+ALLOWED_SCANS = {
+    'categories': 'справочник из нескольких строк',
+    'content': 'загружается целиком в content_cache',
+}
+
+# Курсор "после последней строки": страница продолжения в keyset пагинации
+_LATEST_CURSOR = encode_cursor([datetime(9999, 1, 1), 2 ** 62], FORWARD)
+_ID_CURSOR = encode_cursor([0], FORWARD)
+
+_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS (\w+))?(.*)$')
+# Сортировка только по одному столбцу и LIMIT: ORDER BY <таблица>.<столбец> [ASC|DESC] LIMIT
+_ORDER_BY_KEY_RE = re.compile(r' ORDER BY (\w+)\.(\w+)(?: ASC| DESC)? LIMIT ')
+
+
+def _hot_routes():
+    """Маршруты для проверки: (роль или None для анонимного посетителя, URL)"""
+    from app.models import Product, BlogPost, Category, Order
+
+    product = Product.query.filter_by(is_active=True).first()
+    post = BlogPost.query.filter_by(is_published=True).first()
+    category = Category.query.first()
+    order = Order.query.first()
+
+    routes = [
+        (None, '/'),
+        (None, '/catalog'),
+        (None, f'/catalog?cursor={_ID_CURSOR}'),
+        (None, '/catalog?search=кожа'),
+        (None, '/blog'),
+        (None, f'/blog?cursor={_LATEST_CURSOR}'),
+        (None, '/about'),
+        (None, '/contact'),
+        (None, '/sitemap'),
+        ('user', '/user/orders'),
+        ('user', '/user/cart'),
+        ('admin', '/admin/'),
+        ('admin', '/admin/users'),
+        ('admin', '/admin/products'),
+        ('admin', '/admin/orders'),
+        ('admin', f'/admin/orders?cursor={_LATEST_CURSOR}'),
+        ('admin', '/admin/orders?status=pending'),
+        ('admin', '/admin/blog'),
+        ('admin', '/admin/messages'),
+        ('admin', f'/admin/messages?cursor={_LATEST_CURSOR}'),
+        ('admin', '/admin/messages?unread=true'),
+        ('admin', '/admin/jobs'),
+        ('admin', '/admin/jobs?status=failed'),
+    ]
+    if category:
+        routes.append((None, f'/catalog?category={category.slug}'))
+    if product:
+        routes.append((None, f'/product/{product.slug}'))
+    if post:
+        routes.append((None, f'/blog/{post.slug}'))
+    if order:
+        routes.append(('admin', f'/admin/orders/{order.id}'))
+    return routes
+
+
+@contextmanager
+def _capture_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'sqlite_master' not in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(statement, parameters):
+    """Строки EXPLAIN QUERY PLAN для запроса"""
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def _is_primary_key_page(table_name, alias, statement):
+    """
+    Запрос без условий - первая страница списка в порядке целочисленного
+    первичного ключа: SCAN по rowid останавливается после LIMIT строк.
+    """
+    if ' WHERE ' in statement:
+        return False
+    match = _ORDER_BY_KEY_RE.search(statement)
+    if not match or match.group(1) not in (table_name, alias):
+        return False
+    primary_key = list(db.metadata.tables[table_name].primary_key.columns)
+    return (len(primary_key) == 1 and isinstance(primary_key[0].type, db.Integer)
+            and match.group(2) == primary_key[0].name)
+
+
+def full_scans(plan, statement=''):
+    """Таблицы, которые план читает целиком без индекса"""
+    tables = set(db.metadata.tables)
+    statement = ' '.join(statement.split())
+    # Временное B-дерево: строки сортируются после чтения всей таблицы, LIMIT не помогает
+    sorted_after_scan = any('TEMP B-TREE' in detail for detail in plan)
+    scans = []
+    for detail in plan:
+        match = _SCAN_RE.match(detail)
+        if not match or match.group(1) not in tables or 'USING' in match.group(3):
+            continue
+        table_name, alias = match.group(1), match.group(2)
+        if not sorted_after_scan and _is_primary_key_page(table_name, alias, statement):
+            continue
+        scans.append(table_name)
+    return scans
+
+
+def _login(client, role):
+    from app.models import User, RoleEnum
+
+    user = User.query.filter_by(role=RoleEnum(role), is_active=True).first()
+    if user is None:
+        return False
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return True
+
+
+def check_query_plans(app, report=print):
+    """
+    Проверяет планы запросов горячих страниц; возвращает количество ошибок.
+    Каждый запрос тестового клиента должен получить собственный контекст
+    приложения (и собственный current_user): внутри активного контекста
+    (команда flask) проверка выполняется в пустом контексте contextvars.
+    """
+    from app.http_cache import page_cache
+
+    if has_app_context():
+        return contextvars.Context().run(check_query_plans, app, report)
+
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            report('Проверка планов запросов поддерживается только для SQLite')
+            return 0
+        routes = _hot_routes()
+
+    # Страницы должны выполнять запросы, а не отдаваться из кэша
+    page_cache.clear()
+    page_cache_ttl, page_cache.ttl = page_cache.ttl, 0
+
+    errors = 0
+    checked = set()
+    try:
+        for role, url in routes:
+            client = app.test_client()
+            with app.app_context():
+                if role and not _login(client, role):
+                    report(f'- {url}: нет пользователя с ролью {role}, пропущено')
+                    continue
+                engine = db.engine
+
+            with _capture_statements(engine) as statements:
+                response = client.get(url)
+            report(f'{url} [{role or "anonymous"}] -> {response.status_code}, запросов: {len(statements)}')
+            if response.status_code != 200:
+                # Перенаправление на вход или ошибка: запросы страницы не проверены
+                errors += 1
+                report('  ОЖИДАЛСЯ ОТВЕТ 200')
+
+            for statement, parameters in statements:
+                if statement in checked:
+                    continue
+                checked.add(statement)
+                with app.app_context():
+                    plan = explain(statement, parameters)
+                    unexpected = [table for table in full_scans(plan, statement) if table not in ALLOWED_SCANS]
+                if unexpected:
+                    errors += 1
+                    report(f'  ПОЛНЫЙ ПРОСМОТР {", ".join(unexpected)}:')
+                    report('    ' + ' '.join(statement.split()))
+                    for detail in plan:
+                        report(f'      {detail}')
+    finally:
+        page_cache.ttl = page_cache_ttl
+
+    return errors
@@ -0,0 +1,208 @@
+"""
+Индекс похожих товаров и статей.
+
+Связи рассчитываются заранее и хранятся в таблице related_items:
+- товары: та же категория + совместные покупки (OrderItem в одном заказе);
+- статьи: последние опубликованные статьи.
+Страницы читают список одним запросом по индексу (kind, source_id)
+и показывают случайную выборку из него.
+"""
+import random
+from collections import defaultdict
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import Product, BlogPost, OrderItem, RelatedItem
+
+# Сколько связей хранится для каждого объекта
+RELATED_LIMIT = 12
+
+# Веса для расчёта релевантности товара
+CATEGORY_WEIGHT = 1.0
+CO_PURCHASE_WEIGHT = 2.0
+
+
+def _replace_relations(kind, relations):
+    """Заменяет связи для перечисленных источников (без commit)"""
+    if not relations:
+        return
+    RelatedItem.query.filter(
+        RelatedItem.kind == kind,
+        RelatedItem.source_id.in_(list(relations.keys()))
+    ).delete(synchronize_session=False)
+
+    rows = [
+        {'kind': kind, 'source_id': source_id, 'target_id': target_id, 'score': score}
+        for source_id, targets in relations.items()
+        for target_id, score in targets
+    ]
+    if rows:
+        db.session.execute(insert(RelatedItem), rows)
+
+
+def _co_purchase_counts(product_ids):
+    """Количество заказов, в которых товары покупались вместе: {source: {target: n}}"""
+    first = aliased(OrderItem)
+    second = aliased(OrderItem)
+    rows = (db.session.query(first.product_id, second.product_id, func.count(func.distinct(first.order_id)))
+            .join(second, (second.order_id == first.order_id) & (second.product_id != first.product_id))
+            .filter(first.product_id.in_(product_ids))
+            .group_by(first.product_id, second.product_id)
+            .all())
+
+    counts = defaultdict(dict)
+    for source_id, target_id, count in rows:
+        counts[source_id][target_id] = count
+    return counts
+
+
+def refresh_products(product_ids):
+    """Пересчитывает похожие товары для перечисленных товаров (без commit)"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    sources = db.session.query(Product.id, Product.category_id).filter(Product.id.in_(product_ids)).all()
+    category_ids = {category_id for _, category_id in sources}
+
+    # Активные товары тех же категорий
+    members = defaultdict(list)
+    for product_id, category_id in (db.session.query(Product.id, Product.category_id)
+                                    .filter(Product.category_id.in_(category_ids), Product.is_active == True)
+                                    .all()):
+        members[category_id].append(product_id)
+
+    co_purchases = _co_purchase_counts(product_ids)
+    co_targets = {target for targets in co_purchases.values() for target in targets}
+    active_targets = set()
+    if co_targets:
+        active_targets = {row[0] for row in db.session.query(Product.id)
+                          .filter(Product.id.in_(co_targets), Product.is_active == True)}
+
+    relations = {}
+    for product_id, category_id in sources:
+        scores = {other: CATEGORY_WEIGHT for other in members[category_id] if other != product_id}
+        for target_id, count in co_purchases.get(product_id, {}).items():
+            if target_id in active_targets:
+                scores[target_id] = scores.get(target_id, 0) + CO_PURCHASE_WEIGHT * count
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:RELATED_LIMIT]
+        relations[product_id] = best
+
+    # Удаляем связи товаров, которых больше нет
+    missing = product_ids - {product_id for product_id, _ in sources}
+    for product_id in missing:
+        relations[product_id] = []
+
+    _replace_relations(RelatedItem.KIND_PRODUCT, relations)
+
+
+def refresh_categories(*category_ids):
+    """Пересчитывает похожие товары для всех товаров категорий (без commit)"""
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    if not category_ids:
+        return
+    product_ids = [row[0] for row in db.session.query(Product.id).filter(Product.category_id.in_(category_ids))]
+    refresh_products(product_ids)
+
+
+def remove_product(product_id):
+    """Удаляет товар из индекса как источник и как похожий товар (без commit)"""
+    RelatedItem.query.filter(
+        RelatedItem.kind == RelatedItem.KIND_PRODUCT,
+        (RelatedItem.source_id == product_id) | (RelatedItem.target_id == product_id)
+    ).delete(synchronize_session=False)
+
+
+def _post_relations(recent_ids, post_id):
+    """Связи статьи: последние опубликованные статьи, кроме неё самой"""
+    targets = [target_id for target_id in recent_ids if target_id != post_id][:RELATED_LIMIT]
+    return [(target_id, float(RELATED_LIMIT - position)) for position, target_id in enumerate(targets)]
+
+
+def _stored_relations(kind, source_ids):
+    """Сохранённые связи источников: {source: [(target, score), ...]} по убыванию score"""
+    stored = defaultdict(list)
+    for source_id, target_id, score in (db.session.query(RelatedItem.source_id, RelatedItem.target_id,
+                                                         RelatedItem.score)
+                                        .filter(RelatedItem.kind == kind, RelatedItem.source_id.in_(source_ids))
+                                        .order_by(RelatedItem.source_id, RelatedItem.score.desc())):
+        stored[source_id].append((target_id, score))
+    return stored
+
+
+def refresh_posts(post_ids=()):
+    """
+    Пересчитывает похожие статьи после изменения статей post_ids (без commit).
+
+    Список статьи - последние опубликованные статьи, поэтому у всех статей
+    вне последних RELATED_LIMIT + 1 он общий. Перезаписываются только
+    изменившиеся списки: изменённых статей, последних статей и - если общий
+    список изменился (опубликована новая статья) - всех остальных статей.
+    Общий список проверяется по одной статье вне последних.
+    """
+    post_ids = set(post_ids)
+    published = db.session.query(BlogPost.id).filter(BlogPost.is_published == True)
+    order = (BlogPost.created_at.desc(), BlogPost.id.desc())
+
+    recent_ids = [row[0] for row in published.order_by(*order).limit(RELATED_LIMIT + 1)]
+    representative = (published.filter(BlogPost.id.notin_(recent_ids + list(post_ids)))
+                      .order_by(*order).limit(1).scalar())
+
+    candidates = post_ids | set(recent_ids)
+    if representative is not None:
+        candidates.add(representative)
+    published_ids = {row[0] for row in published.filter(BlogPost.id.in_(candidates))}
+
+    stored = _stored_relations(RelatedItem.KIND_BLOG_POST, candidates)
+    relations = {}
+    for post_id in candidates:
+        expected = _post_relations(recent_ids, post_id) if post_id in published_ids else []
+        if stored.get(post_id, []) != expected:
+            relations[post_id] = expected
+
+    if representative in relations:
+        common = _post_relations(recent_ids, None)
+        for (post_id,) in published.filter(BlogPost.id.notin_(recent_ids)):
+            relations[post_id] = common
+
+    _replace_relations(RelatedItem.KIND_BLOG_POST, relations)
+
+
+def rebuild_related_index():
+    """Полностью пересчитывает индекс; возвращает количество связей"""
+    RelatedItem.query.delete(synchronize_session=False)
+    refresh_products([row[0] for row in db.session.query(Product.id)])
+    refresh_posts()
+    db.session.commit()
+    return RelatedItem.query.count()
+
+
+def _pick(items, count):
+    """Случайная выборка из предрассчитанного списка"""
+    if len(items) <= count:
+        return items
+    return random.sample(items, count)
+
+
+def get_related_products(product, count=4):
+    """Похожие товары: один запрос по индексу related_items"""
+    candidates = (Product.query
+                  .join(RelatedItem, RelatedItem.target_id == Product.id)
+                  .filter(RelatedItem.kind == RelatedItem.KIND_PRODUCT,
+                          RelatedItem.source_id == product.id,
+                          Product.is_active == True)
+                  .all())
+    return _pick(candidates, count)
+
+
+def get_related_posts(post, count=3):
+    """Похожие статьи: один запрос по индексу related_items"""
+    candidates = (BlogPost.query
+                  .join(RelatedItem, RelatedItem.target_id == BlogPost.id)
+                  .filter(RelatedItem.kind == RelatedItem.KIND_BLOG_POST,
+                          RelatedItem.source_id == post.id,
+                          BlogPost.is_published == True)
+                  .all())
+    return _pick(candidates, count)
@@ -1,24 +1,49 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, abort
-from app.models import Product, Category, BlogPost, Content, HeroSlide
+from app.models import Product, Category, BlogPost, HeroSlide
 from app import db, get_client_ip
-from sqlalchemy import or_, func
+from app.cache import content_cache
+from app.db_routing import read_replica
+from app.http_cache import PageVersion, not_modified, conditional_page, page_cache
+from app.pagination import keyset_paginate, OffsetPage
+from app.view_counter import view_counter
+from app.search import search_products
+from app.related import get_related_products, get_related_posts
+from app.storage import media_storage
 import logging
 
 main = Blueprint('main', __name__)
 
+
+def _featured_products_query():
+    return Product.query.filter_by(is_active=True).order_by(Product.views_count.desc()).limit(6)
+
+
 @main.route('/')
+@read_replica
+@page_cache.cached('hero_slide', 'product', 'blog_post')
+@conditional_page
 def index():
     """ Главная страница """
+    def version():
+        # Популярные товары зависят от просмотров, которые не публикуются в cache_bus
+        return (PageVersion()
+                .add_namespaces('hero_slide', 'product', 'blog_post')
+                .add([row[0] for row in _featured_products_query().with_entities(Product.id)]))
+
+    response = not_modified(version)
+    if response is not None:
+        return response
+
     # Получаем слайды Hero
     hero_slides = HeroSlide.query.filter_by(is_active=True).order_by(HeroSlide.order, HeroSlide.id).all()
 
     # Получаем блок УТП - уникальное торговое предложение
-    usp_first = Content.query.filter_by(key='usp_first').first()
-    usp_second = Content.query.filter_by(key='usp_second').first()
-    usp_third = Content.query.filter_by(key='usp_third').first()
+    usp_first = content_cache.get('usp_first')
+    usp_second = content_cache.get('usp_second')
+    usp_third = content_cache.get('usp_third')
 
     # Получаем популярные товары
-    featured_products = Product.query.filter_by(is_active=True).order_by(Product.views_count.desc()).limit(6).all()
+    featured_products = _featured_products_query().all()
 
     # Получаем последние статьи в блоге
     recent_posts = BlogPost.query.filter_by(is_published=True).order_by(BlogPost.created_at.desc()).limit(3).all()
@@ -33,11 +58,17 @@ def index():
 
 
 @main.route('/catalog')
+@read_replica
+@page_cache.cached('product', 'category', query_args={'category': str, 'search': str, 'page': int, 'cursor': str})
+@conditional_page
 def catalog():
     """Каталог товаров"""
+    response = not_modified(lambda: PageVersion().add_namespaces('product', 'category'))
+    if response is not None:
+        return response
+
     category_slug = request.args.get('category')
     search_query = request.args.get('search', '')
-    page = request.args.get('page', 1, type=int)
     per_page = 12
 
     query = Product.query.filter_by(is_active=True)
@@ -48,14 +79,12 @@ def catalog():
             query = query.filter_by(category_id=category.id)
 
     if search_query:
-        query = query.filter(
-            or_(
-                Product.name.ilike(f'%{search_query}%'),
-                Product.description.ilike(f'%{search_query}%')
-            )
-        )
-
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        # Полнотекстовый поиск с сортировкой по релевантности: у ранга нет
+        # уникального ключа, поэтому результаты поиска листаются по номеру страницы
+        query = search_products(query, search_query)
+        pagination = OffsetPage(query, request.args.get('page', 1, type=int), per_page)
+    else:
+        pagination = keyset_paginate(query, [Product.id], per_page)
     products = pagination.items
 
     categories = Category.query.all()
@@ -69,20 +98,22 @@ def catalog():
 
 
 @main.route('/product/<slug>')
+@read_replica
+@conditional_page
 def product_detail(slug):
     """Страница товара"""
     product = Product.query.filter_by(slug=slug, is_active=True).first_or_404()
 
-    # Увеличиваем счетчик просмотров
-    product.views_count += 1
-    db.session.commit()
+    # Учитываем просмотр (запись в БД выполняется пачками)
+    view_counter.hit(Product, product.id)
+
+    # Все товары: от них зависят похожие товары
+    response = not_modified(lambda: PageVersion().add_namespaces('product', 'category'))
+    if response is not None:
+        return response
 
-    # 4 случайных товара из той же категории
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id,
-        Product.id != product.id,
-        Product.is_active == True
-    ).order_by(func.random()).limit(4).all()
+    # 4 похожих товара из предрассчитанного индекса
+    related_products = get_related_products(product, count=4)
 
     return render_template('product_detail.html',
                            product=product,
@@ -90,14 +121,19 @@ def product_detail(slug):
 
 
 @main.route('/blog')
+@read_replica
+@page_cache.cached('blog_post', query_args={'cursor': str})
+@conditional_page
 def blog():
     """Список статей блога"""
-    page = request.args.get('page', 1, type=int)
+    response = not_modified(lambda: PageVersion().add_namespaces('blog_post'))
+    if response is not None:
+        return response
+
     per_page = 9  # Не более 9 статей на странице
 
-    pagination = BlogPost.query.filter_by(is_published=True) \
-        .order_by(BlogPost.created_at.desc()) \
-        .paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(BlogPost.query.filter_by(is_published=True),
+                                 [BlogPost.created_at, BlogPost.id], per_page, descending=True)
 
     posts = pagination.items
 
@@ -105,48 +141,67 @@ def blog():
 
 
 @main.route('/blog/<slug>')
+@read_replica
+@conditional_page
 def blog_post(slug):
     """Страница статьи блога"""
     post = BlogPost.query.filter_by(slug=slug, is_published=True).first_or_404()
 
-    # Увеличиваем счетчик просмотров
-    post.views_count += 1
-    db.session.commit()
+    # Учитываем просмотр (запись в БД выполняется пачками)
+    view_counter.hit(BlogPost, post.id)
+
+    # Счётчик просмотров выводится на странице, но не публикуется в cache_bus
+    response = not_modified(lambda: PageVersion().add_namespaces('blog_post').add(post.views_count))
+    if response is not None:
+        return response
 
-    # Получаем 3 случайные опубликованные статьи (исключая текущую)
-    related_posts = BlogPost.query.filter(
-        BlogPost.id != post.id,
-        BlogPost.is_published == True
-    ).order_by(func.random()).limit(3).all()
+    # 3 похожие статьи из предрассчитанного индекса
+    related_posts = get_related_posts(post, count=3)
 
     return render_template('blog_post.html', post=post, related_posts=related_posts)
 
 
 @main.route('/about')
+@read_replica
+@conditional_page
 def about():
     """О компании"""
-    about_content = Content.query.filter_by(key='about_content').first()
+    response = not_modified(PageVersion)
+    if response is not None:
+        return response
+
+    about_content = content_cache.get('about_content')
     stats = {
-        'years': Content.query.filter_by(key='stats_years').first(),
-        'masters': Content.query.filter_by(key='stats_masters').first(),
-        'countries': Content.query.filter_by(key='stats_countries').first()
+        'years': content_cache.get('stats_years'),
+        'masters': content_cache.get('stats_masters'),
+        'countries': content_cache.get('stats_countries')
     }
 
     # Получаем изображения
     about_images = []
     for i in range(1, 5):
-        img_content = Content.query.filter_by(key=f'about_image_{i}').first()
+        img_content = content_cache.get(f'about_image_{i}')
         if img_content and img_content.content:
             if img_content.content.startswith('http'):
                 about_images.append(img_content.content)
             else:
-                about_images.append(url_for('static', filename=f'uploads/{img_content.content}'))
+                about_images.append(media_storage.url(img_content.content))
         else:
             about_images.append(None)
 
     return render_template('about.html', about_content=about_content, stats=stats, about_images=about_images)
 
 
+def _get_contact_info():
+    """Контактные данные для страницы Contact (из кэша контента)"""
+    return {
+        'address': content_cache.get('contact_address'),
+        'phone': content_cache.get('contact_phone'),
+        'email': content_cache.get('contact_email'),
+        'hours': content_cache.get('contact_hours')
+    }
+
+
 @main.route('/contact', methods=['GET', 'POST'])
 def contact():
     """Контакты"""
@@ -159,13 +214,7 @@ def contact():
         # Валидация
         if not all([name, email, message]):
             flash('Пожалуйста, заполните все обязательные поля', 'error')
-            contact_info = {
-                'address': Content.query.filter_by(key='contact_address').first(),
-                'phone': Content.query.filter_by(key='contact_phone').first(),
-                'email': Content.query.filter_by(key='contact_email').first(),
-                'hours': Content.query.filter_by(key='contact_hours').first()
-            }
-            return render_template('contact.html', contact_info=contact_info)
+            return render_template('contact.html', contact_info=_get_contact_info())
 
         # Сохранение обращения в БД
         from app.models import ContactMessage
@@ -210,18 +259,17 @@ def contact():
             )
             flash('Произошла ошибка при отправке сообщения. Попробуйте позже.', 'error')
 
-    contact_info = {
-        'address': Content.query.filter_by(key='contact_address').first(),
-        'phone': Content.query.filter_by(key='contact_phone').first(),
-        'email': Content.query.filter_by(key='contact_email').first(),
-        'hours': Content.query.filter_by(key='contact_hours').first()
-    }
-
-    return render_template('contact.html', contact_info=contact_info)
+    return render_template('contact.html', contact_info=_get_contact_info())
 
 @main.route('/sitemap')
+@read_replica
+@conditional_page
 def sitemap():
     """Карта сайта"""
+    response = not_modified(lambda: PageVersion().add_namespaces('product', 'blog_post', 'category'))
+    if response is not None:
+        return response
+
     categories = Category.query.all()
     products = Product.query.filter_by(is_active=True).all()
     posts = BlogPost.query.filter_by(is_published=True).all()
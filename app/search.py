@@ -0,0 +1,198 @@
+"""
+Полнотекстовый поиск по каталогу товаров.
+
+SQLite: виртуальная таблица FTS5 products_fts (rowid = products.id),
+синхронизируется обработчиками админки в той же транзакции.
+PostgreSQL: GIN индекс по выражению to_tsvector(...), который СУБД
+поддерживает сама. Для остальных СУБД используется поиск через ILIKE.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import or_, false, text, literal_column, table, column
+
+from app import db
+from app.models import Product
+
+# Максимальное количество слов из поискового запроса
+MAX_SEARCH_TERMS = 10
+
+
+def extract_search_terms(search_query):
+    """Разбивает поисковый запрос на слова без служебных символов"""
+    return re.findall(r'\w+', search_query or '')[:MAX_SEARCH_TERMS]
+
+
+class LikeSearchBackend:
+    """Поиск через ILIKE (без индекса и без ранжирования)"""
+
+    name = 'like'
+
+    def ensure_schema(self):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def apply(self, query, search_query):
+        return query.filter(
+            or_(
+                Product.name.ilike(f'%{search_query}%'),
+                Product.description.ilike(f'%{search_query}%')
+            )
+        )
+
+
+class SQLiteSearchBackend(LikeSearchBackend):
+    """Поиск через SQLite FTS5 с ранжированием bm25"""
+
+    name = 'sqlite_fts5'
+
+    fts = table('products_fts', column('rowid'))
+
+    def __init__(self):
+        self._ready = False
+
+    def is_ready(self):
+        """Проверяет, что таблица FTS создана (результат кэшируется после создания)"""
+        if not self._ready:
+            self._ready = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+            ).first() is not None
+        return self._ready
+
+    def ensure_schema(self):
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+            "USING fts5(name, short_description, description, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        self._ready = True
+
+    def rebuild(self):
+        self.ensure_schema()
+        db.session.execute(text("DELETE FROM products_fts"))
+        result = db.session.execute(text(
+            "INSERT INTO products_fts (rowid, name, short_description, description) "
+            "SELECT id, name, coalesce(short_description, ''), coalesce(description, '') FROM products"
+        ))
+        return result.rowcount
+
+    def index_product(self, product):
+        if not self.is_ready():
+            return
+        # Нужен id нового товара
+        db.session.flush()
+        self.remove_product(product.id)
+        db.session.execute(
+            text(
+                "INSERT INTO products_fts (rowid, name, short_description, description) "
+                "VALUES (:id, :name, :short_description, :description)"
+            ),
+            {
+                'id': product.id,
+                'name': product.name or '',
+                'short_description': product.short_description or '',
+                'description': product.description or ''
+            }
+        )
+
+    def remove_product(self, product_id):
+        if not self.is_ready():
+            return
+        db.session.execute(text("DELETE FROM products_fts WHERE rowid = :id"), {'id': product_id})
+
+    def apply(self, query, search_query):
+        if not self.is_ready():
+            return super().apply(query, search_query)
+
+        terms = extract_search_terms(search_query)
+        if not terms:
+            return query.filter(false())
+
+        # Каждое слово ищется по префиксу: "кож"* найдёт "кожаный"
+        match_query = ' '.join(f'"{term}"*' for term in terms)
+        return (query
+                .join(self.fts, self.fts.c.rowid == Product.id)
+                .filter(literal_column('products_fts').match(match_query))
+                # Веса столбцов: название, краткое описание, описание
+                .order_by(text('bm25(products_fts, 10.0, 4.0, 1.0)'), Product.id))
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """Поиск через tsvector/tsquery PostgreSQL с ранжированием ts_rank"""
+
+    name = 'postgresql_tsvector'
+
+    def _vector_sql(self):
+        # Выражение должно совпадать с выражением индекса, иначе индекс не будет использован
+        language = current_app.config.get('SEARCH_LANGUAGE', 'russian')
+        return (
+            f"to_tsvector('{language}', coalesce(products.name, '') || ' ' || "
+            f"coalesce(products.short_description, '') || ' ' || coalesce(products.description, ''))"
+        )
+
+    def ensure_schema(self):
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_products_search ON products USING GIN (({self._vector_sql()}))"
+        ))
+
+    def rebuild(self):
+        db.session.execute(text("DROP INDEX IF EXISTS ix_products_search"))
+        self.ensure_schema()
+        return db.session.query(Product).count()
+
+    def apply(self, query, search_query):
+        terms = extract_search_terms(search_query)
+        if not terms:
+            return query.filter(false())
+
+        language = current_app.config.get('SEARCH_LANGUAGE', 'russian')
+        vector = literal_column(self._vector_sql())
+        ts_query = db.func.to_tsquery(literal_column(f"'{language}'"), ' & '.join(f'{term}:*' for term in terms))
+        return (query
+                .filter(vector.op('@@')(ts_query))
+                .order_by(db.func.ts_rank(vector, ts_query).desc(), Product.id))
+
+
+_backends = {}
+
+
+def get_search_backend():
+    """Возвращает поисковый backend для текущей СУБД"""
+    dialect = db.engine.dialect.name
+    if dialect not in _backends:
+        if dialect == 'sqlite':
+            _backends[dialect] = SQLiteSearchBackend()
+        elif dialect == 'postgresql':
+            _backends[dialect] = PostgresSearchBackend()
+        else:
+            _backends[dialect] = LikeSearchBackend()
+    return _backends[dialect]
+
+
+def search_products(query, search_query):
+    """Добавляет к запросу товаров условие поиска с сортировкой по релевантности"""
+    return get_search_backend().apply(query, search_query)
+
+
+def index_product(product):
+    """Обновляет товар в поисковом индексе (вызывать до commit)"""
+    get_search_backend().index_product(product)
+
+
+def remove_product(product_id):
+    """Удаляет товар из поискового индекса (вызывать до commit)"""
+    get_search_backend().remove_product(product_id)
+
+
+def rebuild_search_index():
+    """Пересоздаёт поисковый индекс; возвращает количество проиндексированных товаров"""
+    count = get_search_backend().rebuild()
+    db.session.commit()
+    return count
@@ -0,0 +1,79 @@
+"""
+Профиль SQLite для продакшена (SQLITE_PROFILE = 'production').
+
+С настройками по умолчанию SQLite работает в режиме rollback journal:
+запись блокирует базу и для читателей, и под нагрузкой нескольких воркеров
+Gunicorn запросы получают "database is locked". Профиль включает:
+- journal_mode=WAL - читатели не блокируются писателем, писатель - читателями;
+- synchronous=NORMAL - fsync только при checkpoint (в режиме WAL база
+  остаётся целостной, при сбое питания теряются лишь последние транзакции);
+- busy_timeout - ожидание блокировки вместо немедленной ошибки;
+- mmap_size, cache_size, temp_store - чтение через отображение в память
+  и больший кэш страниц на соединение;
+- ограниченный пул соединений на процесс (воркер использует одно
+  соединение на запрос и одно для фоновых потоков).
+
+Параметры пула задаются до создания движка (configure_engine_options),
+PRAGMA выполняются при каждом новом соединении (register_pragmas).
+Для других СУБД и базы в памяти профиль не применяется.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app import db
+
+PRODUCTION = 'production'
+
+
+def _is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _enabled(app):
+    return app.config.get('SQLITE_PROFILE', PRODUCTION) == PRODUCTION
+
+
+def configure_engine_options(app):
+    """Параметры пула соединений для файловой SQLite (вызывается до db.init_app)"""
+    if not _enabled(app) or not _is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 2))
+    options.setdefault('max_overflow', app.config.get('SQLITE_POOL_MAX_OVERFLOW', 4))
+    options.setdefault('pool_timeout', app.config.get('SQLITE_POOL_TIMEOUT', 10))
+    # Ожидание блокировки на уровне драйвера (сек) совпадает с busy_timeout
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('timeout', app.config.get('SQLITE_BUSY_TIMEOUT', 5000) / 1000)
+
+
+def sqlite_pragmas(app):
+    """PRAGMA профиля в порядке выполнения"""
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(app.config.get('SQLITE_BUSY_TIMEOUT', 5000))),
+        ('mmap_size', int(app.config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+        ('cache_size', int(app.config.get('SQLITE_CACHE_SIZE', -64000))),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def register_pragmas(app):
+    """Выполнение PRAGMA при каждом новом соединении (вызывается после db.init_app)"""
+    if not _enabled(app):
+        return
+    pragmas = sqlite_pragmas(app)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if _is_sqlite_file(engine.url):
+                event.listen(engine, 'connect', on_connect)
@@ -0,0 +1,219 @@
+"""
+Хранилище загруженных файлов (изображений и их вариантов).
+
+Backend выбирается настройкой MEDIA_STORAGE:
+- local - папка app/static/<UPLOAD_FOLDER>, файлы отдаёт Flask или Nginx;
+- s3 - бакет S3-совместимого хранилища (AWS S3, MinIO, Yandex Object
+  Storage, ...), файлы отдаёт хранилище или CDN (MEDIA_URL). Все серверы
+  приложения за балансировщиком видят одни и те же файлы.
+
+URL файла строится из имени без обращения к хранилищу (media_url в шаблонах).
+Воркер обрабатывает изображения через локальную копию (local_path):
+для local это сам файл, для s3 - временный файл.
+
+boto3 - необязательная зависимость, нужна только для MEDIA_STORAGE=s3.
+"""
+import os
+import mimetypes
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Необязательная зависимость: хранилище S3
+    boto3 = None
+
+
+class LocalStorage:
+    """Файлы в папке static приложения"""
+
+    name = 'local'
+
+    def __init__(self, app):
+        folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+        self.directory = os.path.join(app.root_path, 'static', folder)
+        self.base_url = f'{app.static_url_path}/{folder}'
+        # Временные файлы в той же папке: перенос - атомарное переименование
+        self.temp_dir = self.directory
+
+    def url(self, name):
+        return f'{self.base_url}/{name}'
+
+    def save(self, name, path, immutable=True):
+        """Переносит локальный файл path в хранилище под именем name (заголовки кэша - по имени, app/uploads.py)"""
+        os.replace(path, os.path.join(self.directory, name))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def delete(self, name):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @contextmanager
+    def local_path(self, name):
+        """Путь к файлу в локальной файловой системе"""
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(name)
+        yield path
+
+    def list(self):
+        """Файлы хранилища: (имя, размер, время изменения)"""
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                yield entry.name, stat.st_size, stat.st_mtime
+
+
+class S3Storage:
+    """Файлы в бакете S3-совместимого хранилища"""
+
+    name = 's3'
+
+    def __init__(self, app):
+        if boto3 is None:
+            raise RuntimeError('boto3 не установлен: pip install boto3')
+        config = app.config
+        self.bucket = config['S3_BUCKET']
+        self.prefix = config.get('S3_PREFIX', '')
+        self.endpoint_url = config.get('S3_ENDPOINT_URL') or None
+        self.client_options = {
+            'endpoint_url': self.endpoint_url,
+            'region_name': config.get('S3_REGION') or None,
+            'aws_access_key_id': config.get('S3_ACCESS_KEY_ID') or None,
+            'aws_secret_access_key': config.get('S3_SECRET_ACCESS_KEY') or None,
+        }
+        if config.get('MEDIA_URL'):
+            self.base_url = config['MEDIA_URL'].rstrip('/')
+        elif self.endpoint_url:
+            self.base_url = f'{self.endpoint_url.rstrip("/")}/{self.bucket}'
+        else:
+            self.base_url = f'https://{self.bucket}.s3.amazonaws.com'
+        # Имена файлов по хешу содержимого (app/uploads.py): содержимое по имени не меняется
+        self.cache_control = f'public, max-age={config.get("UPLOAD_CACHE_MAX_AGE", 31536000)}, immutable'
+        # ACL загружаемых объектов ('public-read'); по умолчанию доступ задаёт политика бакета
+        self.acl = config.get('S3_ACL') or None
+        self.temp_dir = None
+        self._client = None
+        self._client_pid = None
+
+    @property
+    def client(self):
+        # Клиент создаётся в каждом процессе: пул соединений не переживает fork (preload Gunicorn)
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = boto3.client('s3', **self.client_options)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _key(self, name):
+        return f'{self.prefix}{name}'
+
+    def url(self, name):
+        return f'{self.base_url}/{self._key(name)}'
+
+    def save(self, name, path, immutable=True):
+        """
+        Загружает локальный файл path в бакет под именем name; локальный файл
+        удаляется. immutable=False - временное имя, объект без долгого кэша.
+        """
+        extra_args = {
+            'ContentType': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'CacheControl': self.cache_control if immutable else 'no-cache',
+        }
+        if self.acl:
+            extra_args['ACL'] = self.acl
+        self.client.upload_file(path, self.bucket, self._key(name), ExtraArgs=extra_args)
+        os.remove(path)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    @contextmanager
+    def local_path(self, name):
+        """Временная локальная копия файла"""
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+        os.close(fd)
+        try:
+            try:
+                self.client.download_file(self.bucket, self._key(name), path)
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    raise FileNotFoundError(name) from e
+                raise
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def list(self):
+        """Файлы хранилища: (имя, размер, время изменения)"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['Size'], item['LastModified'].timestamp()
+
+
+STORAGE_BACKENDS = {
+    LocalStorage.name: LocalStorage,
+    S3Storage.name: S3Storage,
+}
+
+
+class MediaStorage:
+    """Хранилище загрузок приложения поверх выбранного backend"""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        name = app.config.get('MEDIA_STORAGE', LocalStorage.name)
+        if name not in STORAGE_BACKENDS:
+            raise ValueError(f'Unknown MEDIA_STORAGE: {name}')
+        self.backend = STORAGE_BACKENDS[name](app)
+        app.jinja_env.globals['media_url'] = self.url
+
+    @property
+    def temp_dir(self):
+        """Папка временных файлов загрузок (None - системная)"""
+        return self.backend.temp_dir
+
+    def url(self, name):
+        """Публичный URL файла (без обращения к хранилищу)"""
+        return self.backend.url(name)
+
+    def save(self, name, path, immutable=True):
+        """
+        Переносит локальный файл path в хранилище (исходный файл не остаётся).
+        immutable=False - содержимое под этим именем может быть заменено, файл не кэшируется надолго.
+        """
+        self.backend.save(name, path, immutable=immutable)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def delete(self, name):
+        self.backend.delete(name)
+
+    def local_path(self, name):
+        """Контекстный менеджер: путь к локальной копии файла (FileNotFoundError, если файла нет)"""
+        return self.backend.local_path(name)
+
+    def list(self):
+        return self.backend.list()
+
+
+media_storage = MediaStorage()
@@ -0,0 +1,454 @@
+"""
+Хранилище загруженных файлов по хешу содержимого.
+
+Файл сохраняется под именем <sha256>.<расширение>: хеш считается
+по ходу записи загрузки во временный файл, поэтому повторная загрузка
+того же изображения не создаёт копию, а одновременные загрузки не
+перезаписывают друг друга. Содержимое по имени не меняется, и
+файлы отдаются с Cache-Control: immutable. Где лежат файлы - решает
+хранилище (app/storage.py: локальная папка или S3).
+
+JPEG/PNG с метаданными (EXIF, координаты GPS, XMP) сохраняется под
+временным именем <sha256>.pending.<ext> без долгого кэша: воркер
+(process_image -> publish_upload) удаляет метаданные и переводит ссылки
+на очищенный файл с именем по его хешу. Изображение в запросе
+не декодируется.
+
+Файлы multipart запроса пишутся сразу во временную папку хранилища
+(UploadRequest -> UploadStream) блоками парсера Werkzeug: тип определяется
+по первым байтам, размер проверяется по лимиту типа (UPLOAD_MAX_SIZES),
+хеш считается по ходу записи. save_uploaded_file только переносит готовый
+файл в хранилище (для local - переименование), в памяти процесса - не больше
+одного блока на загрузку.
+
+Таблица uploads хранит счётчик ссылок (товары, статьи, слайды, изображения
+страницы About):
+    save_uploaded_file  - сохраняет файл, +1 ссылка
+    release_upload      - -1 ссылка; на последней ставится задача delete_upload
+Файлы удаляются воркером (delete_upload) только если за это время
+на них не появилось новых ссылок. flask reindex_uploads переименовывает
+файлы со старыми именами, пересчитывает счётчики и удаляет файлы без ссылок.
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from collections import Counter
+
+from flask import Request, current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy import select, update, delete
+
+from app import db
+from app.jobs import enqueue
+from app.models import Upload, Product, BlogPost, HeroSlide, Content, utcnow
+from app.storage import media_storage
+from app.utils import allowed_file, insert_or_increment
+
+# <sha256>.<ext> и варианты <sha256>_<вариант>.<ext> (app/images.py)
+UPLOAD_NAME_RE = re.compile(r'^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$')
+# Загрузка с метаданными до очистки воркером (отдаётся без immutable)
+PENDING_NAME_RE = re.compile(r'^[0-9a-f]{64}\.pending\.[a-z0-9]+$')
+PENDING_SUFFIX = '.pending'
+CHUNK_SIZE = 64 * 1024
+# Одинаковые форматы с разными расширениями хранятся под одним именем
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+# Сигнатуры форматов (первые байты файла) и расширения сохранённых файлов
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+SIGNATURE_LENGTH = 12  # WebP: RIFF <размер> WEBP
+IMAGE_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp'}
+
+# Модели со столбцом image_file
+IMAGE_FILE_MODELS = (Product, BlogPost, HeroSlide)
+# Изображения страницы About хранятся в Content
+CONTENT_IMAGE_KEYS = 'about_image_%'
+
+
+def _extension(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return EXTENSION_ALIASES.get(ext, ext)
+
+
+def is_pending_upload(filename):
+    """Загрузка с метаданными, которую ещё не очистил воркер"""
+    return bool(filename and PENDING_NAME_RE.match(filename))
+
+
+def _file_sha256(path):
+    """SHA-256 файла блоками по CHUNK_SIZE (hashlib.file_digest есть только с Python 3.11)"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def acquire_upload(filename, size):
+    """
+    Увеличивает счётчик ссылок на файл (строка создаётся при первой ссылке).
+    Одна вставка с обновлением при конфликте: одновременные первые загрузки
+    одного файла не падают на уникальном имени.
+    """
+    insert_or_increment(Upload.__table__, {'filename': filename}, 'ref_count', 1, size=size, created_at=utcnow())
+
+
+def detect_image_type(head):
+    """Тип изображения по первым байтам файла или None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+class UploadStream:
+    """
+    Загружаемый файл во временном файле (directory - папка временных
+    файлов хранилища, None - системная). Тип по сигнатуре,
+    размер и SHA-256 вычисляются при записи; файл не изображение на диск
+    не пишется, превышение лимита типа прерывает запрос с кодом 413.
+    """
+
+    def __init__(self, directory, max_sizes):
+        self.directory = directory
+        self.max_sizes = max_sizes
+        self.path = None
+        self.kind = None
+        self.size = 0
+        self.rejected = False
+        self._head = b''
+        self._hasher = hashlib.sha256()
+        self._file = None
+
+    def write(self, data):
+        if self.rejected:
+            return len(data)
+        if self.kind is None:
+            # Начало файла копится до длины сигнатуры
+            self._head += data
+            if len(self._head) >= SIGNATURE_LENGTH:
+                self._start()
+        else:
+            self._append(data)
+        return len(data)
+
+    def _start(self):
+        head, self._head = self._head, b''
+        self.kind = detect_image_type(head)
+        if self.kind is None:
+            self.rejected = True
+            return
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._append(head)
+
+    def _append(self, data):
+        self.size += len(data)
+        max_size = self.max_sizes.get(self.kind)
+        if max_size and self.size > max_size:
+            self.close()
+            raise RequestEntityTooLarge(f'Файл {self.kind.upper()} больше {max_size // (1024 * 1024)} МБ')
+        self._hasher.update(data)
+        self._file.write(data)
+
+    def finish(self):
+        """Завершает запись (файл короче сигнатуры проверяется по полученным байтам); возвращает тип или None"""
+        if self.kind is None and not self.rejected:
+            self._start()
+        if self._file is not None:
+            self._file.flush()
+        return self.kind
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def store(self, name, immutable=True):
+        """Переносит файл в хранилище под именем name"""
+        media_storage.save(name, self.path, immutable=immutable)
+        self.path = None
+
+    # Чтение - из записанного файла (Werkzeug вызывает seek(0) после записи)
+    def seek(self, offset, whence=0):
+        self.finish()
+        return self._file.seek(offset, whence) if self._file is not None else 0
+
+    def tell(self):
+        return self._file.tell() if self._file is not None else 0
+
+    def read(self, size=-1):
+        return self._file.read(size) if self._file is not None else b''
+
+    def readline(self, size=-1):
+        return self._file.readline(size) if self._file is not None else b''
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        """Закрывает файл; не перенесённый временный файл удаляется"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadRequest(Request):
+    """Запрос, файлы которого пишутся сразу во временную папку хранилища (UploadStream)"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = UploadStream(media_storage.temp_dir, current_app.config.get('UPLOAD_MAX_SIZES', {}))
+        # Закрываются в close(), даже если разбор формы прерван (413)
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.pop('_upload_streams', []):
+            stream.close()
+
+
+def save_uploaded_file(file):
+    """
+    Сохраняет загруженное изображение под именем по хешу содержимого
+    и добавляет ссылку на него (в текущей транзакции). Файл с метаданными
+    получает временное имя <sha256>.pending.<ext>: его очищает воркер
+    (process_image). Возвращает имя файла или None (расширение не разрешено,
+    содержимое не PNG/JPEG/GIF/WebP).
+    """
+    from app.images import has_metadata
+
+    if not (file and allowed_file(file.filename)):
+        return None
+    stream = file.stream
+    copied = not isinstance(stream, UploadStream)
+    if copied:
+        # Файл не из UploadRequest: копируется блоками
+        stream = UploadStream(media_storage.temp_dir, current_app.config.get('UPLOAD_MAX_SIZES', {}))
+        try:
+            shutil.copyfileobj(file.stream, stream, CHUNK_SIZE)
+        except Exception:
+            stream.close()
+            raise
+    try:
+        kind = stream.finish()
+        if kind is None:
+            logging.getLogger('app.errors').warning(
+                f"Upload rejected: {file.filename} is not an image",
+                extra={'action': 'upload', 'status': 'error'}
+            )
+            return None
+        # Только заголовки: изображение декодирует воркер
+        pending = has_metadata(stream.path)
+        filename = f'{stream.hexdigest()}{PENDING_SUFFIX if pending else ""}{IMAGE_EXTENSIONS[kind]}'
+
+        # Сначала ссылка: блокировка записи в БД не даёт delete_upload
+        # удалить файл между проверкой и переносом
+        acquire_upload(filename, stream.size)
+        if not media_storage.exists(filename):
+            stream.store(filename, immutable=not pending)
+        return filename
+    finally:
+        if copied:
+            stream.close()
+
+
+def release_upload(filename):
+    """
+    Убирает ссылку на файл (в текущей транзакции). После последней ссылки
+    ставит задачу delete_upload: файл удаляется после commit.
+    """
+    if not filename or filename.startswith(('http://', 'https://')):
+        return
+    table = Upload.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.filename == filename, table.c.ref_count > 0)
+        .values(ref_count=table.c.ref_count - 1)
+    )
+    remaining = db.session.execute(select(table.c.ref_count).where(table.c.filename == filename)).scalar()
+    if remaining == 0:
+        enqueue('delete_upload', filename=filename)
+
+
+def publish_upload(filename, references):
+    """
+    Удаляет метаданные из загрузки <sha256>.pending.<ext> и переводит ссылки
+    references (запись, имя атрибута) на очищенный файл с именем по его хешу
+    (в текущей транзакции). Ссылки, изменённые за время очистки, не трогаются.
+    Возвращает новое имя или None (ссылок не осталось, файл не читается
+    как изображение - остаётся под временным именем).
+    """
+    from app.images import strip_metadata
+
+    with media_storage.local_path(filename) as source:
+        stripped_path = strip_metadata(source)
+    if stripped_path is None:
+        return None
+    try:
+        new_filename = f'{_file_sha256(stripped_path).hexdigest()}{_extension(filename)}'
+        size = os.path.getsize(stripped_path)
+        moved = 0
+        for item, attribute in references:
+            db.session.refresh(item, with_for_update=True)
+            if getattr(item, attribute) != filename:
+                continue
+            # Сначала ссылка: блокировка записи в БД не даёт delete_upload
+            # удалить файл между проверкой и переносом
+            acquire_upload(new_filename, size)
+            release_upload(filename)
+            setattr(item, attribute, new_filename)
+            moved += 1
+        if moved and not media_storage.exists(new_filename):
+            media_storage.save(new_filename, stripped_path)
+    finally:
+        if os.path.exists(stripped_path):
+            os.remove(stripped_path)
+    return new_filename if moved else None
+
+
+def content_image_references(filename):
+    """Изображения страницы About, ссылающиеся на файл: (запись, имя атрибута)"""
+    items = Content.query.filter(Content.key.like(CONTENT_IMAGE_KEYS), Content.content == filename)
+    return [(item, 'content') for item in items]
+
+
+def delete_unreferenced(filename):
+    """Удаляет файл и его варианты, если на него нет ссылок; возвращает True, если удалён"""
+    from app.images import delete_image_files
+
+    table = Upload.__table__
+    deleted = db.session.execute(
+        delete(table).where(table.c.filename == filename, table.c.ref_count == 0)
+    ).rowcount
+    if deleted:
+        # До commit: блокировка записи не даёт новой загрузке сослаться на файл
+        delete_image_files(filename)
+    db.session.commit()
+    return bool(deleted)
+
+
+def _references():
+    """Записи с загруженными файлами: (запись, имя атрибута, имя файла)"""
+    for model in IMAGE_FILE_MODELS:
+        for item in model.query.filter(model.image_file.isnot(None), model.image_file != ''):
+            yield item, 'image_file', item.image_file
+    content_items = Content.query.filter(Content.key.like(CONTENT_IMAGE_KEYS), Content.content.isnot(None))
+    for item in content_items:
+        if item.content and not item.content.startswith(('http://', 'https://')):
+            yield item, 'content', item.content
+
+
+def reindex_uploads(min_age=3600):
+    """
+    Приводит хранилище к согласованному состоянию:
+    - файлы со старыми именами (name_YYYYmmdd_HHMMSS.ext) очищаются от
+      метаданных и переименовываются по хешу, их варианты создаются заново
+      воркером (загрузки <sha256>.pending.<ext> очищает воркер);
+    - счётчики ссылок пересчитываются по данным;
+    - файлы по хешу без ссылок старше min_age секунд удаляются
+      (более новые могут принадлежать загрузке, которая ещё не завершена).
+    Возвращает статистику.
+    """
+    from app.images import delete_image_files, strip_metadata
+    from app.jobs import enqueue_image_processing, IMAGE_MODELS
+
+    stored = {name: (size, modified) for name, size, modified in media_storage.list()}
+    stats = {'renamed': 0, 'missing': 0, 'references': 0, 'removed': 0}
+    counts = Counter()
+    renamed = {}
+
+    for item, attribute, filename in list(_references()):
+        if not UPLOAD_NAME_RE.match(filename) and not is_pending_upload(filename):
+            new_filename = renamed.get(filename)
+            if new_filename is None:
+                if filename not in stored:
+                    stats['missing'] += 1
+                    continue
+                with media_storage.local_path(filename) as source:
+                    # Как при загрузке: имя - хеш очищенного от метаданных файла
+                    stripped_path = strip_metadata(source)
+                    path = stripped_path or source
+                    new_filename = f'{_file_sha256(path).hexdigest()}{_extension(filename)}'
+                    if new_filename not in stored:
+                        stored[new_filename] = (os.path.getsize(path), time.time())
+                        media_storage.save(new_filename, path)
+                    elif stripped_path:
+                        os.remove(stripped_path)
+                # Оригинал и варианты со старым именем удаляются, воркер создаст новые
+                delete_image_files(filename)
+                renamed[filename] = new_filename
+            setattr(item, attribute, new_filename)
+            if item.__tablename__ in IMAGE_MODELS:
+                item.image_variants = None
+                db.session.flush()
+                enqueue_image_processing(item)
+            filename = new_filename
+            stats['renamed'] += 1
+        counts[filename] += 1
+    stats['references'] = sum(counts.values())
+
+    uploads = {upload.filename: upload for upload in Upload.query}
+    for filename, count in counts.items():
+        upload = uploads.pop(filename, None)
+        if upload is None:
+            if filename not in stored:
+                stats['missing'] += 1
+                continue
+            db.session.add(Upload(filename=filename, size=stored[filename][0], ref_count=count))
+        else:
+            upload.ref_count = count
+    for upload in uploads.values():
+        upload.ref_count = 0
+        enqueue('delete_upload', filename=upload.filename)
+    db.session.commit()
+
+    # Файлы по хешу, о которых не знает таблица uploads
+    known = set(counts) | set(uploads)
+    deadline = time.time() - min_age
+    for name, (size, modified) in stored.items():
+        match = UPLOAD_NAME_RE.match(name)
+        if not (match and not match.group(1)) and not is_pending_upload(name):
+            continue
+        if name not in known and modified < deadline:
+            delete_image_files(name)
+            stats['removed'] += 1
+    return stats
+
+
+def init_app(app):
+    """
+    Запись загрузок сразу во временную папку хранилища и долгое кэширование
+    файлов с именем по хешу в локальном хранилище (S3 получает Cache-Control
+    при загрузке, app/storage.py).
+    """
+    app.request_class = UploadRequest
+    max_age = app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000)
+
+    @app.after_request
+    def cache_uploads(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+        filename = (request.view_args or {}).get('filename', '')
+        directory, _, name = filename.rpartition('/')
+        if directory == folder and UPLOAD_NAME_RE.match(name):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            response.cache_control.immutable = True
+        return response
+
+    return app
@@ -1,7 +1,11 @@
-from flask import render_template, request, flash, redirect, url_for, session
+from flask import render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload
 from app.user import user
-from app import db, get_client_ip
+from app import db, get_client_ip, related
+from app.cache import cache_bus
+from app.cart import cart_store
+from app.inventory import reserve_stock, StockReservationError
 from app.models import User, Product, Order, OrderItem, OrderStatusEnum
 from decimal import Decimal
 import re
@@ -9,19 +13,60 @@ import logging
 
 email_pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
 
+
+def load_cart_products(cart_items):
+    """Загружает все товары корзины одним запросом: {id: Product}"""
+    if not cart_items:
+        return {}
+    return {product.id: product for product in Product.query.filter(Product.id.in_(cart_items)).all()}
+
+
+def resolve_cart(cart_items):
+    """
+    Сопоставляет позиции корзины {product_id: количество} с товарами и считает сумму.
+    Возвращает (позиции, итог, ошибки); недоступные товары в позиции не попадают,
+    позиции с нехваткой товара на складе попадают, но дают ошибку.
+    """
+    products_by_id = load_cart_products(cart_items)
+    lines = []
+    total = Decimal('0.00')
+    errors = []
+
+    for product_id, quantity in cart_items.items():
+        product = products_by_id.get(product_id)
+        if not product or not product.is_active:
+            errors.append(f'Товар "{product.name if product else "Неизвестный"}" недоступен')
+            continue
+
+        if quantity > product.stock_quantity:
+            errors.append(f'Недостаточно товара "{product.name}" на складе')
+
+        item_total = product.price * quantity
+        total += item_total
+        lines.append({
+            'product': product,
+            'quantity': quantity,
+            'total': item_total
+        })
+
+    return lines, total, errors
+
+
 @user.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     """Профиль пользователя"""
     if request.method == 'POST':
-        current_user.full_name = request.form.get('full_name')
-        current_user.email = request.form.get('email', '').strip()
-        current_user.address = request.form.get('address')
-        current_user.phone = request.form.get('phone')
+        # current_user - неизменяемый снимок из кэша, изменяем ORM объект
+        profile_user = current_user.get_user()
+        profile_user.full_name = request.form.get('full_name')
+        profile_user.email = request.form.get('email', '').strip()
+        profile_user.address = request.form.get('address')
+        profile_user.phone = request.form.get('phone')
 
         new_password = request.form.get('password')
 
-        if not re.match(email_pattern, current_user.email):
+        if not re.match(email_pattern, profile_user.email):
             flash('Введите корректный адрес электронной почты', 'error')
             return render_template('auth/register.html')
 
@@ -29,10 +74,11 @@ def profile():
             if len(new_password) < 8:
                 flash('Пароль должен содержать минимум 8 символов', 'error')
                 return render_template('user/profile.html')
-            current_user.set_password(new_password)
+            profile_user.set_password(new_password)
 
         try:
             db.session.commit()
+            cache_bus.publish('user')
             actions_logger = logging.getLogger('app.actions')
             actions_logger.info(
                 f"User profile updated: {current_user.username}",
@@ -73,21 +119,7 @@ def profile():
 @login_required
 def cart():
     """Корзина"""
-    cart_items = session.get('cart', [])
-    products = []
-    total = Decimal('0.00')
-
-    for item in cart_items:
-        product = Product.query.get(item['product_id'])
-        if product and product.is_active:
-            quantity = item['quantity']
-            item_total = product.price * quantity
-            total += item_total
-            products.append({
-                'product': product,
-                'quantity': quantity,
-                'total': item_total
-            })
+    products, total, _ = resolve_cart(cart_store.get())
 
     return render_template('user/cart.html', cart_items=products, total=total)
 
@@ -107,23 +139,7 @@ def cart_add(product_id):
         flash('Недостаточно товара на складе', 'error')
         return redirect(url_for('main.product_detail', slug=product.slug))
 
-    cart = session.get('cart', [])
-
-    # Проверяем, есть ли уже такой товар в корзине
-    found = False
-    for item in cart:
-        if item['product_id'] == product_id:
-            item['quantity'] += quantity
-            found = True
-            break
-
-    if not found:
-        cart.append({
-            'product_id': product_id,
-            'quantity': quantity,
-        })
-
-    session['cart'] = cart
+    cart_store.add(product_id, quantity)
     actions_logger = logging.getLogger('app.actions')
     actions_logger.info(
         f"Product added to cart: {product.name}",
@@ -149,11 +165,9 @@ def cart_add(product_id):
 @login_required
 def cart_remove(product_id):
     """Удаление товара из корзины"""
-    cart = session.get('cart', [])
     product = Product.query.get(product_id)
     product_name = product.name if product else f'Product ID: {product_id}'
-    cart = [item for item in cart if item['product_id'] != product_id]
-    session['cart'] = cart
+    cart_store.remove(product_id)
     actions_logger = logging.getLogger('app.actions')
     actions_logger.info(
         f"Product removed from cart: {product_name}",
@@ -177,22 +191,24 @@ def cart_remove(product_id):
 @login_required
 def cart_update():
     """Обновление количества товаров в корзине"""
-    cart = session.get('cart', [])
+    cart = cart_store.get()
+    products_by_id = load_cart_products(cart)
 
-    for item in cart:
-        product_id = item['product_id']
+    for product_id in cart:
         new_quantity = request.form.get(f'quantity_{product_id}')
 
         if new_quantity:
             quantity = int(new_quantity)
-            product = Product.query.get(product_id)
+            product = products_by_id.get(product_id)
+            if not product:
+                continue
 
-            if product and 0 < quantity <= product.stock_quantity:
-                item['quantity'] = quantity
+            if 0 < quantity <= product.stock_quantity:
+                if quantity != cart[product_id]:
+                    cart_store.set(product_id, quantity)
             elif quantity > product.stock_quantity:
                 flash(f'Недостаточно товара "{product.name}" на складе.', 'error')
 
-    session['cart'] = cart
     return redirect(url_for('user.cart'))
 
 
@@ -213,7 +229,10 @@ def orders():
 @login_required
 def order_detail(order_id):
     """Детали заказа пользователя"""
-    order = Order.query.get_or_404(order_id)
+    order = (Order.query
+             .options(selectinload(Order.items).joinedload(OrderItem.product))
+             .filter_by(id=order_id)
+             .first_or_404())
 
     if order.user_id != current_user.id:
         flash('Доступ запрещен', 'error')
@@ -226,34 +245,17 @@ def order_detail(order_id):
 @login_required
 def checkout():
     """Оформление заказа"""
-    cart_items = session.get('cart', [])
+    cart_items = cart_store.get()
 
     if not cart_items:
         flash('Корзина пуста', 'error')
         return redirect(url_for('user.cart'))
 
     # Проверяем наличие товаров и формируем список
-    products = []
-    total = Decimal('0.00')
-
-    for item in cart_items:
-        product = Product.query.get(item['product_id'])
-        if not product or not product.is_active:
-            flash(f'Товар "{product.name if product else "Неизвестный"}" недоступен', 'error')
-            return redirect(url_for('user.cart'))
-
-        quantity = item['quantity']
-        if quantity > product.stock_quantity:
-            flash(f'Недостаточно товара "{product.name}" на складе', 'error')
-            return redirect(url_for('user.cart'))
-
-        item_total = product.price * quantity
-        total += item_total
-        products.append({
-            'product': product,
-            'quantity': quantity,
-            'total': item_total
-        })
+    products, total, errors = resolve_cart(cart_items)
+    if errors:
+        flash(errors[0], 'error')
+        return redirect(url_for('user.cart'))
 
     if request.method == 'POST':
         shipping_address = request.form.get('shipping_address')
@@ -278,7 +280,14 @@ def checkout():
             db.session.add(order)
             db.session.flush()  # Получаем ID заказа
 
-            # Создаем позиции заказа и уменьшаем количество на складе
+            # Резервируем товар условным UPDATE: остаток проверяется и уменьшается атомарно
+            quantities = {}
+            for item in products:
+                product_id = item['product'].id
+                quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+            reserve_stock(quantities)
+
+            # Создаем позиции заказа
             for item in products:
                 order_item = OrderItem(
                     order_id=order.id,
@@ -288,13 +297,24 @@ def checkout():
                 )
                 db.session.add(order_item)
 
-                # Уменьшаем количество на складе
-                item['product'].stock_quantity -= item['quantity']
-
             db.session.commit()
+            # Остатки на складе выводятся в каталоге
+            cache_bus.publish('product')
 
             # Очищаем корзину
-            session['cart'] = []
+            cart_store.clear()
+
+            # Обновляем похожие товары с учётом совместной покупки
+            try:
+                related.refresh_products([item['product'].id for item in products])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logging.getLogger('app.errors').error(
+                    f"Related products refresh failed for order {order.id}",
+                    exc_info=True,
+                    extra={'action': 'related_refresh', 'status': 'error', 'entity_type': 'order', 'entity_id': order.id}
+                )
 
             # Логируем оформление заказа
             actions_logger = logging.getLogger('app.actions')
@@ -320,6 +340,26 @@ def checkout():
 
             flash('Заказ успешно оформлен!', 'success')
             return redirect(url_for('user.order_detail', order_id=order.id))
+        except StockReservationError as e:
+            # Товар закончился, пока пользователь оформлял заказ
+            db.session.rollback()
+            actions_logger = logging.getLogger('app.actions')
+            actions_logger.warning(
+                "Order creation rejected: insufficient stock",
+                extra={
+                    'action': 'order_create',
+                    'status': 'rejected',
+                    'user_id': current_user.id,
+                    'username': current_user.username,
+                    'ip_address': get_client_ip(),
+                    'extra_data': {
+                        'shortages': [item._asdict() for item in e.shortages]
+                    }
+                }
+            )
+            for message in e.messages():
+                flash(message, 'error')
+            return redirect(url_for('user.cart'))
         except Exception as e:
             db.session.rollback()
             actions_logger = logging.getLogger('app.actions')
@@ -1,11 +1,14 @@
 from functools import wraps
-from flask import abort, current_app, request
+from flask import abort, request
 from flask_login import current_user
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.exc import IntegrityError
+from app import db
 from app.models import RoleEnum
-from werkzeug.utils import secure_filename
-import os
+from app.storage import media_storage
 import logging
-from datetime import datetime
 from app import get_client_ip
 from app.logging_config import mask_sensitive_data
 
@@ -48,37 +51,41 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def save_uploaded_file(file, folder=None):
-    """Сохраняет загруженный файл и возвращает имя файла"""
-    if file and allowed_file(file.filename):
-        # Используем папку из конфигурации, если не указана
-        if folder is None:
-            folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        # Создаем уникальное имя файла
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{name}_{timestamp}{ext}"
-
-        # Создаем папку, если её нет
-        upload_path = os.path.join(current_app.root_path, 'static', folder)
-        os.makedirs(upload_path, exist_ok=True)
-
-        # Сохраняем файл
-        file_path = os.path.join(upload_path, unique_filename)
-        file.save(file_path)
-
-        return unique_filename
-    return None
-
-
 def get_image_url(image_file=None, image_url=None):
     """Возвращает URL изображения (приоритет у загруженного файла)"""
     if image_file:
-        return f'/static/uploads/{image_file}'
+        return media_storage.url(image_file)
     return image_url or ''
 
 
+def insert_or_increment(table, key, column, amount, **values):
+    """
+    Прибавляет amount к столбцу column строки с уникальным ключом key
+    или создаёт строку (key, column=amount, values) одним запросом
+    INSERT ... ON CONFLICT DO UPDATE (SQLite, PostgreSQL), без commit.
+    Параллельные запросы с одним ключом не получают IntegrityError.
+    """
+    dialect = db.engine.dialect.name
+    row = {**key, column: amount, **values}
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        db.session.execute(
+            insert(table).values(**row)
+            .on_conflict_do_update(index_elements=list(key), set_={column: table.c[column] + amount})
+        )
+        return
+    # Остальные СУБД: вставка в точке сохранения, при конфликте ключа - UPDATE
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**row))
+    except IntegrityError:
+        db.session.execute(
+            update(table)
+            .where(*[table.c[name] == value for name, value in key.items()])
+            .values({column: table.c[column] + amount})
+        )
+
+
 def log_action(action_name, entity_type=None, entity_id=None, extra_data=None, logger_name='app.actions'):
     """
     Универсальный декоратор для логирования действий пользователей.
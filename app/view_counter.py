@@ -0,0 +1,90 @@
+"""
+Буферизованный счётчик просмотров товаров и статей.
+Просмотры копятся в памяти воркера и периодически записываются в БД
+одним UPDATE ... SET views_count = views_count + n на каждую строку.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from sqlalchemy import func, update
+
+from app import db
+
+
+class ViewCounter:
+    """Накапливает просмотры и сбрасывает их в БД пачками"""
+
+    def __init__(self):
+        self._app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.flush_interval = 10
+        self.max_pending = 500
+
+    def init_app(self, app):
+        self._app = app
+        self.flush_interval = app.config.get('VIEW_COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('VIEW_COUNTER_MAX_PENDING', self.max_pending)
+        app.teardown_request(self._maybe_flush)
+        # Не теряем накопленные просмотры при перезапуске воркера (max_requests)
+        atexit.register(self._flush_on_exit)
+
+    def hit(self, model, object_id):
+        """Учитывает один просмотр объекта модели (Product, BlogPost)"""
+        key = (model.__table__, object_id)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+
+    def _maybe_flush(self, exc=None):
+        if not self._pending:
+            return
+        interval_passed = time.monotonic() - self._last_flush >= self.flush_interval
+        if interval_passed or len(self._pending) >= self.max_pending:
+            self.flush()
+
+    def _flush_on_exit(self):
+        if self._pending and self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def flush(self):
+        """Записывает накопленные просмотры в БД в отдельной транзакции"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            with db.engine.begin() as connection:
+                for (table, object_id), count in pending.items():
+                    connection.execute(
+                        update(table)
+                        .where(table.c.id == object_id)
+                        .values(
+                            views_count=func.coalesce(table.c.views_count, 0) + count,
+                            # Просмотр не является изменением объекта
+                            updated_at=table.c.updated_at
+                        )
+                    )
+        except Exception as e:
+            # Возвращаем просмотры в буфер, чтобы записать их при следующей попытке
+            with self._lock:
+                for key, count in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + count
+            errors_logger = logging.getLogger('app.errors')
+            errors_logger.error(
+                f"View counter flush failed: {str(e)}",
+                exc_info=True,
+                extra={
+                    'action': 'view_counter_flush',
+                    'status': 'error',
+                    'extra_data': {'pending_rows': len(pending)}
+                }
+            )
+
+
+view_counter = ViewCounter()
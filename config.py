@@ -5,8 +5,81 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production-2024'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///leathercraft.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Реплика для чтения публичных страниц (app/db_routing.py); без неё всё читается из основной базы
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.environ.get('DATABASE_REPLICA_URL') else {}
+    # Секунды после изменяющего запроса, в течение которых посетитель читает из основной базы
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
     UPLOAD_FOLDER = 'uploads'
+    # Хранилище загруженных файлов (app/storage.py): 'local' (app/static/uploads) или 's3'
+    # (S3-совместимое хранилище, общее для нескольких серверов приложения; нужен boto3)
+    MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', 'uploads/')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # MinIO, Yandex Object Storage и т.п.; пусто - AWS
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_ACL = os.environ.get('S3_ACL')  # 'public-read', если бакет без публичной политики
+    # Публичный адрес файлов S3 (CDN); по умолчанию <S3_ENDPOINT_URL>/<S3_BUCKET>
+    MEDIA_URL = os.environ.get('MEDIA_URL')
+    # Загрузки хранятся по хешу содержимого (app/uploads.py) и не меняются: кэш браузера на год
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 365 * 24 * 3600))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Предельный размер загруженного файла по типу (тип определяется по первым байтам, app/uploads.py)
+    UPLOAD_MAX_SIZES = {
+        'jpeg': int(os.environ.get('UPLOAD_MAX_SIZE_JPEG', 16 * 1024 * 1024)),
+        'png': int(os.environ.get('UPLOAD_MAX_SIZE_PNG', 16 * 1024 * 1024)),
+        'webp': int(os.environ.get('UPLOAD_MAX_SIZE_WEBP', 8 * 1024 * 1024)),
+        'gif': int(os.environ.get('UPLOAD_MAX_SIZE_GIF', 4 * 1024 * 1024)),
+    }
+    # Качество уменьшенных копий загруженных изображений (app/images.py, нужен Pillow)
+    IMAGE_WEBP_QUALITY = int(os.environ.get('IMAGE_WEBP_QUALITY', 80))
+    IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 82))
+    # Очередь фоновых задач (app/jobs.py, воркер - flask run_worker)
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))  # секунд, умножается на номер попытки
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 300))  # секунд в RUNNING до возврата задачи в очередь
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+
+    # Профиль SQLite: 'production' (WAL, synchronous=NORMAL, busy_timeout, mmap, пул соединений)
+    # или 'default' (стандартные настройки SQLite и SQLAlchemy); для других СУБД не применяется
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # Миллисекунды ожидания блокировки
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # Байты
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # Отрицательное значение - в КиБ (64MB)
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 2))  # Соединений на воркер
+    SQLITE_POOL_MAX_OVERFLOW = int(os.environ.get('SQLITE_POOL_MAX_OVERFLOW', 4))
+    SQLITE_POOL_TIMEOUT = int(os.environ.get('SQLITE_POOL_TIMEOUT', 10))  # Секунды ожидания свободного соединения
+
+    # Файл канала инвалидации кэшей между воркерами (по умолчанию instance/cache_bus.bin)
+    CACHE_BUS_FILE = os.environ.get('CACHE_BUS_FILE')
+
+    # Cache-Control: max-age (сек) для публичных страниц анонимных посетителей
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+
+    # Кэш отрендеренных страниц для анонимных посетителей: время жизни (сек, 0 - выключен),
+    # максимум страниц и суммарный размер в байтах на воркер
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 60))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 500))
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # Время кэширования общего количества строк в списках с постраничным выводом (сек)
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL', 60))
+
+    # Кэш пользователей для Flask-Login: время жизни записи (сек) и максимум записей
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
+
+    # Хранилище корзин: database (таблица cart_items) или memory (память процесса, для разработки)
+    CART_BACKEND = os.environ.get('CART_BACKEND', 'database')
+
+    # Счётчик просмотров: период записи в БД (сек) и максимум строк в буфере
+    VIEW_COUNTER_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 10))
+    VIEW_COUNTER_MAX_PENDING = int(os.environ.get('VIEW_COUNTER_MAX_PENDING', 500))
+
+    # Язык полнотекстового поиска PostgreSQL (конфигурация to_tsvector)
+    SEARCH_LANGUAGE = os.environ.get('SEARCH_LANGUAGE', 'russian')
 
     # Настройки для работы за прокси
     TRUSTED_PROXIES = ['127.0.0.1']  # IP адреса доверенных прокси
@@ -19,6 +92,18 @@ class Config:
     LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))  # 10MB по умолчанию
     LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))  # Количество резервных файлов
     LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json', 'text', или 'auto' (auto = json для продакшена, text для разработки)
+    LOG_JSON_SERIALIZER = os.environ.get('LOG_JSON_SERIALIZER', 'auto')  # 'json', 'orjson' или 'auto' (orjson, если установлен)
+    # Асинхронная запись логов через очередь и отдельный поток
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+    LOG_ASYNC_QUEUE_SIZE = int(os.environ.get('LOG_ASYNC_QUEUE_SIZE', 10000))  # Максимум записей в очереди
+    LOG_ASYNC_OVERFLOW = os.environ.get('LOG_ASYNC_OVERFLOW', 'drop')  # 'drop' - отбросить, 'block' - ждать LOG_ASYNC_BLOCK_TIMEOUT
+    LOG_ASYNC_BLOCK_TIMEOUT = float(os.environ.get('LOG_ASYNC_BLOCK_TIMEOUT', 0.05))  # Секунды ожидания при 'block'
+
+    # Хеширование паролей: стоимость bcrypt и ограничение одновременных операций на сервере
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2))
+    PASSWORD_HASH_WAIT_TIMEOUT = float(os.environ.get('PASSWORD_HASH_WAIT_TIMEOUT', 5))  # Секунды ожидания слота
+    PASSWORD_HASH_LOCK_DIR = os.environ.get('PASSWORD_HASH_LOCK_DIR')  # По умолчанию instance/password_hash_slots
 
     # Настройки сессии
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -1,5 +1,12 @@
-﻿from app import create_app
+﻿import time
+
+import click
+
+from app import create_app
 from app.init_data import init_database_data
+from app.search import rebuild_search_index
+from app.related import rebuild_related_index
+from app.dashboard_stats import reconcile_dashboard_stats
 
 app = create_app()
 
@@ -10,6 +17,130 @@ def init_db():
         from app import db
         db.create_all()
         init_database_data()
+        rebuild_search_index()
+        rebuild_related_index()
+        reconcile_dashboard_stats()
+
+
+@app.cli.command('rebuild_search_index')
+def rebuild_search_index_command():
+    """Пересоздание полнотекстового индекса каталога"""
+    with app.app_context():
+        count = rebuild_search_index()
+        print(f'✓ Поисковый индекс пересоздан, товаров: {count}')
+
+
+@app.cli.command('rebuild_related_index')
+def rebuild_related_index_command():
+    """Пересчёт индекса похожих товаров и статей"""
+    with app.app_context():
+        count = rebuild_related_index()
+        print(f'✓ Индекс похожих товаров и статей пересчитан, связей: {count}')
+
+
+@app.cli.command('reconcile_dashboard_stats')
+def reconcile_dashboard_stats_command():
+    """Пересчёт счётчиков дашборда по фактическим данным"""
+    with app.app_context():
+        stats = reconcile_dashboard_stats()
+        print(f'✓ Счётчики дашборда пересчитаны: заказов {stats.orders_count}, '
+              f'ожидают обработки {stats.orders_pending}, непрочитанных обращений {stats.messages_unread}')
+
+
+@app.cli.command('create_indexes')
+def create_indexes_command():
+    """Создание индексов моделей, которых нет в существующей базе данных"""
+    with app.app_context():
+        from sqlalchemy import inspect
+        from app import db
+        inspector = inspect(db.engine)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(db.engine)
+                    print(f'✓ Создан индекс {index.name}')
+
+
+# Каждый запрос тестового клиента должен получить собственный контекст приложения и current_user
+@app.cli.command('check_query_plans', with_appcontext=False)
+def check_query_plans_command():
+    """Проверка планов запросов горячих страниц (SQLite): ошибка при полном просмотре таблиц или ответе не 200"""
+    import sys
+    from app.query_plans import check_query_plans
+    errors = check_query_plans(app)
+    if errors:
+        print(f'✗ Ошибок проверки (полный просмотр таблиц или ответ не 200): {errors}')
+        sys.exit(1)
+    print('✓ Все страницы ответили 200, полных просмотров таблиц не найдено')
+
+
+@app.cli.command('replicate_db')
+@click.option('--interval', type=float, default=0, help='Повторять каждые N секунд (0 - один раз)')
+def replicate_db_command(interval):
+    """Копирование основной базы SQLite в реплику для чтения (локальная замена репликации)"""
+    from app import db
+    from app.db_routing import replicate
+    with app.app_context():
+        while True:
+            elapsed = replicate(db)
+            print(f'✓ Реплика обновлена за {elapsed * 1000:.0f} мс')
+            if not interval:
+                break
+            time.sleep(interval)
+
+
+@app.cli.command('generate_image_variants')
+def generate_image_variants_command():
+    """Добавление столбца image_variants в существующую базу и создание вариантов загруженных изображений"""
+    from sqlalchemy import inspect
+    from app import db
+    from app.images import generate_missing_variants
+    from app.models import Product, BlogPost, HeroSlide
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for model in (Product, BlogPost, HeroSlide):
+            table = model.__tablename__
+            if 'image_variants' not in {column['name'] for column in inspector.get_columns(table)}:
+                column_type = model.image_variants.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN image_variants {column_type}')
+                print(f'✓ Добавлен столбец {table}.image_variants')
+        count = generate_missing_variants()
+        print(f'✓ Созданы варианты изображений: {count}')
+
+
+@app.cli.command('run_worker')
+@click.option('--once', is_flag=True, help='Выполнить готовые задачи и выйти')
+@click.option('--interval', type=float, default=None, help='Пауза при пустой очереди, секунд (по умолчанию JOB_POLL_INTERVAL)')
+def run_worker_command(once, interval):
+    """Воркер очереди фоновых задач (обработка загруженных изображений)"""
+    import signal
+    import threading
+    from app.jobs import run_worker
+    stop_event = threading.Event()
+    # Текущая задача доделывается, новые не забираются
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop_event.set())
+    print('✓ Воркер запущен')
+    processed = run_worker(app, poll_interval=interval, once=once, stop_event=stop_event)
+    print(f'✓ Воркер остановлен, выполнено задач: {processed}')
+
+
+@app.cli.command('reindex_uploads')
+@click.option('--min-age', type=int, default=3600, help='Не удалять файлы без ссылок моложе N секунд')
+def reindex_uploads_command(min_age):
+    """Переименование загрузок по хешу содержимого, пересчёт ссылок и удаление файлов без ссылок"""
+    from app import db
+    from app.uploads import reindex_uploads
+    with app.app_context():
+        db.create_all()
+        stats = reindex_uploads(min_age=min_age)
+        print(f"✓ Переименовано: {stats['renamed']}, ссылок: {stats['references']}, "
+              f"удалено файлов без ссылок: {stats['removed']}, не найдено: {stats['missing']}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,77 @@
+"""
+Микро-бенчмарк JSONFormatter: записей в секунду внутри запроса
+авторизованного пользователя за прокси (X-Forwarded-For).
+
+Запуск из корня репозитория:
+    python scripts/bench_logging.py [--records 20000]
+
+Сравнение с другой версией кода (например, до изменения форматтера):
+    git worktree add /tmp/before <commit>
+    python scripts/bench_logging.py --root /tmp/before
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000, help='Записей на прогон')
+    parser.add_argument('--repeat', type=int, default=3, help='Прогонов, берётся лучший')
+    parser.add_argument('--root', default=os.path.join(os.path.dirname(__file__), '..'),
+                        help='Корень проверяемой версии приложения')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tmp_dir = tempfile.mkdtemp(prefix='bench-logging-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp_dir, "bench.db")}'
+    os.environ['LOG_DIR'] = os.path.join(tmp_dir, 'logs')
+    os.environ['CACHE_BUS_FILE'] = os.path.join(tmp_dir, 'cache_bus.bin')
+    sys.path.insert(0, os.path.abspath(args.root))
+
+    from flask_login import login_user
+    from app import create_app, db
+    from app import logging_config
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    # Версии без выбора сериализатора проверяются с форматтером по умолчанию
+    if hasattr(logging_config, 'get_json_serializer'):
+        formatters = {'json': logging_config.JSONFormatter(serializer=logging_config.get_json_serializer('json'))}
+        if logging_config.orjson is not None:
+            formatters['orjson'] = logging_config.JSONFormatter(serializer=logging_config.get_json_serializer('orjson'))
+    else:
+        formatters = {'json': logging_config.JSONFormatter()}
+
+    headers = {'X-Forwarded-For': '203.0.113.7, 10.0.0.1', 'User-Agent': 'bench/1.0'}
+    for name, formatter in formatters.items():
+        best = 0
+        for _ in range(args.repeat):
+            with app.test_request_context('/catalog?page=2', headers=headers):
+                login_user(db.session.get(User, user_id))
+                started = time.perf_counter()
+                for i in range(args.records):
+                    record = logging.LogRecord('app.requests', logging.INFO, __file__, 0,
+                                               'GET /catalog', None, None)
+                    record.duration_ms = i % 100
+                    record.status_code = 200
+                    formatter.format(record)
+                elapsed = time.perf_counter() - started
+            best = max(best, args.records / elapsed)
+        print(f'{name:8} {best:10,.0f} records/sec')
+
+
+if __name__ == '__main__':
+    main()
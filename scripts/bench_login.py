@@ -0,0 +1,77 @@
+"""
+Пропускная способность входа в одном воркере: успешных POST /auth/login
+в секунду при разной стоимости bcrypt (BCRYPT_LOG_ROUNDS).
+
+Запуск из корня репозитория:
+    python scripts/bench_login.py [--rounds 10 12] [--seconds 5]
+
+Каждая стоимость проверяется в отдельном процессе: Config читает
+BCRYPT_LOG_ROUNDS из окружения при импорте.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 12], help='Стоимости bcrypt')
+    parser.add_argument('--seconds', type=float, default=5, help='Длительность замера для каждой стоимости')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_worker(seconds):
+    """Замер в текущем процессе; печатает количество входов и время"""
+    sys.path.insert(0, ROOT)
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench-password')
+        db.session.add(user)
+        db.session.commit()
+
+    logins = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        # Новый клиент - новая сессия: каждый запрос выполняет полный вход
+        response = app.test_client().post('/auth/login', data={'username': 'bench', 'password': 'bench-password'})
+        if response.status_code != 302:
+            raise SystemExit(f'Вход не выполнен: HTTP {response.status_code}')
+        logins += 1
+    print(logins, time.perf_counter() - started)
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        run_worker(args.seconds)
+        return
+
+    for rounds in args.rounds:
+        tmp_dir = tempfile.mkdtemp(prefix='bench-login-')
+        env = dict(
+            os.environ,
+            BCRYPT_LOG_ROUNDS=str(rounds),
+            DATABASE_URL=f'sqlite:///{os.path.join(tmp_dir, "bench.db")}',
+            LOG_DIR=os.path.join(tmp_dir, 'logs'),
+            CACHE_BUS_FILE=os.path.join(tmp_dir, 'cache_bus.bin'),
+            PASSWORD_HASH_LOCK_DIR=os.path.join(tmp_dir, 'password_hash_slots'),
+        )
+        result = subprocess.run([sys.executable, __file__, '--worker', '--seconds', str(args.seconds)],
+                                env=env, capture_output=True, text=True, check=True)
+        logins, elapsed = result.stdout.split()[-2:]
+        print(f'cost {rounds:2}: {int(logins) / float(elapsed):6.1f} logins/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Смешанная нагрузка чтение/запись на файловую SQLite с профилями
+SQLITE_PROFILE=default и production.
+
+Несколько процессов (как воркеры Gunicorn) одновременно создают своё
+приложение и в течение заданного времени выполняют операции:
+чтение - первая страница каталога и count обращений, запись - новое
+обращение с commit. Выводятся операции в секунду, p99 задержки и
+количество ошибок "database is locked".
+
+Запуск из корня репозитория (нужен fork, т.е. Linux/macOS):
+    python scripts/bench_sqlite.py [--workers 8] [--seconds 5] [--writes 0.2]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'], help='Профили SQLite')
+    parser.add_argument('--workers', type=int, default=8, help='Процессов')
+    parser.add_argument('--seconds', type=float, default=5, help='Длительность замера')
+    parser.add_argument('--writes', type=float, default=0.2, help='Доля операций записи (0..1)')
+    return parser.parse_args()
+
+
+def worker(results, start_at, seconds, write_share):
+    from sqlalchemy.exc import OperationalError
+    from app import create_app, db
+    from app.models import Product, ContactMessage
+
+    app = create_app()
+    logging.disable(logging.CRITICAL)
+    operations = errors = 0
+    latencies = []
+    with app.app_context():
+        while time.time() < start_at:
+            time.sleep(0.001)
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                if random.random() < write_share:
+                    db.session.add(ContactMessage(name='bench', email='bench@example.com', message='x' * 200))
+                else:
+                    Product.query.filter_by(is_active=True).order_by(Product.id).limit(12).all()
+                    db.session.query(db.func.count(ContactMessage.id)).scalar()
+                db.session.commit()
+                operations += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    results.put((operations, errors, latencies[int(len(latencies) * 0.99)] if latencies else 0))
+
+
+def run(profile, args):
+    tmp_dir = tempfile.mkdtemp(prefix='bench-sqlite-')
+    os.environ.update(
+        SQLITE_PROFILE=profile,
+        DATABASE_URL=f'sqlite:///{os.path.join(tmp_dir, "bench.db")}',
+        LOG_DIR=os.path.join(tmp_dir, 'logs'),
+        CACHE_BUS_FILE=os.path.join(tmp_dir, 'cache_bus.bin'),
+    )
+    from app import create_app, db
+    from app.init_data import init_database_data
+
+    app = create_app()
+    logging.disable(logging.CRITICAL)
+    with app.app_context():
+        db.create_all()
+        init_database_data()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        db.session.remove()
+        db.engine.dispose()
+
+    results = multiprocessing.Queue()
+    start_at = time.time() + 2
+    processes = [multiprocessing.Process(target=worker, args=(results, start_at, args.seconds, args.writes))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    operations = sum(item[0] for item in stats)
+    errors = sum(item[1] for item in stats)
+    p99 = max(item[2] for item in stats) * 1000
+    print(f'{profile:10} journal={journal_mode:8} {operations / args.seconds:7.0f} ops/s  '
+          f'p99 {p99:6.1f} ms  locked errors: {errors}', flush=True)
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, ROOT)
+    multiprocessing.set_start_method('fork')
+    # Config читает окружение при импорте: каждый профиль - в своём процессе
+    for profile in args.profiles:
+        child = multiprocessing.Process(target=run, args=(profile, args))
+        child.start()
+        child.join()
+
+
+if __name__ == '__main__':
+    main()
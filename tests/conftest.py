@@ -0,0 +1,104 @@
+"""
+Общие фикстуры тестов.
+
+Config читает переменные окружения при импорте, поэтому временная база,
+логи и файлы синхронизации задаются до импорта приложения. Приложение
+создаётся один раз на сессию (кэши модулей - синглтоны процесса), тесты
+создают собственные данные поверх начальных (init_database_data).
+
+Запросы тестового клиента выполняются вне контекста приложения: иначе
+запрос использует чужой g и закэшированного в нём current_user.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+_tmp_dir = tempfile.mkdtemp(prefix='leathercraft-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp_dir, "test.db")}'
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ['LOG_DIR'] = os.path.join(_tmp_dir, 'logs')
+os.environ['CACHE_BUS_FILE'] = os.path.join(_tmp_dir, 'cache_bus.bin')
+os.environ['PASSWORD_HASH_LOCK_DIR'] = os.path.join(_tmp_dir, 'password_hash_slots')
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['MEDIA_STORAGE'] = 'local'
+# Страницы должны выполнять запросы, а не отдаваться из кэша
+os.environ['PAGE_CACHE_TTL'] = '0'
+
+from app import create_app, db  # noqa: E402
+from app.init_data import init_database_data  # noqa: E402
+from app.search import rebuild_search_index  # noqa: E402
+from app.related import rebuild_related_index  # noqa: E402
+from app.dashboard_stats import reconcile_dashboard_stats  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        init_database_data()
+        rebuild_search_index()
+        rebuild_related_index()
+        reconcile_dashboard_stats()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username):
+    """Вход пользователем username без проверки пароля (через сессию Flask-Login)"""
+    from app.models import User
+
+    app = client.application
+    with app.app_context():
+        user_id = User.query.filter_by(username=username).one().id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return user_id
+
+
+def create_product(app, stock_quantity=10, price='1000.00', category=None):
+    """Новый активный товар с уникальным slug; возвращает id"""
+    from app.models import Product, Category
+
+    with app.app_context():
+        count = Product.query.count()
+        category_id = (category or Category.query.first()).id
+        product = Product(
+            name=f'Тестовый товар {count + 1}',
+            slug=f'test-product-{count + 1}',
+            description='Товар для тестов',
+            price=Decimal(price),
+            category_id=category_id,
+            stock_quantity=stock_quantity,
+            is_active=True,
+        )
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+
+@contextmanager
+def count_queries(app):
+    """Считает SQL запросы, выполненные внутри блока (список statements)"""
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,65 @@
+"""Серверная корзина (app/cart.py)"""
+import threading
+
+from app import db
+from app.utils import insert_or_increment
+from conftest import login, create_product
+
+THREADS = 8
+
+
+def _cart_rows(app, user_id, product_id):
+    from app.models import CartItem
+
+    with app.app_context():
+        return [(item.product_id, item.quantity)
+                for item in CartItem.query.filter_by(user_id=user_id, product_id=product_id)]
+
+
+def test_add_accumulates_quantity(app, client):
+    user_id = login(client, 'user')
+    product_id = create_product(app, stock_quantity=10)
+
+    assert client.post(f'/user/cart/add/{product_id}', data={'quantity': 2}).status_code == 302
+    assert client.post(f'/user/cart/add/{product_id}', data={'quantity': 3}).status_code == 302
+
+    assert _cart_rows(app, user_id, product_id) == [(product_id, 5)]
+
+
+def test_concurrent_add_of_same_product(app):
+    """Повторная отправка формы и несколько вкладок: одна строка, количество складывается"""
+    client = app.test_client()
+    user_id = login(client, 'manager')
+    product_id = create_product(app, stock_quantity=100)
+    cookie = client.get_cookie('session').value
+    barrier = threading.Barrier(THREADS)
+    statuses = []
+
+    def add():
+        tab = app.test_client()
+        tab.set_cookie('session', cookie)
+        barrier.wait()
+        statuses.append(tab.post(f'/user/cart/add/{product_id}', data={'quantity': 1}).status_code)
+
+    threads = [threading.Thread(target=add) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [302] * THREADS
+    assert _cart_rows(app, user_id, product_id) == [(product_id, THREADS)]
+
+
+def test_insert_or_increment_without_upsert_support(app, monkeypatch):
+    """СУБД без ON CONFLICT: конфликт ключа при вставке превращается в UPDATE"""
+    from app.models import CartItem
+
+    user_id = login(app.test_client(), 'admin')
+    product_id = create_product(app)
+    with app.app_context():
+        monkeypatch.setattr(db.engine.dialect, 'name', 'other')
+        for quantity in (2, 5):
+            insert_or_increment(CartItem.__table__, {'user_id': user_id, 'product_id': product_id}, 'quantity', quantity)
+        db.session.commit()
+    assert _cart_rows(app, user_id, product_id) == [(product_id, 7)]
@@ -0,0 +1,84 @@
+"""
+Резервирование товара при оформлении заказа (app/inventory.py):
+параллельные заказы не уводят остаток в минус.
+"""
+import threading
+
+import pytest
+
+from app import db
+from app.inventory import reserve_stock, StockReservationError
+from conftest import create_product
+
+THREADS = 32
+STOCK = 10
+
+
+@pytest.fixture
+def customers(app):
+    """THREADS покупателей без пароля (вход через сессию)"""
+    from app.models import User, RoleEnum
+
+    with app.app_context():
+        offset = User.query.count()
+        users = [User(username=f'stress-{offset + i}', email=f'stress-{offset + i}@example.com',
+                      password_hash='-', role=RoleEnum.USER) for i in range(THREADS)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def test_concurrent_checkout_never_oversells(app, customers):
+    from app.models import Product, OrderItem
+
+    product_id = create_product(app, stock_quantity=STOCK)
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def checkout(user_id):
+        try:
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            client.post(f'/user/cart/add/{product_id}', data={'quantity': 1})
+            # Все потоки оформляют заказ одновременно
+            barrier.wait()
+            response = client.post('/user/checkout', data={'shipping_address': 'Москва'})
+            results.append(response.headers.get('Location', str(response.status_code)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=checkout, args=(user_id,)) for user_id in customers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    ordered = [location for location in results if '/user/orders/' in location]
+    rejected = [location for location in results if location.endswith('/user/cart')]
+    assert len(ordered) == STOCK
+    assert len(rejected) == THREADS - STOCK
+
+    with app.app_context():
+        sold = (db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0))
+                .filter(OrderItem.product_id == product_id).scalar())
+        assert sold == STOCK
+        assert db.session.get(Product, product_id).stock_quantity == 0
+
+
+def test_reserve_stock_reports_every_short_line(app):
+    from app.models import Product
+
+    enough = create_product(app, stock_quantity=5)
+    short = create_product(app, stock_quantity=1)
+    with app.app_context():
+        with pytest.raises(StockReservationError) as info:
+            reserve_stock({enough: 2, short: 3})
+        db.session.rollback()
+
+        assert [(item.product_id, item.requested, item.available) for item in info.value.shortages] == [(short, 3, 1)]
+        # Откат транзакции возвращает и успешно зарезервированные позиции
+        assert db.session.get(Product, enough).stock_quantity == 5
@@ -0,0 +1,52 @@
+"""Условные GET публичных страниц (app/http_cache.py)"""
+import pytest
+
+from app import routes
+from app.cache import cache_bus
+from conftest import login, count_queries
+
+
+@pytest.mark.parametrize('url, namespace', [
+    ('/catalog', 'product'),
+    ('/catalog', 'category'),
+    ('/', 'hero_slide'),
+    ('/blog', 'blog_post'),
+    ('/sitemap', 'blog_post'),
+])
+def test_etag_follows_cache_bus(app, client, url, namespace):
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    with app.app_context():
+        cache_bus.publish(namespace)
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_revalidation_does_not_scan_tables(app, client):
+    etag = client.get('/catalog').headers['ETag']
+    with count_queries(app) as statements:
+        response = client.get('/catalog', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert statements == []
+
+
+def test_generation_version_has_no_last_modified(client):
+    """Время изменения поколения неизвестно: If-Modified-Since не должен давать 304"""
+    response = client.get('/blog')
+    assert 'Last-Modified' not in response.headers
+    assert client.get('/about').headers.get('Last-Modified')
+
+
+def test_version_is_not_built_for_logged_in_user(client, monkeypatch):
+    def page_version():
+        raise AssertionError('версия страницы для авторизованного пользователя')
+
+    monkeypatch.setattr(routes, 'PageVersion', page_version)
+    login(client, 'user')
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'private' in response.headers['Cache-Control']
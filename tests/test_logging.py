@@ -0,0 +1,85 @@
+"""Асинхронная запись логов через ограниченную очередь (app/logging_config.py, LOG_ASYNC)"""
+import logging
+import threading
+
+import pytest
+
+from app.logging_config import AsyncLogDispatcher
+
+QUEUE_SIZE = 2
+EXTRA_RECORDS = 5
+
+
+class _SlowHandler(logging.Handler):
+    """Хендлер, который держит поток записи на первой записи, пока его не отпустят"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.started.set()
+        self.unblock.wait(5)
+        self.messages.append(record.getMessage())
+
+
+@pytest.mark.parametrize('overflow', ['drop', 'block'])
+def test_overflow_is_counted_and_reported(overflow):
+    logger = logging.getLogger(f'tests.async_log.{overflow}')
+    logger.propagate = False
+    handler = _SlowHandler()
+    logger.addHandler(handler)
+    dispatcher = AsyncLogDispatcher(max_size=QUEUE_SIZE, overflow=overflow, block_timeout=0.01)
+    dispatcher.attach(logger)
+    thread = dispatcher.listener._thread
+    try:
+        logger.warning('first')
+        assert handler.started.wait(5)
+        # Поток записи занят первой записью: очередь заполняется, остальное отбрасывается
+        for i in range(QUEUE_SIZE + EXTRA_RECORDS):
+            logger.warning(f'record {i}')
+
+        stats = dispatcher.stats()
+        assert stats['dropped'] == EXTRA_RECORDS
+        assert stats['dropped_by_logger'] == {logger.name: EXTRA_RECORDS}
+        assert stats['blocked'] == (EXTRA_RECORDS if overflow == 'block' else 0)
+    finally:
+        handler.unblock.set()
+        dispatcher.stop()
+        logger.handlers.clear()
+
+    assert not thread.is_alive()
+    assert handler.messages[:QUEUE_SIZE + 1] == ['first'] + [f'record {i}' for i in range(QUEUE_SIZE)]
+    blocked = EXTRA_RECORDS if overflow == 'block' else 0
+    assert handler.messages[-1] == f'Async log queue overflow: dropped={EXTRA_RECORDS}, blocked={blocked}'
+
+
+def test_no_report_without_overflow():
+    logger = logging.getLogger('tests.async_log.quiet')
+    logger.propagate = False
+    handler = _SlowHandler()
+    handler.unblock.set()
+    logger.addHandler(handler)
+    dispatcher = AsyncLogDispatcher(max_size=QUEUE_SIZE)
+    dispatcher.attach(logger)
+    logger.warning('only')
+    dispatcher.stop()
+    logger.handlers.clear()
+
+    assert handler.messages == ['only']
+    assert not dispatcher.listener._thread
+
+
+def test_jobs_page_shows_log_queue_stats(client, monkeypatch):
+    from app.admin import jobs_routes
+    from conftest import login
+
+    stats = {'queued': 0, 'max_size': 10000, 'overflow': 'drop', 'dropped': 3,
+             'dropped_by_logger': {'app.requests': 3}, 'blocked': 0, 'blocked_by_logger': {}}
+    monkeypatch.setattr(jobs_routes, 'get_async_log_stats', lambda: stats)
+    login(client, 'admin')
+    page = client.get('/admin/jobs').get_data(as_text=True)
+    assert 'отброшено 3' in page
+    assert 'app.requests: 3' in page
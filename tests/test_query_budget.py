@@ -0,0 +1,74 @@
+"""
+Бюджет SQL запросов страниц со списками (защита от N+1).
+
+Данные создаются так, чтобы ленивая загрузка связи дала запрос на каждую
+строку: заказы разных пользователей с несколькими позициями, статьи разных
+авторов. Страница запрашивается дважды, считается второй запрос: первый
+заполняет кэши воркера (пользователь, количество строк списка).
+"""
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from conftest import login, count_queries
+
+ORDERS_PER_USER = 8
+ITEMS_PER_ORDER = 3
+
+
+@pytest.fixture(scope='module')
+def order_id(app):
+    """Заказы трёх покупателей и статьи разных авторов; возвращает id заказа тестового пользователя"""
+    from app.models import User, Order, OrderItem, Product, BlogPost, OrderStatusEnum, RoleEnum
+
+    with app.app_context():
+        products = Product.query.filter_by(is_active=True).limit(ITEMS_PER_ORDER).all()
+        customers = [User.query.filter_by(username='user').one()]
+        for i in range(2):
+            customer = User(username=f'budget-{i}', email=f'budget-{i}@example.com', role=RoleEnum.USER)
+            customer.set_password('budget123')
+            db.session.add(customer)
+            customers.append(customer)
+        db.session.flush()
+
+        for customer in customers:
+            for _ in range(ORDERS_PER_USER):
+                order = Order(user_id=customer.id, status=OrderStatusEnum.PENDING,
+                              total_amount=Decimal('3000.00'), shipping_address='Москва')
+                order.items = [OrderItem(product_id=product.id, quantity=1, price=product.price)
+                               for product in products]
+                db.session.add(order)
+
+        for i, author in enumerate(User.query.filter(User.role != RoleEnum.USER).all()):
+            db.session.add(BlogPost(title=f'Статья {author.username}', slug=f'budget-post-{i}',
+                                    content='Текст', author_id=author.id, is_published=True))
+        db.session.commit()
+        return Order.query.filter_by(user_id=customers[0].id).first().id
+
+
+# (пользователь или None, URL, максимум запросов)
+BUDGETS = [
+    (None, '/catalog', 2),
+    ('user', '/user/orders', 1),
+    ('user', '/user/orders/{order_id}', 2),
+    ('admin', '/admin/', 2),
+    ('admin', '/admin/orders', 1),
+    ('admin', '/admin/orders/{order_id}', 2),
+    ('admin', '/admin/blog', 1),
+]
+
+
+@pytest.mark.parametrize('username, url, budget', BUDGETS)
+def test_query_budget(app, order_id, username, url, budget):
+    client = app.test_client()
+    if username:
+        login(client, username)
+    url = url.format(order_id=order_id)
+
+    assert client.get(url).status_code == 200
+    with count_queries(app) as statements:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(statements) <= budget, '\n'.join(statements)
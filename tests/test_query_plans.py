@@ -0,0 +1,75 @@
+"""
+Планы запросов горячих страниц (app/query_plans.py): полный просмотр
+таблицы без индекса или ответ страницы не 200 - ошибка.
+"""
+import pytest
+
+from app import db
+from app import query_plans
+from app.query_plans import check_query_plans, full_scans
+
+
+def test_hot_routes_have_no_full_scans(app):
+    report = []
+    assert check_query_plans(app, report=report.append) == 0, '\n'.join(report)
+    assert all(' -> 200,' in line for line in report if line.startswith('/'))
+
+
+def test_check_inside_app_context(app):
+    """Команда flask выполняется в контексте приложения: запросы не должны делить его g и current_user"""
+    report = []
+    with app.app_context():
+        errors = check_query_plans(app, report=report.append)
+    assert errors == 0, '\n'.join(report)
+    assert any(line.startswith('/admin/orders [admin] -> 200') for line in report)
+
+
+def test_non_200_route_is_an_error(app, monkeypatch):
+    # Анонимный посетитель перенаправляется на страницу входа
+    monkeypatch.setattr(query_plans, '_hot_routes', lambda: [(None, '/user/orders')])
+    report = []
+    assert check_query_plans(app, report=report.append) == 1
+
+
+def test_missing_index_is_reported(app):
+    index = next(index for index in db.metadata.tables['jobs'].indexes
+                 if index.name == 'ix_jobs_status_id')
+    # Соединения пула кэшируют подготовленные EXPLAIN с планом до изменения схемы
+    with app.app_context():
+        index.drop(db.engine)
+        db.engine.dispose()
+    try:
+        report = []
+        assert check_query_plans(app, report=report.append) > 0
+        assert 'ПОЛНЫЙ ПРОСМОТР jobs:' in [line.strip() for line in report]
+    finally:
+        with app.app_context():
+            index.create(db.engine)
+            db.engine.dispose()
+
+
+@pytest.mark.parametrize('plan, statement, expected', [
+    # Первая страница в порядке первичного ключа: чтение останавливается после LIMIT строк
+    (['SCAN products'], 'SELECT * FROM products ORDER BY products.id DESC LIMIT ? OFFSET ?', []),
+    (['SCAN products AS p'], 'SELECT * FROM products AS p ORDER BY p.id LIMIT ?', []),
+    # С фильтром просмотр по ключу читает все строки, не прошедшие условие
+    (['SCAN products'], 'SELECT * FROM products WHERE products.category_id = ? ORDER BY products.id LIMIT ?',
+     ['products']),
+    (['SCAN products AS p'], 'SELECT * FROM products AS p WHERE p.is_active = 1 ORDER BY p.id DESC LIMIT ?',
+     ['products']),
+    # Версия страницы по всей таблице больше не допускается
+    (['SCAN products'], 'SELECT max(products.updated_at) AS max_1, count(products.id) AS count_1 FROM products',
+     ['products']),
+    # LIMIT без сортировки по ключу не ограничивает просмотр
+    (['SCAN orders'], 'SELECT * FROM orders WHERE phone = ? LIMIT 1', ['orders']),
+    (['SCAN products', 'USE TEMP B-TREE FOR ORDER BY'],
+     'SELECT * FROM products ORDER BY products.name LIMIT ?', ['products']),
+    (['SCAN products', 'USE TEMP B-TREE FOR ORDER BY'],
+     'SELECT * FROM products ORDER BY products.id, products.name LIMIT ?', ['products']),
+    (['SCAN orders'], 'SELECT * FROM orders', ['orders']),
+    (['SCAN orders USING INDEX ix_orders_created_at'], 'SELECT * FROM orders ORDER BY orders.created_at', []),
+    (['SEARCH orders USING INDEX ix_orders_user_created (user_id=?)'], 'SELECT * FROM orders WHERE user_id = ?', []),
+])
+def test_full_scans(app, plan, statement, expected):
+    with app.app_context():
+        assert full_scans(plan, statement) == expected
@@ -0,0 +1,50 @@
+"""
+Реплика для чтения (app/db_routing.py): кэши без времени жизни
+заполняются из основной базы, а не из отстающей реплики.
+"""
+import os
+
+import pytest
+
+from app import create_app, db
+from app.cache import content_cache
+from app.db_routing import replicate
+from config import Config
+
+
+@pytest.fixture
+def replica_app(app, tmp_path, monkeypatch):
+    """Приложение с основной базой тестов и репликой - её копией"""
+    replica_path = os.path.join(tmp_path, 'replica.db')
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {'replica': f'sqlite:///{replica_path}'})
+    replica_app = create_app()
+    replica_app.config['TESTING'] = True
+    with replica_app.app_context():
+        replicate(db)
+    yield replica_app
+    with replica_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    content_cache.invalidate()
+
+
+def _set_about_text(app, text):
+    from app.models import Content
+
+    with app.app_context():
+        about = Content.query.filter_by(key='about_content').one()
+        previous, about.content = about.content, text
+        db.session.commit()
+    content_cache.invalidate()
+    return previous
+
+
+def test_content_cache_is_loaded_from_primary(replica_app):
+    # Реплика ещё не получила изменение
+    previous = _set_about_text(replica_app, 'Новый текст страницы О компании')
+    try:
+        response = replica_app.test_client().get('/about')
+        assert response.status_code == 200
+        assert 'Новый текст страницы О компании' in response.get_data(as_text=True)
+    finally:
+        _set_about_text(replica_app, previous)
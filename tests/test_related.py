@@ -0,0 +1,99 @@
+"""Инкрементальный пересчёт похожих статей (app/related.py)"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.related import refresh_posts, rebuild_related_index, _post_relations, _stored_relations, RELATED_LIMIT
+from conftest import count_queries
+
+POSTS = RELATED_LIMIT + 5
+
+
+def _add_post(slug, created_at=None, is_published=True):
+    from app.models import User, BlogPost
+
+    author = User.query.filter_by(username='admin').one()
+    post = BlogPost(title=slug, slug=slug, content='Текст', author_id=author.id,
+                    is_published=is_published, created_at=created_at or datetime.utcnow())
+    db.session.add(post)
+    db.session.flush()
+    return post
+
+
+def _index():
+    from app.models import BlogPost, RelatedItem
+
+    return _stored_relations(RelatedItem.KIND_BLOG_POST, [row[0] for row in db.session.query(BlogPost.id)])
+
+
+def _full_index():
+    """Связи, которые дал бы полный пересчёт"""
+    from app.models import BlogPost
+
+    published = db.session.query(BlogPost.id).filter(BlogPost.is_published == True)
+    recent_ids = [row[0] for row in published.order_by(BlogPost.created_at.desc(), BlogPost.id.desc())
+                  .limit(RELATED_LIMIT + 1)]
+    return {post_id: _post_relations(recent_ids, post_id) for (post_id,) in published}
+
+
+@pytest.fixture
+def posts(app):
+    """Больше опубликованных статей, чем RELATED_LIMIT + 1, и согласованный индекс"""
+    from app.models import BlogPost
+
+    with app.app_context():
+        count = BlogPost.query.count()
+        start = datetime(2020, 1, 1)
+        ids = [_add_post(f'related-{count}-{i}', start + timedelta(days=i)).id for i in range(POSTS)]
+        db.session.commit()
+        rebuild_related_index()
+    return ids
+
+
+def _publish_new(ids):
+    return _add_post(f'related-new-{ids[0]}').id
+
+
+def _unpublish_recent(ids):
+    from app.models import BlogPost
+
+    post = db.session.get(BlogPost, ids[-1])
+    post.is_published = False
+    return post.id
+
+
+def _delete_recent(ids):
+    from app.models import BlogPost
+
+    post = db.session.get(BlogPost, ids[-2])
+    db.session.delete(post)
+    return post.id
+
+
+def _publish_old(ids):
+    return _add_post(f'related-old-{ids[0]}', datetime(2000, 1, 1)).id
+
+
+@pytest.mark.parametrize('change', [_publish_new, _unpublish_recent, _delete_recent, _publish_old])
+def test_incremental_refresh_matches_full_rebuild(app, posts, change):
+    with app.app_context():
+        post_id = change(posts)
+        refresh_posts([post_id])
+        db.session.commit()
+        assert _index() == _full_index()
+
+
+def test_unchanged_lists_are_not_rewritten(app, posts):
+    """Правка старой статьи не меняет ни одного списка: запись в related_items не выполняется"""
+    from app.models import BlogPost
+
+    with app.app_context():
+        db.session.get(BlogPost, posts[0]).title = 'Новый заголовок'
+        db.session.flush()
+        with count_queries(app) as statements:
+            refresh_posts([posts[0]])
+        db.session.commit()
+        assert _index() == _full_index()
+    assert not [statement for statement in statements
+                if statement.lstrip().upper().startswith(('INSERT', 'DELETE', 'UPDATE'))]
@@ -0,0 +1,100 @@
+"""Хранилище S3 (app/storage.py) на эмуляторе moto"""
+import os
+import hashlib
+
+import pytest
+from PIL import Image
+
+moto = pytest.importorskip('moto')
+
+from app import db  # noqa: E402
+from app.storage import media_storage, S3Storage  # noqa: E402
+from app.jobs import process_image  # noqa: E402
+from app.uploads import save_uploaded_file, delete_unreferenced, is_pending_upload, UPLOAD_NAME_RE  # noqa: E402
+from conftest import create_product  # noqa: E402
+from test_uploads import _png, _jpeg_with_gps, _upload  # noqa: E402
+
+BUCKET = 'media'
+PREFIX = 'uploads/'
+
+
+@pytest.fixture
+def s3(app, monkeypatch):
+    """Бакет moto вместо локальной папки: MEDIA_STORAGE=s3"""
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    for key, value in {'MEDIA_STORAGE': 's3', 'S3_BUCKET': BUCKET, 'S3_PREFIX': PREFIX,
+                       'S3_REGION': 'us-east-1', 'S3_ENDPOINT_URL': '', 'MEDIA_URL': ''}.items():
+        monkeypatch.setitem(app.config, key, value)
+    with moto.mock_aws():
+        backend = S3Storage(app)
+        backend.client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(media_storage, 'backend', backend)
+        yield backend
+
+
+def _object(backend, name):
+    return backend.client.head_object(Bucket=BUCKET, Key=f'{PREFIX}{name}')
+
+
+def test_backend_operations(s3, tmp_path):
+    path = tmp_path / 'file.png'
+    data = _png()
+    path.write_bytes(data)
+
+    s3.save('file.png', str(path))
+    assert not path.exists()
+    assert s3.exists('file.png')
+    assert not s3.exists('missing.png')
+    assert s3.url('file.png') == f'https://{BUCKET}.s3.amazonaws.com/{PREFIX}file.png'
+
+    head = _object(s3, 'file.png')
+    assert head['ContentType'] == 'image/png'
+    assert head['CacheControl'].endswith('immutable')
+
+    with s3.local_path('file.png') as local:
+        with open(local, 'rb') as f:
+            assert f.read() == data
+    # Временная копия удаляется после выхода из контекста
+    assert not os.path.exists(local)
+
+    assert [(name, size) for name, size, _ in s3.list()] == [('file.png', len(data))]
+
+    s3.delete('file.png')
+    assert not s3.exists('file.png')
+    assert list(s3.list()) == []
+    with pytest.raises(FileNotFoundError):
+        with s3.local_path('file.png'):
+            pass
+
+
+def test_upload_round_trip(app, s3):
+    """Загрузка с метаданными: временное имя без долгого кэша, воркер публикует очищенный файл"""
+    from app.models import Product
+
+    product_id = create_product(app)
+    with app.app_context():
+        pending = save_uploaded_file(_upload(_jpeg_with_gps(color=(20, 140, 220)), 'photo.jpg'))
+        db.session.get(Product, product_id).image_file = pending
+        db.session.commit()
+        assert is_pending_upload(pending)
+        assert _object(s3, pending)['CacheControl'] == 'no-cache'
+
+        process_image(pending, 'products', product_id)
+        product = db.session.get(Product, product_id)
+        filename = product.image_file
+        variant_names = [info[fmt] for info in product.image_variants.values() for fmt in ('webp', 'jpeg')]
+
+        assert UPLOAD_NAME_RE.match(filename)
+        assert _object(s3, filename)['CacheControl'].endswith('immutable')
+        with s3.local_path(filename) as local:
+            with open(local, 'rb') as f:
+                assert filename == f'{hashlib.sha256(f.read()).hexdigest()}.jpg'
+            with Image.open(local) as image:
+                assert not image.getexif()
+
+        assert delete_unreferenced(pending)
+        names = {name for name, _, _ in s3.list()}
+        assert pending not in names
+        assert filename in names
+        assert variant_names and set(variant_names) <= names
@@ -0,0 +1,166 @@
+"""Хранилище загрузок по хешу содержимого (app/uploads.py)"""
+import io
+import hashlib
+import threading
+
+import pytest
+from sqlalchemy import update
+from PIL import Image, ExifTags
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.storage import media_storage
+from app.jobs import process_image
+from app.uploads import (save_uploaded_file, publish_upload, delete_unreferenced, is_pending_upload,
+                         UPLOAD_NAME_RE)
+from conftest import create_product
+
+THREADS = 8
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    """Локальное хранилище во временной папке вместо static/uploads"""
+    monkeypatch.setattr(media_storage.backend, 'directory', str(tmp_path))
+    monkeypatch.setattr(media_storage.backend, 'temp_dir', str(tmp_path))
+    return tmp_path
+
+
+def _png(color=(200, 120, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _jpeg_with_gps(orientation=1, color=(90, 60, 30)):
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    exif[ExifTags.Base.Make] = 'Camera'
+    exif.get_ifd(ExifTags.IFD.GPSInfo)[ExifTags.GPS.GPSLatitude] = (55.0, 45.0, 0.0)
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def _upload(data, name='photo.png'):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def _ref_count(app, filename):
+    from app.models import Upload
+
+    with app.app_context():
+        return Upload.query.filter_by(filename=filename).one().ref_count
+
+
+def test_same_file_is_stored_once(app, media):
+    data = _png()
+    with app.app_context():
+        first = save_uploaded_file(_upload(data))
+        second = save_uploaded_file(_upload(data, 'copy.png'))
+        db.session.commit()
+
+    assert first == second
+    assert sorted(path.name for path in media.iterdir()) == [first]
+    assert _ref_count(app, first) == 2
+
+
+def test_concurrent_first_uploads_of_same_file(app, media):
+    """Одновременные первые загрузки одного файла: одна строка uploads, ссылки складываются"""
+    data = _png((10, 20, 30))
+    barrier = threading.Barrier(THREADS)
+    filenames = []
+    errors = []
+
+    def upload():
+        try:
+            with app.app_context():
+                barrier.wait()
+                filenames.append(save_uploaded_file(_upload(data)))
+                db.session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upload) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(set(filenames)) == 1
+    assert _ref_count(app, filenames[0]) == THREADS
+
+
+def test_upload_without_metadata_gets_final_name(app, media):
+    with app.app_context():
+        filename = save_uploaded_file(_upload(_png((1, 2, 3))))
+        db.session.commit()
+    assert UPLOAD_NAME_RE.match(filename)
+
+
+@pytest.mark.parametrize('orientation', [1, 6])
+def test_metadata_is_stripped_by_worker(app, media, orientation):
+    """Файл по хешу отдаётся с Cache-Control: immutable - его содержимое должно совпадать с именем"""
+    from app.models import Product
+
+    data = _jpeg_with_gps(orientation)
+    product_id = create_product(app)
+    with app.app_context():
+        pending = save_uploaded_file(_upload(data, 'photo.jpg'))
+        db.session.get(Product, product_id).image_file = pending
+        db.session.commit()
+        # Запрос не декодирует изображение: файл сохранён как есть под временным именем
+        assert is_pending_upload(pending) and not UPLOAD_NAME_RE.match(pending)
+        assert (media / pending).read_bytes() == data
+
+        process_image(pending, 'products', product_id)
+        product = db.session.get(Product, product_id)
+        filename = product.image_file
+        assert product.image_variants
+
+    stored = (media / filename).read_bytes()
+    assert filename == f'{hashlib.sha256(stored).hexdigest()}.jpg'
+    with Image.open(media / filename) as image:
+        assert not image.getexif()
+        # Поворот по EXIF применён к пикселям
+        assert image.size == ((30, 40) if orientation == 6 else (40, 30))
+    assert _ref_count(app, filename) == 1
+    assert _ref_count(app, pending) == 0
+
+    with app.app_context():
+        assert delete_unreferenced(pending)
+    assert not (media / pending).exists()
+
+
+def test_about_image_is_stripped_by_worker(app, media):
+    from app.models import Content
+
+    with app.app_context():
+        pending = save_uploaded_file(_upload(_jpeg_with_gps(), 'photo.jpg'))
+        db.session.add(Content(key='about_image_test', title='Тест', content=pending,
+                               section='about', content_type='image'))
+        db.session.commit()
+
+        process_image(pending)
+        filename = Content.query.filter_by(key='about_image_test').one().content
+    assert UPLOAD_NAME_RE.match(filename)
+    with Image.open(media / filename) as image:
+        assert not image.getexif()
+
+
+def test_publish_skips_reference_changed_meanwhile(app, media):
+    """Изображение заменили, пока воркер очищал файл: новая ссылка не перезаписывается"""
+    from app.models import Product
+
+    product_id = create_product(app)
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        product.image_file = save_uploaded_file(_upload(_jpeg_with_gps(), 'photo.jpg'))
+        db.session.commit()
+        pending = product.image_file
+        db.session.execute(update(Product).where(Product.id == product_id).values(image_file='replaced.jpg'))
+        db.session.commit()
+
+        assert publish_upload(pending, [(product, 'image_file')]) is None
+        assert product.image_file == 'replaced.jpg'